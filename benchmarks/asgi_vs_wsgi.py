@@ -0,0 +1,157 @@
+"""
+gunicorn threads against uvicorn at 1000 concurrent connections
+
+    python -m benchmarks.asgi_vs_wsgi --connections 1000 --seconds 20
+
+Both servers run the same app against the same sqlite file, gunicorn
+with ``--workers`` gthread workers of ``--threads`` threads each and
+uvicorn with ``--workers`` processes serving ``idiet.tracking.asgi:app``.
+Every connection is kept alive and sends profile reads and food searches
+as fast as it gets answers, latency is measured per request and includes
+the time a request waits for a free thread. Needs uvicorn installed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import tempfile
+import time
+from urllib.parse import urlencode
+
+from benchmarks.common import FOOD_WORDS, summarize
+from benchmarks.suite import SECRET_KEY, load_foods, login_token
+from benchmarks.suite import start_gunicorn, start_server
+from idiet.tracking.core import create_app
+
+
+async def fetch(reader, writer, path, headers):
+    request = f"GET {path} HTTP/1.1\r\nHost: localhost\r\n{headers}\r\n"
+    writer.write(request.encode("latin-1"))
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("connection closed")
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return int(status_line.split()[1])
+
+
+async def connection(port, tokens, deadline, samples, errors, rng):
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        if writer is None:
+            try:
+                reader, writer = await asyncio.open_connection(
+                    "127.0.0.1", port)
+            except OSError:
+                errors["connect"] = errors.get("connect", 0) + 1
+                await asyncio.sleep(0.1)
+                continue
+        headers = f"Authorization: Bearer {rng.choice(tokens)}\r\n"
+        if rng.random() < 0.5:
+            path = "/api/user/profile"
+        else:
+            path = "/api/food/search?" + urlencode(
+                {"name": rng.choice(FOOD_WORDS)})
+        start = time.perf_counter()
+        try:
+            status = await fetch(reader, writer, path, headers)
+        except (OSError, ConnectionError, asyncio.IncompleteReadError,
+                ValueError):
+            errors["dropped"] = errors.get("dropped", 0) + 1
+            writer.close()
+            writer = None
+            continue
+        samples.append(time.perf_counter() - start)
+        if status != 202:
+            errors[status] = errors.get(status, 0) + 1
+    if writer is not None:
+        writer.close()
+
+
+async def load(port, tokens, connections, seconds):
+    samples = []
+    errors = {}
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        connection(port, tokens, deadline, samples, errors,
+                   random.Random(i))
+        for i in range(connections)
+    ))
+    return samples, errors, time.perf_counter() - start
+
+
+def raise_open_files_limit(connections):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = min(hard, max(soft, 2 * connections + 256))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--foods", type=int, default=50000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4,
+                        help="gunicorn threads per worker")
+    parser.add_argument("--asgi-threads", type=int, default=8,
+                        help="request threads per uvicorn worker")
+    args = parser.parse_args(argv)
+    raise_open_files_limit(args.connections)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = "sqlite:///" + os.path.join(tmp, "tracking.db")
+        load_foods(db_url, args.foods)
+        # users and tokens are shared by both servers through the database
+        app = create_app(config={"db": {"url": db_url}},
+                         secret_key=SECRET_KEY)
+        client = app.test_client()
+        tokens = []
+        for i in range(args.users):
+            credentials = {"username": f"user-{i}@example.com",
+                           "password": "password"}
+            client.post("/api/register", data=json.dumps(credentials),
+                        content_type="application/json")
+            tokens.append(login_token(app, credentials))
+        app.backend.engine.dispose()
+
+        servers = {
+            f"gunicorn {args.workers}x{args.threads} threads":
+                lambda: start_gunicorn(tmp, db_url, "pbkdf2:sha256",
+                                       args.workers, args.threads),
+            f"uvicorn {args.workers} workers":
+                lambda: start_server(
+                    tmp, db_url, "pbkdf2:sha256",
+                    lambda port: [
+                        "uvicorn", "--workers", str(args.workers),
+                        "--port", str(port), "--log-level", "warning",
+                        "--no-access-log", "idiet.tracking.asgi:app",
+                    ],
+                    env={"IDIET_TRACKING_THREADS": str(args.asgi_threads)}),
+        }
+        for name, start in servers.items():
+            server, port = start()
+            try:
+                samples, errors, elapsed = asyncio.run(
+                    load(port, tokens, args.connections, args.seconds))
+            finally:
+                server.terminate()
+                server.wait()
+            print(f"{summarize(name, samples)} "
+                  f"rps={len(samples) / elapsed:7.0f} errors={errors}",
+                  flush=True)
+
+
+if __name__ == "__main__":
+    main()
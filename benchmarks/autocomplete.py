@@ -0,0 +1,45 @@
+"""
+food name completion over a large catalog by prefix length
+
+    python -m benchmarks.autocomplete --foods 300000
+"""
+import argparse
+import random
+import time
+
+from benchmarks.common import FOOD_WORDS, fake_foods, measure, summarize
+from idiet.tracking.autocomplete import PrefixIndex
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--foods", type=int, default=300000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    foods = list(enumerate(fake_foods(args.foods)))
+    start = time.perf_counter()
+    index = PrefixIndex(foods)
+    print(f"index build: {time.perf_counter() - start:.2f}s "
+          f"for {len(index)} names")
+
+    rng = random.Random(1)
+    popularity = {
+        rng.randrange(args.foods): rng.randint(1, 1000)
+        for _ in range(args.foods // 10)
+    }
+    start = time.perf_counter()
+    index.set_popularity(popularity)
+    print(f"popularity refresh: {time.perf_counter() - start:.2f}s")
+
+    for length in (1, 2, 3, 4, 6):
+        calls = [
+            (rng.choice(FOOD_WORDS)[:length], 10)
+            for _ in range(args.queries)
+        ]
+        samples = measure(index.complete, calls)
+        print(summarize(f"prefix of {length} characters", samples))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+serving the food catalog from the food table or a mapped catalog file
+
+    python -m benchmarks.catalog --foods 300000
+
+Starts fresh interpreters that load the food search, nutrient and
+autocompletion indexes either from the food table or from a catalog file
+and reports the load time, the process's private memory (anonymous
+resident memory, linux only) and the time queries take. Pages of the
+mapped file are shared by every process of the host and aren't counted.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import FOOD_WORDS
+
+
+def anonymous_memory():
+    with open("/proc/self/status") as fd:
+        for line in fd:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def load(db_url, catalog_path):
+    # runs in a fresh interpreter
+    from idiet.tracking.backend.db import SqlAlchemyBackend
+    from idiet.tracking.backend.db import engine_from_config
+
+    backend = SqlAlchemyBackend(engine_from_config({"url": db_url}),
+                                catalog_path=catalog_path)
+    before = anonymous_memory()
+    start = time.perf_counter()
+    backend.food_catalog_version()
+    backend.food_autocomplete("chi")
+    elapsed = time.perf_counter() - start
+    memory = anonymous_memory() - before
+
+    start = time.perf_counter()
+    for word in FOOD_WORDS:
+        backend.food_page_by_name(word, 10)
+        backend.food_page_by_nutrients(group=None, sort="protein",
+                                       max_results=10)
+        backend.food_autocomplete(word[:4])
+    per_word = (time.perf_counter() - start) / len(FOOD_WORDS)
+    print(json.dumps({"load": elapsed, "memory": memory,
+                      "queries": per_word}))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--foods", type=int, default=300000)
+    parser.add_argument("--load", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.load:
+        db_url, catalog_path = args.load
+        load(db_url, catalog_path or None)
+        return
+
+    # not imported by the --load processes, whose memory is measured
+    from benchmarks.suite import load_foods
+    from idiet.tracking.backend.db import SqlAlchemyBackend
+    from idiet.tracking.backend.db import engine_from_config
+    from idiet.tracking.catalog import write_catalog
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_url = f"sqlite:///{os.path.join(directory, 'catalog.db')}"
+        load_foods(db_url, args.foods)
+        catalog_path = os.path.join(directory, "catalog.bin")
+        start = time.perf_counter()
+        backend = SqlAlchemyBackend(engine_from_config({"url": db_url}))
+        write_catalog(catalog_path, backend.food_records())
+        print(f"catalog written in {time.perf_counter() - start:.1f}s, "
+              f"{os.path.getsize(catalog_path) / 2 ** 20:.1f}MB")
+
+        for name, path in (("food table", ""), ("catalog", catalog_path)):
+            result = subprocess.run(
+                [sys.executable, "-m", "benchmarks.catalog", "--load",
+                 db_url, path],
+                stdout=subprocess.PIPE, universal_newlines=True, check=True)
+            loaded = json.loads(result.stdout.splitlines()[-1])
+            print(f"{name:<10}: loaded in {loaded['load'] * 1000:7.0f}ms, "
+                  f"{loaded['memory'] / 2 ** 20:6.1f}MB private memory, "
+                  f"{loaded['queries'] * 1000:.2f}ms per search, nutrient "
+                  f"query and autocompletion")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+helpers shared by the benchmark scripts
+
+The benchmarks are plain scripts, run them from the repository root
+
+    python -m benchmarks.food_search
+"""
+import random
+import statistics
+import time
+
+
+FOOD_WORDS = (
+    "chicken", "beef", "pork", "turkey", "salmon", "tuna", "egg", "milk",
+    "cheese", "yogurt", "butter", "bread", "rice", "pasta", "oats",
+    "apple", "banana", "orange", "grape", "berry", "tomato", "potato",
+    "carrot", "onion", "garlic", "pepper", "spinach", "lettuce", "bean",
+    "lentil", "almond", "peanut", "walnut", "cashew", "soup", "salad",
+    "sandwich", "burger", "pizza", "taco", "cake", "cookie", "cereal",
+)
+FOOD_STYLES = (
+    "raw", "roasted", "fried", "boiled", "baked", "grilled", "steamed",
+    "canned", "frozen", "dried", "smoked", "breaded", "with skin",
+    "skinless", "lowfat", "nonfat", "whole", "sliced", "diced", "organic",
+)
+FOOD_GROUPS = (
+    "Poultry Products", "Beef Products", "Dairy and Egg Products",
+    "Fruits and Fruit Juices", "Vegetables and Vegetable Products",
+    "Legumes and Legume Products", "Nut and Seed Products",
+    "Cereal Grains and Pasta", "Baked Products", "Soups, Sauces, and Gravies",
+)
+
+
+def fake_foods(n, seed=0):
+    """
+    yield ``n`` dicts in the ``FoodFact.from_dict`` format
+    """
+    rng = random.Random(seed)
+    for _ in range(n):
+        words = rng.sample(FOOD_WORDS, rng.randint(1, 2))
+        styles = rng.sample(FOOD_STYLES, rng.randint(0, 3))
+        name = ", ".join([" ".join(words)] + styles)
+        yield {
+            "name": name,
+            "group": rng.choice(FOOD_GROUPS),
+            "fat_in_grams": round(rng.uniform(0, 40), 2),
+            "protein_in_grams": round(rng.uniform(0, 40), 2),
+            "carbohydrates_in_grams": round(rng.uniform(0, 80), 2),
+            "calories": round(rng.uniform(10, 900), 1),
+        }
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(fn, args_list, repeat=1):
+    """
+    call ``fn(*args)`` for every args tuple and return the per call
+    latencies in seconds
+    """
+    samples = []
+    for _ in range(repeat):
+        for args in args_list:
+            start = time.perf_counter()
+            fn(*args)
+            samples.append(time.perf_counter() - start)
+    return samples
+
+
+def summarize(name, samples):
+    us = [s * 1e6 for s in samples]
+    return (
+        f"{name:<32} n={len(us):<7} mean={statistics.mean(us):9.1f}us "
+        f"p50={percentile(us, 50):9.1f}us p95={percentile(us, 95):9.1f}us "
+        f"p99={percentile(us, 99):9.1f}us"
+    )
@@ -0,0 +1,61 @@
+"""
+exporting meal histories of growing size
+
+    python -m benchmarks.export --meals 10000 100000
+
+Streams every history through the NDJSON and CSV encoders, reporting the
+throughput and the peak memory allocated while streaming, which should
+stay flat as the history grows.
+"""
+import argparse
+from datetime import datetime, timedelta
+import os
+import tempfile
+import time
+import tracemalloc
+
+from sqlalchemy import create_engine
+
+from idiet.tracking.backend.db import SqlAlchemyBackend
+from idiet.tracking.export import export_meals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--meals", type=int, nargs="+",
+                        default=[10000, 100000])
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite:///{os.path.join(directory, 'export.db')}"
+        backend = SqlAlchemyBackend(create_engine(url)).init()
+        user = backend.add_user("user@example.com", "password").snapshot()
+        logged = 0
+        for n_meals in sorted(args.meals):
+            first = datetime(2020, 1, 1)
+            for start in range(logged, n_meals, 1000):
+                backend.user_meals_add(user, [
+                    {"food_id": None, "name": f"meal {i}", "calories": 500,
+                     "logged_at": first + timedelta(minutes=i)}
+                    for i in range(start, min(start + 1000, n_meals))
+                ])
+            logged = n_meals
+            backend.close_session()
+
+            for export_format in ("ndjson", "csv"):
+                tracemalloc.start()
+                start = time.perf_counter()
+                size = sum(len(chunk) for chunk in export_meals(
+                    backend.user_meals_export(user), export_format))
+                elapsed = time.perf_counter() - start
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                backend.close_session()
+                print(f"{export_format} {n_meals} meals: "
+                      f"{n_meals / elapsed:,.0f} meals/s, "
+                      f"{size / 2 ** 20:.1f}MB sent, "
+                      f"peak {peak / 2 ** 20:.2f}MB allocated")
+
+
+if __name__ == "__main__":
+    main()
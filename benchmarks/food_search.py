@@ -0,0 +1,68 @@
+"""
+compare the trigram food index against the exact match query it replaced
+
+    python -m benchmarks.food_search --foods 300000
+"""
+import argparse
+import random
+import time
+
+from sqlalchemy import create_engine
+
+from benchmarks.common import fake_foods, measure, summarize
+from idiet.tracking.backend.db import SqlAlchemyBackend, FoodFact
+
+
+QUERIES = (
+    "chicken", "chiken", "roasted beef", "banana", "peanut butter",
+    "salmon smoked", "tomato soup", "yogrt", "pizza", "lentil salad",
+)
+
+
+def exact_match(backend, name, max_results):
+    session = backend._create_session()
+    foods = session.query(FoodFact).filter_by(foodname=name)
+    return [food.to_dict() for food in foods.limit(max_results)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--foods", type=int, default=300000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--max-results", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    backend = SqlAlchemyBackend(create_engine("sqlite://")).init()
+    backend.engine.execute(
+        FoodFact.__table__.insert(),
+        [
+            {
+                "foodname": food["name"],
+                "foodgroup": food["group"],
+                "fatg": food["fat_in_grams"],
+                "proteing": food["protein_in_grams"],
+                "carbohydrateg": food["carbohydrates_in_grams"],
+                "calories": food["calories"],
+            }
+            for food in fake_foods(args.foods)
+        ]
+    )
+
+    start = time.perf_counter()
+    backend.food_index_rebuild()
+    print(f"index build: {time.perf_counter() - start:.2f}s "
+          f"for {len(backend.food_index)} foods")
+
+    rng = random.Random(1)
+    calls = [
+        (rng.choice(QUERIES), args.max_results)
+        for _ in range(args.queries)
+    ]
+    exact = measure(lambda q, n: exact_match(backend, q, n), calls[:100])
+    print(summarize("exact match query (sqlite)", exact))
+    fuzzy = measure(backend.food_item_find_closest_match, calls)
+    print(summarize("trigram index", fuzzy))
+
+
+if __name__ == "__main__":
+    main()
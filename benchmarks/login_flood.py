@@ -0,0 +1,100 @@
+"""
+p99 latency of /api/hc while a flood of logins hashes passwords
+
+    python -m benchmarks.login_flood --clients 16 --seconds 10
+
+The app is served by a threaded werkzeug server in this process, the way
+a gunicorn gthread worker serves it. The run is repeated with hashing
+inline on the request threads and with hashing in a process pool.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+from benchmarks.common import summarize
+from idiet.tracking.core import create_app
+from idiet.tracking.encrypt import configure_hashing
+
+
+def request(port, method, path, body=None):
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    headers = {"Content-Type": "application/json"}
+    start = time.perf_counter()
+    connection.request(method, path, body and json.dumps(body), headers)
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    return response.status, time.perf_counter() - start
+
+
+def run(hashing, clients, seconds, db_url):
+    config = {"password-hashing": hashing, "db": {"url": db_url}}
+    app = create_app(config=config, secret_key="key")
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    port = server.server_port
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    user = {"username": "flood@example.com", "password": "password"}
+    request(port, "POST", "/api/register", user)
+    stop = threading.Event()
+    statuses = {}
+
+    def flood():
+        while not stop.is_set():
+            status, _ = request(port, "POST", "/api/login", user)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    threads = [threading.Thread(target=flood) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+
+    samples = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        samples.append(request(port, "GET", "/api/hc")[1])
+        time.sleep(0.005)
+
+    stop.set()
+    for thread in threads:
+        thread.join()
+    server.shutdown()
+    configure_hashing()
+    return samples, statuses
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--method", default="pbkdf2:sha256:150000")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--max-pending", type=int, default=8)
+    args = parser.parse_args(argv)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    runs = {
+        "inline hashing": {"method": args.method},
+        f"process pool ({args.workers} workers)": {
+            "method": args.method,
+            "workers": args.workers,
+            "max-pending": args.max_pending,
+        },
+    }
+    for name, hashing in runs.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            db_url = "sqlite:///" + os.path.join(tmp, "tracking.db")
+            samples, statuses = run(hashing, args.clients, args.seconds,
+                                    db_url)
+        print(summarize(f"/api/hc, {name}", samples))
+        print(f"{'':<32} login responses by status {statuses}")
+
+
+if __name__ == "__main__":
+    main()
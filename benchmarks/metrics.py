@@ -0,0 +1,61 @@
+"""
+reading a year of body metrics at every resolution
+
+    python -m benchmarks.metrics --samples-per-day 96
+
+Ingests a year of samples in request sized batches, then reads the whole
+year as daily and weekly buckets, a month as hourly buckets and a day of
+raw samples, counting the rows each read touches.
+"""
+import argparse
+from datetime import datetime, timedelta
+import random
+import time
+
+from sqlalchemy import create_engine, event
+
+from benchmarks.common import measure, summarize
+from idiet.tracking.backend.db import SqlAlchemyBackend
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--samples-per-day", type=int, default=96)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    backend = SqlAlchemyBackend(create_engine("sqlite://")).init()
+    user = backend.add_user("user@example.com", "password").snapshot()
+    rng = random.Random(0)
+    first = datetime(2020, 1, 1)
+    step = timedelta(days=1) / args.samples_per_day
+    samples = [
+        ("steps", first + i * step, float(rng.randint(0, 200)))
+        for i in range(366 * args.samples_per_day)
+    ]
+    start = time.perf_counter()
+    for i in range(0, len(samples), 1000):
+        backend.user_metrics_add(user, samples[i:i + 1000])
+    print(f"ingest: {time.perf_counter() - start:.2f}s "
+          f"for {len(samples)} samples")
+
+    reads = {
+        "year of days": (first, first + timedelta(days=366), "day"),
+        "year of weeks": (first, first + timedelta(days=366), "week"),
+        "month of hours": (first, first + timedelta(days=31), "hour"),
+        "day of samples": (first, first + timedelta(days=1), "raw"),
+    }
+    statements = []
+    event.listen(backend.engine, "before_cursor_execute",
+                 lambda *args: statements.append(args[2]))
+    for name, (start, end, resolution) in reads.items():
+        calls = [(user, "steps", start, end, resolution)] * args.repeat
+        del statements[:]
+        points = backend.user_metric_series(*calls[0])
+        print(summarize(f"{name} ({len(points)} points, "
+                        f"{len(statements)} queries)",
+                        measure(backend.user_metric_series, calls)))
+
+
+if __name__ == "__main__":
+    main()
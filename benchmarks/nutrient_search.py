@@ -0,0 +1,109 @@
+"""
+compare nutrient range queries on the numpy store with the same query
+in SQL, and deep pages through a cursor with OFFSET pages in SQL
+
+    python -m benchmarks.nutrient_search --foods 300000
+"""
+import argparse
+import random
+
+from sqlalchemy import create_engine
+
+from benchmarks.common import FOOD_GROUPS, fake_foods, measure, summarize
+from idiet.tracking.backend.db import SqlAlchemyBackend, FoodFact
+
+
+def sql_query(backend, group, min_protein, max_calories, max_results):
+    session = backend._create_session()
+    foods = session.query(FoodFact).filter(
+        FoodFact.foodgroup == group,
+        FoodFact.proteing >= min_protein,
+        FoodFact.calories <= max_calories,
+        FoodFact.calories > 0,
+    ).order_by(
+        (FoodFact.proteing / FoodFact.calories).desc(), FoodFact.foodid
+    ).limit(max_results)
+    return [food.to_dict() for food in foods]
+
+
+def store_query(backend, group, min_protein, max_calories, max_results):
+    return backend.food_items_by_nutrients(
+        group=group,
+        ranges={"protein": (min_protein, None),
+                "calories": (None, max_calories)},
+        sort="protein_per_calorie",
+        max_results=max_results,
+    )
+
+
+def sql_page(backend, page, page_size):
+    session = backend._create_session()
+    foods = session.query(FoodFact).order_by(
+        FoodFact.calories.desc(), FoodFact.foodid
+    ).offset(page * page_size).limit(page_size)
+    return [food.to_dict() for food in foods]
+
+
+def cursor_page(backend, after, page_size):
+    return backend.food_page_by_nutrients(
+        sort="calories", max_results=page_size, after=after)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--foods", type=int, default=300000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--max-results", type=int, default=10)
+    parser.add_argument("--deep-page", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    backend = SqlAlchemyBackend(create_engine("sqlite://")).init()
+    backend.engine.execute(
+        FoodFact.__table__.insert(),
+        [
+            {
+                "foodname": food["name"],
+                "foodgroup": food["group"],
+                "fatg": food["fat_in_grams"],
+                "proteing": food["protein_in_grams"],
+                "carbohydrateg": food["carbohydrates_in_grams"],
+                "calories": food["calories"],
+            }
+            for food in fake_foods(args.foods)
+        ]
+    )
+    backend.food_index_rebuild()
+
+    rng = random.Random(1)
+    calls = [
+        (rng.choice(FOOD_GROUPS), rng.randint(5, 30), rng.randint(100, 500),
+         args.max_results)
+        for _ in range(args.queries)
+    ]
+    for args_ in calls[:5]:
+        expected = sql_query(backend, *args_)
+        assert store_query(backend, *args_) == expected
+
+    sql = measure(lambda *a: sql_query(backend, *a), calls)
+    print(summarize("sqlalchemy query (sqlite)", sql))
+    store = measure(lambda *a: store_query(backend, *a), calls)
+    print(summarize("numpy nutrient store", store))
+
+    page_size = args.max_results
+    for page in (0, args.deep_page):
+        after = None
+        if page:
+            after = cursor_page(backend, None, page * page_size)[-1][0]
+        expected = sql_page(backend, page, page_size)
+        assert [record for _, record in cursor_page(
+            backend, after, page_size)] == expected
+        sql = measure(lambda: sql_page(backend, page, page_size),
+                      [()] * 20)
+        print(summarize(f"sql OFFSET page {page}", sql))
+        cursor = measure(lambda: cursor_page(backend, after, page_size),
+                         [()] * 20)
+        print(summarize(f"cursor page {page}", cursor))
+
+
+if __name__ == "__main__":
+    main()
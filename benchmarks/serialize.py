@@ -0,0 +1,61 @@
+"""
+encoding food search responses of 10, 100 and 1000 results
+
+    python -m benchmarks.serialize --repeat 200
+
+Compares ``flask.jsonify`` against the encoders of
+``idiet.tracking.serialize``, and the time to the first chunk of a
+streamed response against encoding it whole.
+"""
+import argparse
+
+from flask import jsonify
+
+from benchmarks.common import fake_foods, measure, summarize
+from idiet.tracking import serialize
+from idiet.tracking.core import create_app
+from idiet.tracking.timestamp import utcnow
+
+
+def payload(n_items):
+    items = list(fake_foods(n_items))
+    return {
+        "status": "success",
+        "message": f"{n_items} results found",
+        "num_results": n_items,
+        "ts": utcnow(),
+        "data": items,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[10, 100, 1000])
+    args = parser.parse_args(argv)
+
+    app = create_app(backend="memory", secret_key="key")
+    encoders = {"stdlib": serialize.stdlib_dumps}
+    if serialize.orjson_dumps is not None:
+        encoders["orjson"] = serialize.orjson_dumps
+
+    with app.app_context():
+        for n_items in args.sizes:
+            calls = [(payload(n_items),)] * args.repeat
+            print(summarize(f"jsonify {n_items}",
+                            measure(lambda d: jsonify(d).get_data(), calls)))
+            for name, dumps in encoders.items():
+                print(summarize(f"{name} {n_items}", measure(dumps, calls)))
+            print(summarize(
+                f"streamed first chunk {n_items}",
+                measure(lambda d: next(serialize.iter_json(d, "data")),
+                        calls)))
+            print(summarize(
+                f"streamed whole {n_items}",
+                measure(lambda d: b"".join(serialize.iter_json(d, "data")),
+                        calls)))
+
+
+if __name__ == "__main__":
+    main()
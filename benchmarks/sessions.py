@@ -0,0 +1,73 @@
+"""
+load test showing connections and memory stay flat across requests
+
+    python -m benchmarks.sessions --requests 100000
+
+Drives the app in process through its WSGI interface against a file
+backed sqlite database and prints the number of open DBAPI connections,
+the connections checked out of the pool and the process RSS every
+``--every`` requests.
+"""
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+import webtest
+
+from idiet.tracking.core import create_app
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as fd:
+            pages = int(fd.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        # peak rather than current RSS, still shows growth
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--every", type=int, default=10000)
+    parser.add_argument("--pool-size", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config = {
+            "db": {
+                "url": f"sqlite:///{tmp}/tracking.db",
+                "pool-size": args.pool_size,
+                "max-overflow": 0,
+            }
+        }
+        app = create_app(config=config, secret_key="key")
+        pool = app.backend.engine.pool
+        client = webtest.TestApp(app)
+        user = {"username": "load@example.com", "password": "password"}
+        client.post_json("/api/register", user)
+        token = client.post_json("/api/login", user).json["token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        profile = {"name": "load", "gender": "other"}
+
+        start = time.perf_counter()
+        for i in range(1, args.requests + 1):
+            if i % 10 == 0:
+                client.post_json("/api/user/profile", profile,
+                                 headers=headers)
+            else:
+                client.get("/api/user/profile", headers=headers)
+            if i % args.every == 0:
+                elapsed = time.perf_counter() - start
+                print(f"requests={i:<8} "
+                      f"connections={pool.checkedin() + pool.checkedout():<3} "
+                      f"checked_out={pool.checkedout():<3} "
+                      f"rss={rss_mb():7.1f}MB "
+                      f"rate={i / elapsed:7.0f}/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+server process start up, with and without warming up
+
+    python -m benchmarks.startup --foods 100000
+
+Lists the slowest imports of ``idiet.tracking.wsgi`` from ``python -X
+importtime``, then starts fresh interpreters serving a catalog of
+``--foods`` foods and reports how long creating the app took, and the
+first food search and autocompletion against the median of the
+following ones. Without warming up the first requests build the indexes.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import FOOD_WORDS
+
+
+def import_times(top):
+    env = dict(os.environ, IDIET_TRACKING_DB_URL="sqlite://")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c",
+         "import idiet.tracking.wsgi"],
+        env=env, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    modules = []
+    for line in result.stderr.splitlines()[1:]:
+        own, cumulative, name = line.split("|")
+        own = own.rsplit(":", 1)[1]
+        modules.append((int(cumulative), int(own), name.strip()))
+    modules.sort(reverse=True)
+    print(f"import idiet.tracking.wsgi: {modules[0][0] / 1000:.1f}ms, "
+          f"numpy imported: {any(m[2] == 'numpy' for m in modules)}")
+    for cumulative, own, name in modules[1:top + 1]:
+        print(f"  {name:<40} {cumulative / 1000:7.1f}ms "
+              f"(own {own / 1000:.1f}ms)")
+
+
+def serve(db_url, warm_up, requests):
+    # runs in a fresh interpreter, the imports count as start up
+    start = time.perf_counter()
+    from idiet.tracking.core import create_app
+    app = create_app(config={
+        "db": {"url": db_url, "pool-size": 4},
+        "password-hashing": {"method": "pbkdf2:sha256:1000"},
+        "startup": {"warm-up": warm_up},
+    }, secret_key="benchmark")
+    started = time.perf_counter() - start
+
+    client = app.test_client()
+    credentials = {"username": "user@example.com", "password": "password"}
+    client.post("/api/register", json=credentials)
+    token = client.post("/api/login", json=credentials).get_json()["token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    timings = {"start": started}
+    for name, url in (("search", "/api/food/search?name={}"),
+                      ("autocomplete", "/api/food/autocomplete?prefix={}")):
+        latencies = []
+        for i in range(requests):
+            # a different query each time, past the response cache
+            word = FOOD_WORDS[i % len(FOOD_WORDS)]
+            if name == "autocomplete":
+                word = word[:3]
+            start = time.perf_counter()
+            response = client.get(url.format(word), headers=headers)
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code in (200, 202)
+        timings[name] = (latencies[0], statistics.median(latencies[1:]))
+    print(json.dumps(timings))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--foods", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    parser.add_argument("--warm-up", action="store_true",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.serve:
+        serve(args.serve, args.warm_up, args.requests)
+        return
+
+    # not imported by the --serve processes, whose start up is timed
+    from benchmarks.suite import load_foods
+
+    import_times(args.top)
+    with tempfile.TemporaryDirectory() as directory:
+        db_url = f"sqlite:///{os.path.join(directory, 'startup.db')}"
+        load_foods(db_url, args.foods)
+        for warm_up in (False, True):
+            command = [sys.executable, "-m", "benchmarks.startup",
+                       "--serve", db_url, "--requests", str(args.requests)]
+            if warm_up:
+                command.append("--warm-up")
+            result = subprocess.run(command, stdout=subprocess.PIPE,
+                                    universal_newlines=True, check=True)
+            timings = json.loads(result.stdout.splitlines()[-1])
+            print(f"{'warm up' if warm_up else 'cold'}: "
+                  f"app created in {timings['start'] * 1000:.0f}ms")
+            for name in ("search", "autocomplete"):
+                first, median = timings[name]
+                print(f"  {name:<12} first {first * 1000:8.1f}ms, "
+                      f"then median {median * 1000:6.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
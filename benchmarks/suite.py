@@ -0,0 +1,447 @@
+"""
+throughput and latency of every api endpoint, with regression checks
+
+    python -m benchmarks.suite --target wsgi --save baseline.json
+    python -m benchmarks.suite --target wsgi --compare baseline.json
+    python -m benchmarks.suite --target gunicorn --workers 4 --concurrency 8
+
+``--target wsgi`` drives ``create_app()`` through its WSGI interface in
+this process, ``--target gunicorn`` starts gunicorn on a free local port
+and drives it over HTTP with keep alive connections. Both run against a
+fresh sqlite file loaded with ``--foods`` fake foods and ``--users``
+registered users.
+
+Every scenario reports throughput and p50/p95/p99 latency. ``--save``
+writes the results to a JSON baseline. ``--compare`` reads one and exits
+with status 1 when a latency percentile grew, or the throughput dropped,
+by more than the threshold. The threshold is ``--threshold`` or the one
+saved in the baseline (0.25, i.e. 25%, by default).
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+
+from benchmarks.common import FOOD_STYLES, FOOD_WORDS, fake_foods
+from benchmarks.common import percentile, summarize
+from idiet.tracking.backend.db import SqlAlchemyBackend, engine_from_config
+from idiet.tracking.core import create_app
+from idiet.tracking.importer import Importer, validate
+
+
+SECRET_KEY = "benchmark"
+DEFAULT_THRESHOLD = 0.25
+
+
+class Scenario:
+    """
+    a stream of requests against one endpoint
+
+    ``make_request(i)`` returns the ``(method, path, body, headers)`` of
+    the i-th request, a response with a status outside ``expected``
+    counts as an error.
+    """
+
+    def __init__(self, name, make_request, expected=(200,)):
+        self.name = name
+        self.make_request = make_request
+        self.expected = expected
+
+
+class WSGIClient:
+    """
+    calls the app in process through the WSGI interface
+    """
+
+    def __init__(self, app):
+        self.client = Client(app, Response)
+
+    def request(self, method, path, body=None, headers=None):
+        response = self.client.open(
+            path, method=method, headers=headers,
+            data=json.dumps(body) if body is not None else None,
+            content_type="application/json")
+        response.get_data()
+        return response.status_code
+
+
+class HTTPClient:
+    """
+    one keep alive connection per thread to a server on localhost
+    """
+
+    def __init__(self, port):
+        self.port = port
+        self._local = threading.local()
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {}, **{"Content-Type": "application/json"})
+        data = json.dumps(body) if body is not None else None
+        for attempt in range(2):
+            connection = getattr(self._local, "connection", None)
+            if connection is None:
+                connection = http.client.HTTPConnection("127.0.0.1",
+                                                        self.port)
+                self._local.connection = connection
+            try:
+                connection.request(method, path, data, headers)
+                response = connection.getresponse()
+                response.read()
+                return response.status
+            except (http.client.HTTPException, OSError):
+                # the server closed an idle keep alive connection
+                connection.close()
+                self._local.connection = None
+                if attempt:
+                    raise
+
+
+def run_scenario(client, scenario, requests, concurrency, warmup):
+    """
+    send ``requests`` requests from ``concurrency`` threads, returns the
+    latencies in seconds, the number of errors and the elapsed seconds
+    """
+    for i in range(warmup):
+        client.request(*scenario.make_request(i))
+    counter = itertools.count(warmup)
+    samples = []
+    errors = []
+
+    def worker():
+        local_samples = []
+        local_errors = 0
+        for _ in range(requests // concurrency):
+            args = scenario.make_request(next(counter))
+            start = time.perf_counter()
+            try:
+                status = client.request(*args)
+            except (http.client.HTTPException, OSError):
+                status = None
+            local_samples.append(time.perf_counter() - start)
+            if status not in scenario.expected:
+                local_errors += 1
+        samples.extend(local_samples)
+        errors.append(local_errors)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, sum(errors), time.perf_counter() - start
+
+
+def scenarios(users, seed=0):
+    """
+    the benchmarked requests, ``users`` is a list of
+    ``(credentials, headers)`` of registered, logged in users
+    """
+    rng = random.Random(seed)
+    run = rng.getrandbits(32)
+
+    def user(i):
+        return users[i % len(users)]
+
+    def search_query(i):
+        words = rng.sample(FOOD_WORDS, rng.randint(1, 2))
+        if rng.random() < 0.2:
+            # a typo, dropping one letter of the first word
+            word = words[0]
+            cut = rng.randrange(len(word))
+            words[0] = word[:cut] + word[cut + 1:]
+        if rng.random() < 0.5:
+            words.append(rng.choice(FOOD_STYLES))
+        return " ".join(words)
+
+    return [
+        Scenario("hc", lambda i: ("GET", "/api/hc", None, None)),
+        Scenario(
+            "register",
+            lambda i: ("POST", "/api/register", {
+                "username": f"bench-{run}-{i}@example.com",
+                "password": "password",
+            }, None),
+            expected=(201,),
+        ),
+        Scenario(
+            "login",
+            lambda i: ("POST", "/api/login", user(i)[0], None),
+            expected=(202,),
+        ),
+        Scenario(
+            "profile GET",
+            lambda i: ("GET", "/api/user/profile", None, user(i)[1]),
+            expected=(202,),
+        ),
+        Scenario(
+            "profile POST",
+            lambda i: ("POST", "/api/user/profile", {
+                "name": f"user {i}",
+                "gender": rng.choice(("male", "female", "other")),
+            }, user(i)[1]),
+            expected=(202,),
+        ),
+        Scenario(
+            "food search",
+            lambda i: ("GET", "/api/food/search?" + urlencode({
+                "name": search_query(i), "max_results": 10,
+            }), None, user(i)[1]),
+            expected=(202,),
+        ),
+        Scenario(
+            "food search nutrients",
+            lambda i: ("GET", "/api/food/search?mode=nutrients"
+                       f"&protein_min={rng.randint(0, 30)}"
+                       "&sort=protein_per_calorie&max_results=10",
+                       None, user(i)[1]),
+            expected=(202,),
+        ),
+        Scenario(
+            "food autocomplete",
+            lambda i: ("GET", "/api/food/autocomplete?" + urlencode({
+                "prefix": rng.choice(FOOD_WORDS)[:rng.randint(1, 4)],
+            }), None, user(i)[1]),
+            expected=(200,),
+        ),
+    ]
+
+
+def load_foods(db_url, n):
+    engine = engine_from_config({"url": db_url})
+    SqlAlchemyBackend(engine).init()
+    Importer(engine, out=open(os.devnull, "w")).run(
+        validate(food) for food in fake_foods(n))
+    engine.dispose()
+
+
+def register_users(client, n):
+    users = []
+    for i in range(n):
+        credentials = {
+            "username": f"user-{i}@example.com",
+            "password": "password",
+        }
+        client.request("POST", "/api/register", credentials)
+        users.append(credentials)
+    return users
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(server, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and server.poll() is None:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port,
+                                                    timeout=1)
+            connection.request("GET", "/api/hc")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server did not start on port {port}")
+
+
+def start_server(tmp, db_url, hash_method, command, env=None):
+    """
+    start a server process, ``command(port)`` returns its arguments
+    """
+    config = os.path.join(tmp, "tracking.toml")
+    with open(config, "w") as fd:
+        fd.write(f'[app]\nsecret-key = "{SECRET_KEY}"\n\n'
+                 f'[db]\nurl = "{db_url}"\n\n'
+                 f'[password-hashing]\nmethod = "{hash_method}"\n')
+    port = free_port()
+    env = dict(os.environ, IDIET_TRACKING_CONFIG=config,
+               IDIET_SECRET_KEY=SECRET_KEY, **(env or {}))
+    env.pop("IDIET_TRACKING_DB_URL", None)
+    server = subprocess.Popen([sys.executable, "-m"] + command(port),
+                              env=env)
+    try:
+        wait_for(server, port)
+    except RuntimeError:
+        server.terminate()
+        raise
+    return server, port
+
+
+def start_gunicorn(tmp, db_url, hash_method, workers, threads):
+    return start_server(tmp, db_url, hash_method, lambda port: [
+        "gunicorn", f"--workers={workers}", f"--threads={threads}",
+        f"--bind=127.0.0.1:{port}", "--log-level=warning",
+        "idiet.tracking.wsgi:app",
+    ])
+
+
+def login_token(port_or_app, credentials):
+    """
+    log a user in and return their token, over HTTP for a port and through
+    WSGI for an app
+    """
+    body = json.dumps(credentials)
+    headers = {"Content-Type": "application/json"}
+    if isinstance(port_or_app, int):
+        connection = http.client.HTTPConnection("127.0.0.1", port_or_app)
+        connection.request("POST", "/api/login", body, headers)
+        data = connection.getresponse().read()
+        connection.close()
+    else:
+        response = Client(port_or_app, Response).post(
+            "/api/login", data=body, headers=headers)
+        data = response.get_data()
+    return json.loads(data)["token"]
+
+
+def result(samples, errors, elapsed):
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "throughput": len(samples) / elapsed,
+        "p50": percentile(samples, 50) * 1e3,
+        "p95": percentile(samples, 95) * 1e3,
+        "p99": percentile(samples, 99) * 1e3,
+    }
+
+
+def compare(baseline, results, threshold, min_delta_ms):
+    """
+    regressions of ``results`` against ``baseline`` as messages, latencies
+    count only when they also grew by more than ``min_delta_ms``
+    """
+    regressions = []
+    for name, base in baseline["results"].items():
+        current = results.get(name)
+        if current is None:
+            continue
+        for key in ("p50", "p95", "p99"):
+            limit = max(base[key] * (1 + threshold), base[key] + min_delta_ms)
+            if current[key] > limit:
+                regressions.append(
+                    f"{name}: {key} {current[key]:.2f}ms, baseline "
+                    f"{base[key]:.2f}ms")
+        if current["errors"] > base["errors"]:
+            regressions.append(
+                f"{name}: {current['errors']} errors, baseline "
+                f"{base['errors']}")
+        if current["throughput"] < base["throughput"] * (1 - threshold):
+            regressions.append(
+                f"{name}: throughput {current['throughput']:.0f}/s, "
+                f"baseline {base['throughput']:.0f}/s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--target", choices=("wsgi", "gunicorn"),
+                        default="wsgi")
+    parser.add_argument("--requests", type=int, default=2000,
+                        help="requests per scenario")
+    parser.add_argument("--login-requests", type=int, default=200,
+                        help="requests for register and login, which hash "
+                             "a password each")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--foods", type=int, default=50000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--hash-method", default="pbkdf2:sha256")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--only", action="append",
+                        help="run only this scenario, can be repeated")
+    parser.add_argument("--save", metavar="JSON")
+    parser.add_argument("--compare", metavar="JSON")
+    parser.add_argument("--threshold", type=float)
+    parser.add_argument("--min-delta-ms", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = "sqlite:///" + os.path.join(tmp, "tracking.db")
+        print(f"loading {args.foods} foods", flush=True)
+        load_foods(db_url, args.foods)
+
+        server = None
+        if args.target == "gunicorn":
+            server, port = start_gunicorn(tmp, db_url, args.hash_method,
+                                          args.workers, args.threads)
+            client = HTTPClient(port)
+            login_target = port
+        else:
+            config = {
+                "db": {"url": db_url},
+                "password-hashing": {"method": args.hash_method},
+            }
+            app = create_app(config=config, secret_key=SECRET_KEY)
+            client = WSGIClient(app)
+            login_target = app
+        try:
+            print(f"registering {args.users} users", flush=True)
+            users = []
+            for credentials in register_users(client, args.users):
+                token = login_token(login_target, credentials)
+                users.append(
+                    (credentials, {"Authorization": f"Bearer {token}"}))
+            for scenario in scenarios(users):
+                if args.only and scenario.name not in args.only:
+                    continue
+                requests = args.requests
+                if scenario.name in ("register", "login"):
+                    requests = args.login_requests
+                samples, errors, elapsed = run_scenario(
+                    client, scenario, requests, args.concurrency,
+                    args.warmup)
+                results[scenario.name] = result(samples, errors, elapsed)
+                print(f"{summarize(scenario.name, samples)} "
+                      f"rps={len(samples) / elapsed:8.0f} errors={errors}",
+                      flush=True)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    threshold = args.threshold
+    status = 0
+    if args.compare:
+        with open(args.compare) as fd:
+            baseline = json.load(fd)
+        if threshold is None:
+            threshold = baseline.get("threshold", DEFAULT_THRESHOLD)
+        regressions = compare(baseline, results, threshold,
+                              args.min_delta_ms)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            status = 1
+        else:
+            print(f"no regression over {threshold:.0%} of {args.compare}")
+    if args.save:
+        with open(args.save, "w") as fd:
+            json.dump({
+                "target": args.target,
+                "threshold": (threshold if threshold is not None
+                              else DEFAULT_THRESHOLD),
+                "results": results,
+            }, fd, indent=2, sort_keys=True)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,164 @@
-from flask import current_app, g, request, make_response, jsonify
+import base64
+from datetime import timedelta
+import functools
+import hashlib
+import json
+import math
+
+from flask import current_app, g, request
 from flask.views import MethodView
 
+from idiet.tracking.autocomplete import PrefixIndex
+from idiet.tracking.backend.core import VersionConflict
 from idiet.tracking.core import api, token_auth
-from idiet.tracking.timestamp import utcnow
+from idiet.tracking.encrypt import HasherBusy
+from idiet.tracking.export import MIMETYPES as EXPORT_MIMETYPES
+from idiet.tracking.export import export_meals
+from idiet.tracking.serialize import json_response
+from idiet.tracking.timeseries import METRICS, RESOLUTIONS
+from idiet.tracking.timestamp import utcnow, parse
+
+
+MAX_MEALS_PER_REQUEST = 1000
+MAX_HISTORY_RESULTS = 1000
+MAX_NUTRITION_DAYS = 366
+# food searches with more results are encoded while they're sent
+STREAM_SEARCH_RESULTS = 500
+MAX_SEARCH_RESULTS = 1000
+MAX_PROFILES_PER_REQUEST = 1000
+MAX_SAMPLES_PER_REQUEST = 1000
+MAX_METRIC_DAYS = 366
+# raw samples are read for shorter ranges than buckets
+MAX_RAW_METRIC_DAYS = 31
+# metric series with more points are encoded while they're sent
+STREAM_METRIC_POINTS = 500
+MEAL_NUMBERS = (
+    "servings",
+    "fat_in_grams",
+    "carbs_in_grams",
+    "protein_in_grams",
+    "calories",
+)
+
+
+def failed(message, status=400):
+    response = {
+        "status": "failed",
+        "message": message
+    }
+    return json_response(response, status)
+
+
+def cache_validators(response, etag):
+    """
+    set the ETag of a response of an authenticated endpoint, clients
+    revalidate with If-None-Match before every reuse
+    """
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Authorization")
+    return response
+
+
+def not_modified(etag):
+    """
+    a 304 response when the request's If-None-Match matches ``etag``,
+    otherwise None
+    """
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    return cache_validators(current_app.response_class(status=304), etag)
+
+
+def profile_etag(user, version):
+    return f"profile-{user.id}-{version}"
+
+
+def if_match_version(user):
+    """
+    the profile version of the request's If-Match, None without one or
+    with ``*``, -1 when it has no ETag of the user's profile
+    """
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    prefix = profile_etag(user, "")
+    for etag in request.if_match:
+        if etag.startswith(prefix) and etag[len(prefix):].isdigit():
+            return int(etag[len(prefix):])
+    return -1
+
+
+def admin_required(view):
+    """
+    answer 403 unless the authenticated user is one of the ``admins``
+    of the app config
+    """
+    @functools.wraps(view)
+    def admin_view(*args, **kwargs):
+        if g.user.name not in current_app.app_config.get("admins", ()):
+            return failed("Forbidden. Only admins can do this", 403)
+        return view(*args, **kwargs)
+    return admin_view
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def parse_meal(data):
+    """
+    validate a meal posted by a client, raises ValueError when invalid
+    """
+    if not isinstance(data, dict):
+        raise ValueError("each meal must be an object")
+    food_id = data.get("food_id")
+    if food_id is None and not data.get("name"):
+        raise ValueError("each meal needs a 'food_id' or a 'name'")
+    if food_id is not None and (
+            not isinstance(food_id, int) or isinstance(food_id, bool)):
+        raise ValueError("'food_id' must be an integer")
+    meal = {"food_id": food_id, "name": data.get("name")}
+    for key in MEAL_NUMBERS:
+        value = data.get(key)
+        if value is not None and not is_number(value):
+            raise ValueError(f"'{key}' must be a number")
+        # negative servings or nutrients would subtract from daily totals
+        if value is not None and not (math.isfinite(value) and value >= 0):
+            raise ValueError(f"'{key}' must be a finite number >= 0")
+        meal[key] = value
+    if meal["servings"] is None:
+        meal["servings"] = 1
+    logged_at = data.get("logged_at")
+    meal["logged_at"] = parse(logged_at) if logged_at else utcnow()
+    return meal
+
+
+def throttled(username=None):
+    """
+    a 429 response when the client address or ``username`` ran out of
+    register and login attempts, otherwise None. Checked before anything
+    touches the database or hashes a password
+    """
+    limits = current_app.rate_limits
+    if limits is None:
+        return None
+    retry_after = limits.retry_after(request.remote_addr, username)
+    if not retry_after:
+        return None
+    response = failed("Too many attempts, retry later", 429)
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+@api.errorhandler(HasherBusy)
+def hasher_busy(error):
+    response = {
+        "status": "failed",
+        "message": "Server busy, retry later"
+    }
+    response = json_response(response, 503)
+    response.headers["Retry-After"] = "1"
+    return response
 
 
 class RegisterView(MethodView):
@@ -13,21 +169,26 @@ class RegisterView(MethodView):
         request_json = request.get_json()
         uname = request_json["username"]
         password = request_json["password"]
+        response = throttled()
+        if response is not None:
+            return response
 
-        user = backend.get_user(uname)
-        if not user:
+        user = None
+        if backend.user_credentials(uname) is None:
+            # None again if another request registered the name meanwhile
             user = backend.add_user(uname, password)
+        if user:
             response = {
                 "status": "success",
                 "message": "create new user",
                 "timestamp": str(user.profile.member_since)
             }
-            return make_response(jsonify(response), 201)
+            return json_response(response, 201)
         response = {
             "status": "failed",
             "message": "user already exists",
         }
-        return make_response(jsonify(response), 302)
+        return json_response(response, 302)
 
 
 class LoginView(MethodView):
@@ -39,38 +200,79 @@ class LoginView(MethodView):
         request_json = request.get_json()
         uname = request_json["username"]
         password = request_json["password"]
+        response = throttled(uname)
+        if response is not None:
+            return response
 
-        if backend.user_exists(uname):
-            user = backend.get_user(uname)
-            if user.validate(password):
-                token = user.generate_token(secret_key)
+        credentials = backend.user_credentials(uname)
+        if credentials is not None:
+            if credentials.validate(password):
+                token = backend.user_generate_token(credentials, secret_key)
                 response = {
                     "status": "success",
                     "message": "created user auth token",
                     "expires_on": str(token.expires_on),
                     "token": token.to_text()
                 }
-                return make_response(jsonify(response), 202)
+                return json_response(response, 202)
             else:
                 response = {
                     "status": "failed",
                     "message": "Could not authenticate user",
                 }
-                return make_response(jsonify(response), 401)
+                return json_response(response, 401)
         else:
             response = {
                 "status": "failed",
                 "message": "user does not exist"
             }
-            return make_response(jsonify(response), 403)
+            return json_response(response, 403)
+
+
+class LogoutView(MethodView):
+
+    @token_auth.login_required
+    def post(self):
+        backend = current_app.backend
+        backend.token_revoke(g.token, current_app.secret_key)
+        response = {
+            "status": "success",
+            "message": "logged out"
+        }
+        return json_response(response, 200)
+
+
+@api.route("/api/logout/all", methods=["POST"])
+@token_auth.login_required
+def logout_all():
+    """
+    revoke every token of the user, logging out all their sessions
+    """
+    revoked = current_app.backend.user_tokens_revoke(g.user)
+    response = {
+        "status": "success",
+        "message": f"revoked {revoked} tokens",
+        "num_revoked": revoked
+    }
+    return json_response(response, 200)
 
 
 class UserProfileView(MethodView):
 
     @token_auth.login_required
     def get(self):
+        """
+        the profile, with an ETag of its version. A request whose
+        If-None-Match has the current one gets a 304 without the profile
+        being read
+        """
         backend = current_app.backend
 
+        version = backend.user_profile_version(g.user)
+        etag = profile_etag(g.user, version)
+        response = not_modified(etag)
+        if response is not None:
+            return response
         profile = backend.user_profile_get(g.user)
         data = profile.to_dict()
         response = {
@@ -78,58 +280,561 @@ class UserProfileView(MethodView):
             "ts": utcnow(),
             "data": data
         }
-        return make_response(jsonify(response), 202)
+        # an update racing the read makes the ETag older than the data,
+        # which only costs the client one more full response later
+        return cache_validators(json_response(response, 202), etag)
 
     @token_auth.login_required
     def post(self):
+        """
+        update the profile fields in the request, the others stay as they
+        are. With the ``version`` of the profile read, the update only
+        applies while the profile is still at that version and is a 409
+        otherwise. An If-Match with the profile's ETag does the same with
+        a 412
+        """
         backend = current_app.backend
 
         post_data = request.get_json()
+        if not isinstance(post_data, dict):
+            return failed("Invalid data. Expected an object of fields")
+        changes = dict(post_data)
+        version = changes.pop("version", None)
+        if version is not None and (
+                not isinstance(version, int) or isinstance(version, bool)):
+            return failed("Invalid data. The version isn't a number")
+        status = 409
+        if version is None:
+            version = if_match_version(g.user)
+            status = 412
         try:
-            backend.user_profile_update(g.user, post_data)
-        except KeyError:
-            response = {
-                "status": "failed",
-                "message": f"Invalid data"
-            }
-            return make_response(jsonify(response), 304)
+            version = backend.user_profile_update(g.user, changes, version)
+        except ValueError as error:
+            return failed(f"Invalid data. {error}")
+        except VersionConflict:
+            return failed("The profile changed meanwhile, read it again "
+                          "and retry", status)
         response = {
             "status": "success",
-            "message": f"updated values {', '.join(post_data.keys())}"
+            "message": f"updated values {', '.join(changes)}"
         }
-        return make_response(jsonify(response), 202)
+        if version is not None:
+            response["version"] = version
+        response = json_response(response, 202)
+        if version is not None:
+            response.set_etag(profile_etag(g.user, version))
+        return response
 
 
-@api.route("/api/food/search", methods=["GET"])
+@api.route("/api/admin/profiles", methods=["POST"])
 @token_auth.login_required
-def food_search():
+@admin_required
+def admin_profiles_update():
+    """
+    update many profiles in one transaction, all of them or none
+
+    The request is ``{"profiles": [{"username": ..., "profile": {...},
+    "version": ...}]}``, ``version`` is optional and works as for a
+    single profile update. Any version not matching fails the request
+    with a 409 listing the users whose profile changed
+    """
     backend = current_app.backend
-    request_params = dict(request.args)
+
+    post_data = request.get_json()
+    profiles = post_data.get("profiles") \
+        if isinstance(post_data, dict) else None
+    if not isinstance(profiles, list) or not profiles:
+        return failed("Invalid request. 'profiles' must be a non empty list")
+    if len(profiles) > MAX_PROFILES_PER_REQUEST:
+        return failed(f"Invalid request. At most {MAX_PROFILES_PER_REQUEST} "
+                      f"profiles per request", 413)
+    if not all(isinstance(update, dict) and "username" in update
+               for update in profiles):
+        return failed("Invalid request. Each update needs a 'username'")
+    updates = [
+        (update["username"], update.get("profile"), update.get("version"))
+        for update in profiles
+    ]
     try:
-        request_params["name"]
-    except KeyError:
+        versions = backend.user_profiles_update(updates)
+    except ValueError as error:
+        return failed(f"Invalid request. {error}")
+    except VersionConflict as conflict:
         response = {
             "status": "failed",
-            "message": "Invalid request. Search requires parameter 'name'"
+            "message": "Profiles changed meanwhile, nothing was updated",
+            "conflicts": conflict.usernames
+        }
+        return json_response(response, 409)
+    response = {
+        "status": "success",
+        "message": f"updated {len(versions)} profiles",
+        "versions": versions
+    }
+    return json_response(response, 200)
+
+
+class UserMealsView(MethodView):
+
+    @token_auth.login_required
+    def get(self):
+        backend = current_app.backend
+
+        try:
+            start = request.args.get("start")
+            start = parse(start) if start else None
+            end = request.args.get("end")
+            end = parse(end) if end else None
+            limit = int(request.args.get("limit", 100))
+        except ValueError:
+            return failed("Invalid request. 'start' and 'end' must be "
+                          "ISO 8601 timestamps and 'limit' an integer")
+        limit = max(0, min(limit, MAX_HISTORY_RESULTS))
+        meals = backend.user_meals_get(g.user, start=start, end=end,
+                                       limit=limit)
+        response = {
+            "status": "success",
+            "message": f"{len(meals)} meals found",
+            "num_results": len(meals),
+            "data": meals
+        }
+        return json_response(response, 200)
+
+    @token_auth.login_required
+    def post(self):
+        """
+        log a single meal, or a batch of meals as ``{"meals": [...]}``
+        """
+        backend = current_app.backend
+
+        post_data = request.get_json()
+        if isinstance(post_data, dict) and "meals" in post_data:
+            meals = post_data["meals"]
+        else:
+            meals = [post_data]
+        if not isinstance(meals, list) or not meals:
+            return failed("Invalid request. 'meals' must be a non empty list")
+        if len(meals) > MAX_MEALS_PER_REQUEST:
+            return failed(f"Invalid request. At most "
+                          f"{MAX_MEALS_PER_REQUEST} meals per request", 413)
+        try:
+            meals = [parse_meal(meal) for meal in meals]
+        except ValueError as error:
+            return failed(f"Invalid request. {error}")
+        try:
+            n_meals = backend.user_meals_add(g.user, meals)
+        except ValueError as error:
+            return failed(f"Invalid request. {error}")
+        response = {
+            "status": "success",
+            "message": f"logged {n_meals} meals",
+            "num_meals": n_meals
         }
-        return make_response(jsonify(response), 400)
-    max_results = request_params.get("max_results", 10)
-    items = backend.food_item_find_closest_match(request_params["name"],
-                                                 max_results=max_results)
+        return json_response(response, 201)
+
+
+@api.route("/api/user/export", methods=["GET"])
+@token_auth.login_required
+def export():
+    """
+    stream all the user's meals, or those logged between ``start`` and
+    ``end``, oldest first as NDJSON or CSV with ``format``. An export that
+    broke off continues from ``after``, the id of the last meal received
+    """
+    backend = current_app.backend
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in EXPORT_MIMETYPES:
+        return failed(f"Invalid request. 'format' must be one of "
+                      f"{', '.join(EXPORT_MIMETYPES)}")
+    try:
+        start = request.args.get("start")
+        start = parse(start) if start else None
+        end = request.args.get("end")
+        end = parse(end) if end else None
+        after = request.args.get("after")
+        after = int(after) if after else None
+    except ValueError:
+        return failed("Invalid request. 'start' and 'end' must be ISO 8601 "
+                      "timestamps and 'after' a meal id")
+    try:
+        meals = backend.user_meals_export(g.user, start=start, end=end,
+                                          after=after)
+    except ValueError as error:
+        return failed(f"Invalid request. {error}")
+    body = export_meals(meals, export_format, resumed=after is not None)
+    response = current_app.response_class(
+        body, mimetype=EXPORT_MIMETYPES[export_format])
+    response.headers["Content-Disposition"] = \
+        f"attachment; filename=meals.{export_format}"
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+@api.route("/api/user/nutrition/daily", methods=["GET"])
+@token_auth.login_required
+def daily_nutrition():
+    """
+    daily nutrient totals for the ``days`` days up to and including
+    ``end``, today by default
+    """
+    backend = current_app.backend
+    try:
+        end = request.args.get("end")
+        end = parse(end).date() if end else utcnow().date()
+        days = int(request.args.get("days", 30))
+    except ValueError:
+        return failed("Invalid request. 'end' must be an ISO 8601 date and "
+                      "'days' an integer")
+    if not 0 < days <= MAX_NUTRITION_DAYS:
+        return failed(f"Invalid request. 'days' must be between 1 and "
+                      f"{MAX_NUTRITION_DAYS}")
+    end = end + timedelta(days=1)
+    totals = backend.user_daily_nutrition(g.user, end - timedelta(days=days),
+                                          end)
+    response = {
+        "status": "success",
+        "message": f"{len(totals)} days",
+        "num_results": len(totals),
+        "data": totals
+    }
+    return json_response(response, 200)
+
+
+def parse_sample(data):
+    """
+    validate a body metric sample posted by a client, returns ``(metric,
+    measured_at, value)`` and raises ValueError when invalid
+    """
+    if not isinstance(data, dict):
+        raise ValueError("each sample must be an object")
+    metric = data.get("metric")
+    if metric not in METRICS:
+        raise ValueError(f"'metric' must be one of {', '.join(METRICS)}")
+    value = data.get("value")
+    if not is_number(value) or not math.isfinite(value):
+        raise ValueError("'value' must be a number")
+    measured_at = data.get("measured_at")
+    measured_at = parse(measured_at) if measured_at else utcnow()
+    return metric, measured_at, float(value)
+
+
+class UserMetricsView(MethodView):
+
+    @token_auth.login_required
+    def post(self):
+        """
+        record a single body metric sample, or a batch of samples as
+        ``{"samples": [...]}``
+        """
+        backend = current_app.backend
+
+        post_data = request.get_json()
+        if isinstance(post_data, dict) and "samples" in post_data:
+            samples = post_data["samples"]
+        else:
+            samples = [post_data]
+        if not isinstance(samples, list) or not samples:
+            return failed(
+                "Invalid request. 'samples' must be a non empty list")
+        if len(samples) > MAX_SAMPLES_PER_REQUEST:
+            return failed(f"Invalid request. At most "
+                          f"{MAX_SAMPLES_PER_REQUEST} samples per request",
+                          413)
+        try:
+            samples = [parse_sample(sample) for sample in samples]
+        except ValueError as error:
+            return failed(f"Invalid request. {error}")
+        n_samples = backend.user_metrics_add(g.user, samples)
+        response = {
+            "status": "success",
+            "message": f"recorded {n_samples} samples",
+            "num_samples": n_samples
+        }
+        return json_response(response, 201)
+
+
+@api.route("/api/user/metrics/<metric>", methods=["GET"])
+@token_auth.login_required
+def metric_series(metric):
+    """
+    a body metric between ``start`` and ``end``, the 7 days up to now by
+    default, as raw samples or hourly, daily or weekly buckets with
+    ``resolution``
+    """
+    backend = current_app.backend
+    if metric not in METRICS:
+        return failed(f"Unknown metric. Expected one of "
+                      f"{', '.join(METRICS)}", 404)
+    try:
+        end = request.args.get("end")
+        end = parse(end) if end else utcnow()
+        start = request.args.get("start")
+        start = parse(start) if start else end - timedelta(days=7)
+    except ValueError:
+        return failed("Invalid request. 'start' and 'end' must be ISO 8601 "
+                      "timestamps")
+    resolution = request.args.get("resolution", "day")
+    if resolution not in RESOLUTIONS:
+        return failed(f"Invalid request. 'resolution' must be one of "
+                      f"{', '.join(RESOLUTIONS)}")
+    max_days = MAX_RAW_METRIC_DAYS if resolution == "raw" \
+        else MAX_METRIC_DAYS
+    if not start < end <= start + timedelta(days=max_days):
+        return failed(f"Invalid request. 'start' must be before 'end' and "
+                      f"at most {max_days} days apart for {resolution} "
+                      f"series")
+    points = backend.user_metric_series(g.user, metric, start, end,
+                                        resolution)
+    response = {
+        "status": "success",
+        "message": f"{len(points)} {metric} points",
+        "metric": metric,
+        "resolution": resolution,
+        "num_results": len(points),
+        "data": points
+    }
+    stream = "data" if len(points) > STREAM_METRIC_POINTS else None
+    return json_response(response, 200, stream=stream)
+
+
+def nutrient_query(request_params):
+    """
+    read the ``mode=nutrients`` food search parameters, raises ValueError
+    when they're invalid
+
+    Filters are ``min_<nutrient>`` and ``max_<nutrient>`` for fat, protein,
+    carbs and calories plus an exact food ``group``. ``sort`` is one of
+    ``NutrientStore.sort_keys`` and ``order`` is ``desc`` (default) or
+    ``asc``.
+    """
+    # nutrients loads numpy, which requests not searching don't need
+    from idiet.tracking.nutrients import COLUMNS, NutrientStore
+
+    ranges = {}
+    for column in COLUMNS:
+        low = request_params.get(f"min_{column}")
+        high = request_params.get(f"max_{column}")
+        if low is not None or high is not None:
+            try:
+                ranges[column] = (
+                    None if low is None else float(low),
+                    None if high is None else float(high),
+                )
+            except ValueError:
+                raise ValueError("Nutrient bounds must be numbers")
+    sort = request_params.get("sort")
+    if sort is not None and sort not in NutrientStore.sort_keys:
+        raise ValueError(f"'sort' must be one of "
+                         f"{', '.join(NutrientStore.sort_keys)}")
+    order = request_params.get("order", "desc")
+    if order not in ("asc", "desc"):
+        raise ValueError("'order' must be 'asc' or 'desc'")
+    return {
+        "group": request_params.get("group"),
+        "ranges": ranges,
+        "sort": sort,
+        "descending": order == "desc",
+    }
+
+
+def search_digest(request_params):
+    """
+    a digest of the food search parameters a page depends on, every page
+    of one search has the same digest
+    """
+    params = sorted(
+        (key, value) for key, value in request_params.items()
+        if key not in ("cursor", "max_results")
+    )
+    return hashlib.blake2b(json.dumps(params).encode(),
+                           digest_size=8).hexdigest()
+
+
+def encode_cursor(request_params, key):
+    """
+    the opaque token of the page after the food whose sort key is ``key``
+    """
+    payload = json.dumps([search_digest(request_params), list(key)],
+                         separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token, request_params, key_length):
+    """
+    the sort key in a cursor of the search ``request_params`` describe,
+    raises ValueError for anything else
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        digest, key = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise ValueError("'cursor' is not a valid cursor")
+    if digest != search_digest(request_params):
+        raise ValueError("'cursor' belongs to a different search")
+    if not isinstance(key, list) or len(key) != key_length:
+        raise ValueError("'cursor' is not a valid cursor")
+    # nutrient sort keys start with None for a food missing the value
+    values = key[1:] if key_length == 2 and key[0] is None else key
+    if not all(isinstance(value, (int, float)) for value in values):
+        raise ValueError("'cursor' is not a valid cursor")
+    return key
+
+
+@api.route("/api/food/search", methods=["GET"])
+@token_auth.login_required
+def food_search():
+    """
+    search foods by name or nutrients
+
+    Results come in pages of up to ``max_results`` foods, capped at
+    ``MAX_SEARCH_RESULTS``. ``next_cursor`` is null on the last page,
+    otherwise passing it as ``cursor`` with the same search returns the
+    next page. Cursors hold the sort key of the last food rather than an
+    offset, so every page costs about the same and a cursor keeps working
+    after the catalog is reloaded.
+
+    Results only change with the food catalog, the ETag is the catalog
+    version and rendered results are kept in the app's response cache
+    until the catalog is reloaded. Results long enough to be streamed
+    aren't cached.
+    """
+    backend = current_app.backend
+    # an invalid search is a 400 whatever the client has cached
+    try:
+        search = food_search_query(dict(request.args))
+    except ValueError as error:
+        return failed(f"Invalid request. {error}")
+    version = backend.food_catalog_version()
+    etag = f"food-{version}"
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    cache_key = tuple(sorted(request.args.items(multi=True)))
+    body = current_app.response_cache.get_response(version, cache_key)
+    if body is None:
+        response = _food_search(backend, search)
+        if response.is_streamed:
+            return cache_validators(response, etag)
+        body = response.get_data()
+        current_app.response_cache.set_response(version, cache_key, body)
+    response = current_app.response_class(body, status=202,
+                                          mimetype="application/json")
+    return cache_validators(response, etag)
+
+
+def food_search_query(request_params):
+    """
+    read the food search parameters, raises ValueError when they're
+    invalid
+
+    Returns a dict of the ``mode``, the ``max_results`` capped at
+    ``MAX_SEARCH_RESULTS``, the decoded ``after`` cursor or None, the
+    ``request_params`` and the ``nutrient_query`` as ``query`` with
+    ``mode=nutrients``.
+    """
+    mode = request_params.get("mode", "name")
+    if mode not in ("name", "nutrients"):
+        raise ValueError("'mode' must be 'name' or 'nutrients'")
+    if mode == "name" and "name" not in request_params:
+        raise ValueError("Search requires parameter 'name'")
+    try:
+        max_results = int(request_params.get("max_results", 10))
+    except ValueError:
+        raise ValueError("'max_results' must be an integer") from None
+    max_results = max(0, min(max_results, MAX_SEARCH_RESULTS))
+    query = None
+    if mode == "nutrients":
+        query = nutrient_query(request_params)
+        key_length = 1 if query["sort"] is None else 2
+    else:
+        key_length = 4
+    after = request_params.get("cursor")
+    if after is not None:
+        after = decode_cursor(after, request_params, key_length)
+    return {"mode": mode, "max_results": max_results, "after": after,
+            "request_params": request_params, "query": query}
+
+
+def _food_search(backend, search):
+    request_params = search["request_params"]
+    max_results = search["max_results"]
+    after = search["after"]
+    # one more than a page tells whether there's a next one
+    if search["mode"] == "nutrients":
+        page = backend.food_page_by_nutrients(
+            max_results=max_results + 1, after=after, **search["query"])
+    else:
+        page = backend.food_page_by_name(
+            request_params["name"], max_results=max_results + 1,
+            after=after)
+    next_cursor = None
+    if len(page) > max_results > 0:
+        page = page[:max_results]
+        next_cursor = encode_cursor(request_params, page[-1][0])
+    items = [record for _, record in page[:max_results]]
     n_items = len(items)
     response = {
         "status": "success",
         "message": f"{n_items} results found",
         "num_results": n_items,
+        "next_cursor": next_cursor,
+        "data": items
+    }
+    stream = "data" if n_items > STREAM_SEARCH_RESULTS else None
+    return json_response(response, 202, stream=stream)
+
+
+@api.route("/api/food/autocomplete", methods=["GET"])
+@token_auth.login_required
+def food_autocomplete():
+    """
+    foods whose name starts with ``prefix`` for type-ahead, the foods
+    users log most often first. Each food has its ``food_id`` so picking
+    one can log it as a meal
+    """
+    backend = current_app.backend
+    prefix = request.args.get("prefix")
+    if not prefix:
+        return failed("Invalid request. Autocomplete requires parameter "
+                      "'prefix'")
+    try:
+        max_results = int(request.args.get("max_results", 10))
+    except ValueError:
+        return failed("Invalid request. 'max_results' must be an integer")
+    max_results = max(0, min(max_results, PrefixIndex.max_results))
+    matches = backend.food_autocomplete(prefix, max_results=max_results)
+    items = [dict(record, food_id=foodid) for foodid, record in matches]
+    response = {
+        "status": "success",
+        "message": f"{len(items)} results found",
+        "num_results": len(items),
         "data": items
     }
-    return make_response(jsonify(response), 202)
+    response = json_response(response, 200)
+    updater = current_app.popularity_updater
+    if updater is not None and updater.due():
+        # on the request's thread, which sees the same database, once the
+        # response is sent
+        app = current_app._get_current_object()
+
+        def refresh():
+            with app.app_context():
+                updater.maybe_refresh()
+
+        response.call_on_close(refresh)
+    return response
 
 
 register_view = RegisterView.as_view("registration_api")
 login_view = LoginView.as_view("login_api")
+logout_view = LogoutView.as_view("logout_api")
 user_profile_view = UserProfileView.as_view("profile_api")
+user_meals_view = UserMealsView.as_view("meals_api")
+user_metrics_view = UserMetricsView.as_view("metrics_api")
 
 api.add_url_rule("/api/register", view_func=register_view)
 api.add_url_rule("/api/login", view_func=login_view)
+api.add_url_rule("/api/logout", view_func=logout_view)
 api.add_url_rule("/api/user/profile", view_func=user_profile_view)
+api.add_url_rule("/api/user/meals", view_func=user_meals_view)
+api.add_url_rule("/api/user/metrics", view_func=user_metrics_view)
@@ -0,0 +1,16 @@
+"""
+the app for asyncio servers
+
+    uvicorn idiet.tracking.asgi:app
+
+Configured like ``idiet.tracking.wsgi``, ``IDIET_TRACKING_THREADS`` sets
+how many requests run at once.
+"""
+from os import environ
+
+from .asgi_adapter import ASGIAdapter
+from .wsgi import app as wsgi_app
+
+
+app = ASGIAdapter(wsgi_app,
+                  threads=int(environ.get("IDIET_TRACKING_THREADS", 8)))
@@ -0,0 +1,254 @@
+"""
+serve the WSGI app from an asyncio event loop
+
+The event loop holds the client connections, each request is then handed
+to a bounded thread pool that runs the WSGI app. Idle and slow clients
+only cost a coroutine instead of a server thread, so one process keeps
+thousands of connections open while ``threads`` requests run at once.
+
+Request bodies are read whole before a request is handed to a thread, up
+to the app's ``MAX_CONTENT_LENGTH``. Larger bodies get a 413 and a
+request whose client disconnects before its body is read isn't run.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import io
+import json
+import sys
+
+
+#: the body size limit of apps not setting ``MAX_CONTENT_LENGTH``
+MAX_BODY_SIZE = 16 * 1024 * 1024
+
+
+class ClientDisconnected(Exception):
+    """
+    the client went away before its request body was read
+    """
+
+
+class BodyTooLarge(Exception):
+    """
+    a request body is larger than the adapter accepts
+    """
+
+
+class ASGIAdapter:
+    """
+    an ASGI application running a WSGI application in threads
+
+    Parameters
+    ----------
+    wsgi_app:
+        the WSGI application, e.g. the app ``create_app`` returns
+    threads:
+        requests handled at once, further requests wait in the event
+        loop without taking a thread
+    max_body_size:
+        largest request body in bytes, defaults to the app's
+        ``MAX_CONTENT_LENGTH`` or ``MAX_BODY_SIZE``
+    """
+
+    def __init__(self, wsgi_app, threads=8, max_body_size=None):
+        self.wsgi_app = wsgi_app
+        self.threads = threads
+        if max_body_size is None:
+            config = getattr(wsgi_app, "config", {})
+            max_body_size = config.get("MAX_CONTENT_LENGTH") or MAX_BODY_SIZE
+        self.max_body_size = max_body_size
+        self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                self.threads, thread_name_prefix="wsgi")
+        return self._executor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            await self.http(scope, receive, send)
+        elif scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        else:
+            raise ValueError(f"unsupported scope type {scope['type']!r}")
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    async def http(self, scope, receive, send):
+        try:
+            body = await read_body(receive, self.max_body_size,
+                                   _content_length(scope))
+        except ClientDisconnected:
+            return
+        except BodyTooLarge:
+            await _send_error(send, 413, "Request body too large")
+            return
+        environ = build_environ(scope, body)
+        loop = asyncio.get_running_loop()
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response["status"] = int(status.split(" ", 1)[0])
+            response["headers"] = [
+                (name.lower().encode("latin-1"), value.encode("latin-1"))
+                for name, value in headers
+            ]
+
+        def run():
+            iterable = self.wsgi_app(environ, start_response)
+            iterator = iter(iterable)
+            chunks, done = _take(iterator)
+            return iterable, iterator, chunks, done
+
+        executor = self.executor
+        iterable, iterator, chunks, done = await loop.run_in_executor(
+            executor, run)
+        # most responses are read whole by the first hop to a thread, only
+        # large or streamed ones need more
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": response["status"],
+                "headers": response["headers"],
+            })
+            while True:
+                for chunk in chunks:
+                    await send({
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": True,
+                    })
+                if done:
+                    break
+                chunks, done = await loop.run_in_executor(
+                    executor, _take, iterator)
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            # after the response is sent, close callbacks like the
+            # popularity refresh don't delay it
+            await loop.run_in_executor(executor, _close, iterable)
+
+
+def _take(iterator, limit=256 * 1024):
+    """
+    the next chunks of a response up to about ``limit`` bytes, and whether
+    the response is done
+    """
+    chunks = []
+    size = 0
+    for chunk in iterator:
+        if chunk:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= limit:
+                return chunks, False
+    return chunks, True
+
+
+def _close(iterable):
+    close = getattr(iterable, "close", None)
+    if close is not None:
+        close()
+
+
+async def read_body(receive, max_size=None, content_length=None):
+    """
+    the whole body of a request
+
+    Raises ``BodyTooLarge`` as soon as the declared ``content_length`` or
+    the body read so far is larger than ``max_size`` and
+    ``ClientDisconnected`` if the client goes away before the end of the
+    body.
+    """
+    if max_size is not None and (content_length or 0) > max_size:
+        raise BodyTooLarge()
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ClientDisconnected()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            raise BodyTooLarge()
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+def _content_length(scope):
+    for name, value in scope.get("headers", ()):
+        if name.lower() == b"content-length":
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+async def _send_error(send, status, message):
+    body = json.dumps({"status": "failed", "message": message}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode("latin-1"))],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def build_environ(scope, body):
+    """
+    the WSGI environ of an ASGI http scope
+    """
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8")
+        .decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", ()):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name == "CONTENT_LENGTH":
+            continue
+        else:
+            key = f"HTTP_{name}"
+            if key in environ:
+                value = f"{environ[key]},{value}"
+            environ[key] = value
+    return environ
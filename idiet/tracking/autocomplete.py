@@ -0,0 +1,233 @@
+"""
+food name completion ranked by how often users log each food
+
+Names are kept normalized in one sorted list, the foods completing a
+prefix are a contiguous run of it. Within the run foods are ranked by
+popularity, then shorter names first. The runs of every 1 to 3 character
+prefix are indexed by the prefix ``code``, a longer prefix binary searches
+only the run of its first 3 characters. The runs of short prefixes cover
+a large part of the catalog, so their best matches are kept once computed
+until the ranking changes, longer prefixes select from their run with a
+partial sort.
+
+numpy is imported when the first index is built, importing the module for
+``PopularityUpdater`` doesn't load it.
+"""
+import bisect
+import logging
+import threading
+import time
+
+from idiet.tracking.search import ALPHABET, code, normalize
+
+
+logger = logging.getLogger(__name__)
+
+# sorts after every character normalize keeps
+_PAST_PREFIX = "\x7f"
+
+
+def prefix_runs(names, length):
+    """
+    ``(starts, ends)`` arrays of the runs of sorted ``names`` starting with
+    each ``length`` character prefix, indexed by the prefix ``code``
+
+    Prefixes no name starts with have empty runs.
+    """
+    import numpy as np
+
+    starts = np.zeros(len(ALPHABET) ** length, dtype=np.int32)
+    ends = np.zeros(len(ALPHABET) ** length, dtype=np.int32)
+    previous = None
+    for position, name in enumerate(names):
+        if len(name) < length:
+            continue
+        prefix = code(name[:length])
+        if prefix != previous:
+            starts[prefix] = position
+            previous = prefix
+        ends[prefix] = position + 1
+    return starts, ends
+
+
+class PrefixIndex:
+    """
+    completions of normalized food name prefixes
+
+    Parameters
+    ----------
+    foods:
+        iterable of ``(foodid, record)`` pairs where record is a
+        ``FoodFact.to_dict`` dict
+    popularity:
+        ``{foodid: count}`` of how often each food was picked, see
+        ``set_popularity``
+    """
+
+    #: prefixes up to this many characters have their runs precomputed
+    precomputed_length = 3
+    #: completions returned at most
+    max_results = 20
+
+    def __init__(self, foods=(), popularity=None):
+        import numpy as np
+
+        entries = []
+        for foodid, record in foods:
+            name = normalize(record.get("name"))
+            if name:
+                entries.append((name, foodid, record))
+        entries.sort(key=lambda entry: entry[:2])
+        self.names = [name for name, _, _ in entries]
+        self.ids = np.asarray([foodid for _, foodid, _ in entries],
+                              dtype=np.int64)
+        self.records = [record for _, _, record in entries]
+        self._lengths = np.asarray([len(name) for name in self.names],
+                                   dtype=np.int32)
+        self._runs = {
+            length: prefix_runs(self.names, length)
+            for length in range(1, self.precomputed_length + 1)
+        }
+        order = np.argsort(self.ids, kind="stable")
+        self._by_id = (self.ids[order], order)
+        self.popularity = {}
+        self._ranking = (np.zeros(0, dtype=np.int64), {})
+        self.set_popularity(popularity or {})
+
+    @classmethod
+    def from_catalog(cls, catalog, popularity=None):
+        """
+        an index reading its sorted names and their prefix runs from a
+        ``Catalog`` in place, only the ranking is built
+        """
+        import numpy as np
+
+        index = cls.__new__(cls)
+        index.names = catalog.prefix_names
+        index.ids = np.asarray(catalog.prefix_ids)
+        index.records = catalog.prefix_records
+        index._lengths = np.asarray(catalog.prefix_lengths)
+        index._runs = {
+            length: (np.asarray(starts), np.asarray(ends))
+            for length, (starts, ends) in catalog.prefix_runs.items()
+        }
+        index._by_id = (np.asarray(catalog.prefix_sorted_ids),
+                        np.asarray(catalog.prefix_sorted_indexes))
+        index.popularity = {}
+        index._ranking = (np.zeros(0, dtype=np.int64), {})
+        index.set_popularity(popularity or {})
+        return index
+
+    def __len__(self):
+        return len(self.names)
+
+    def set_popularity(self, counts):
+        """
+        rank completions by ``counts``, ``{foodid: count}``
+
+        The new ranking is built aside and swapped in as a whole, so
+        completions running meanwhile see either the old or the new one.
+        """
+        import numpy as np
+
+        n = len(self.names)
+        picks = np.zeros(n, dtype=np.int64)
+        sorted_ids, indexes = self._by_id
+        if counts and len(sorted_ids):
+            foodids = np.fromiter(counts.keys(), dtype=np.int64,
+                                  count=len(counts))
+            found = np.searchsorted(sorted_ids, foodids)
+            found[found == len(sorted_ids)] = 0
+            known = sorted_ids[found] == foodids
+            picks[indexes[found[known]]] = np.fromiter(
+                counts.values(), dtype=np.int64, count=len(counts))[known]
+        # most picked first, then shorter names, then alphabetical
+        order = np.lexsort((np.arange(n), self._lengths, -picks))
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = np.arange(n)
+        # the best matches of short prefixes are added on first use
+        self._ranking = (rank, {})
+        self.popularity = counts
+
+    def complete(self, prefix, max_results=10):
+        """
+        up to ``max_results`` ``(foodid, record)`` pairs of the foods whose
+        normalized name starts with the normalized ``prefix``, best first
+        """
+        prefix = normalize(prefix)
+        max_results = min(max_results, self.max_results)
+        if not prefix or max_results <= 0:
+            return []
+        rank, top = self._ranking
+        length = min(len(prefix), self.precomputed_length)
+        starts, ends = self._runs[length]
+        run = code(prefix[:length])
+        start, end = int(starts[run]), int(ends[run])
+        if len(prefix) <= self.precomputed_length:
+            positions = top.get(prefix)
+            if positions is None:
+                positions = _top(rank, start, end, self.max_results)
+                top[prefix] = positions
+        else:
+            start = bisect.bisect_left(self.names, prefix, start, end)
+            end = bisect.bisect_left(
+                self.names, prefix + _PAST_PREFIX, start, end)
+            positions = _top(rank, start, end, max_results)
+        return [
+            (int(self.ids[p]), self.records[p])
+            for p in positions[:max_results]
+        ]
+
+
+def _top(rank, start, end, k):
+    """
+    positions in ``[start, end)`` of the ``k`` best ranks, best first
+    """
+    import numpy as np
+
+    ranks = rank[start:end]
+    if len(ranks) > k:
+        best = np.argpartition(ranks, k - 1)[:k]
+    else:
+        best = np.arange(len(ranks))
+    return start + best[np.argsort(ranks[best])]
+
+
+class PopularityUpdater:
+    """
+    calls ``refresh`` at most every ``interval`` seconds, once the
+    response of the first request after the interval is up was sent
+
+    The refresh reads the popularity counts in that request's thread, the
+    same database a request sees even with an in memory sqlite database,
+    and the request's client doesn't wait for it. A single thread refreshes
+    at a time, the other requests keep the current ranking meanwhile. A
+    failing refresh is logged and retried after the next interval.
+    """
+
+    def __init__(self, refresh, interval=60.0, clock=time.monotonic):
+        self.refresh = refresh
+        self.interval = interval
+        self._clock = clock
+        self._next_refresh = 0.0
+        self._lock = threading.Lock()
+
+    def due(self):
+        """
+        whether the interval since the last refresh is up
+        """
+        return self._clock() >= self._next_refresh
+
+    def maybe_refresh(self):
+        now = self._clock()
+        if now < self._next_refresh:
+            return
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._next_refresh = now + self.interval
+            self.refresh()
+        except Exception:
+            logger.exception("refreshing food popularity failed")
+        finally:
+            self._lock.release()
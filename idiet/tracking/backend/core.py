@@ -1,6 +1,41 @@
 import abc
 import jwt
-from datetime import datetime
+from datetime import datetime, timedelta
+import uuid
+
+from idiet.tracking.encrypt import check_password_hash
+from idiet.tracking.timeseries import day_range, series
+from idiet.tracking.timestamp import utcnow
+
+
+# nutrients tracked per day, named as in FoodFact.to_dict
+NUTRIENTS = (
+    "calories",
+    "fat_in_grams",
+    "protein_in_grams",
+    "carbohydrates_in_grams",
+)
+# the meal fields holding the same nutrients, per serving
+MEAL_NUTRIENTS = (
+    "calories",
+    "fat_in_grams",
+    "protein_in_grams",
+    "carbs_in_grams",
+)
+# profile fields updates can set, with the length of text fields or None
+# for numbers. Daily targets are named after the nutrient they're for
+PROFILE_FIELDS = dict(
+    {
+        "name": 64,
+        "gender": 16,
+        "weight_in_kg": None,
+        "goal_weight_in_kg": None,
+    },
+    **{f"target_{nutrient}": None for nutrient in NUTRIENTS}
+)
+# profile fields the api returns that updates can't change, they're
+# skipped so a profile read can be sent back with changes
+READ_ONLY_PROFILE_FIELDS = ("member_since",)
 
 
 def encode(uname, password, **jwt_args):
@@ -42,6 +77,167 @@ class UserLogin(abc.ABC):
         return self.name == other.name and self.token == other.token
 
 
+def daily_totals(meals, foods):
+    """
+    sum the nutrients of a batch of meals per UTC day
+
+    A meal's own nutrient values are per serving, any left out are taken
+    from its food in ``foods``, a dict of ``FoodFact.to_dict`` records by
+    food id. Returns ``{day: [*NUTRIENTS, number of meals]}``.
+    """
+    totals = {}
+    for meal in meals:
+        food = foods.get(meal.get("food_id")) or {}
+        servings = meal.get("servings", 1)
+        day = totals.setdefault(meal["logged_at"].date(),
+                                [0.0] * len(NUTRIENTS) + [0])
+        for i, (nutrient, field) in enumerate(zip(NUTRIENTS,
+                                                  MEAL_NUTRIENTS)):
+            value = meal.get(field)
+            if value is None:
+                value = food.get(nutrient)
+            day[i] += (value or 0) * servings
+        day[-1] += 1
+    return totals
+
+
+def profile_changes(data):
+    """
+    the ``PROFILE_FIELDS`` to set from an update, raises ValueError for
+    unknown fields, values of the wrong type and updates changing nothing
+    """
+    if not isinstance(data, dict):
+        raise ValueError("a profile update is an object of fields")
+    changes = {}
+    for field, value in data.items():
+        if field in READ_ONLY_PROFILE_FIELDS:
+            continue
+        if field not in PROFILE_FIELDS:
+            raise ValueError(f"unknown profile field {field!r}")
+        length = PROFILE_FIELDS[field]
+        if value is None:
+            pass
+        elif length is not None:
+            if not isinstance(value, str) or len(value) > length:
+                raise ValueError(
+                    f"{field} must be text of at most {length} characters")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) \
+                and 0 <= value < float("inf"):
+            value = float(value)
+        else:
+            raise ValueError(f"{field} must be a positive number")
+        changes[field] = value
+    if not changes:
+        raise ValueError("no profile fields to update")
+    return changes
+
+
+def profile_updates(updates):
+    """
+    ``{username: (changes, version)}`` of ``(username, changes, version)``
+    updates, with the changes checked by ``profile_changes``. Raises
+    ValueError when a user is updated twice
+    """
+    checked = {}
+    for username, changes, version in updates:
+        if username in checked:
+            raise ValueError(f"{username} is updated more than once")
+        if version is not None and (
+                not isinstance(version, int) or isinstance(version, bool)):
+            raise ValueError(f"the version of {username} isn't a number")
+        try:
+            checked[username] = (profile_changes(changes), version)
+        except ValueError as e:
+            raise ValueError(f"{username}: {e}") from None
+    return checked
+
+
+class VersionConflict(Exception):
+    """
+    a profile update expected a version that isn't the current one
+    anymore, ``usernames`` are the users whose profile changed
+    """
+
+    def __init__(self, usernames):
+        super().__init__(
+            f"profiles changed meanwhile: {', '.join(usernames)}")
+        self.usernames = usernames
+
+
+class UserSnapshot:
+    """
+    the few user fields a request needs once its token is verified
+
+    Snapshots are plain objects, they outlive the database session that
+    loaded them and are safe to keep in the token cache.
+    """
+
+    __slots__ = ("id", "name")
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+    def __eq__(self, other):
+        return self.name == other.name
+
+    def __repr__(self):
+        return f"UserSnapshot(id={self.id!r}, name={self.name!r})"
+
+
+class UserCredentials:
+    """
+    what logging a user in needs: the id, name and password hash
+    """
+
+    __slots__ = ("id", "name", "password_hash")
+
+    def __init__(self, id, name, password_hash):
+        self.id = id
+        self.name = name
+        self.password_hash = password_hash
+
+    def validate(self, password):
+        return check_password_hash(self.password_hash, password)
+
+    def snapshot(self):
+        return UserSnapshot(self.id, self.name)
+
+
+class IssuedToken:
+    """
+    a signed token and the claims a backend keeps track of
+    """
+
+    __slots__ = ("jti", "user_id", "expires_on", "token")
+
+    def __init__(self, jti, user_id, expires_on, token):
+        self.jti = jti
+        self.user_id = user_id
+        self.expires_on = expires_on
+        self.token = token
+
+    def to_text(self):
+        return self.token
+
+
+def issue_token(user, secret, lifetime=timedelta(hours=1)):
+    """
+    sign a token for ``user``, anything with an ``id`` and a ``name``
+    """
+    now = utcnow()
+    exp = now + lifetime
+    jti = uuid.uuid4().hex
+    payload = {
+        "user": user.name,
+        "jti": jti,
+        "iat": now,
+        "exp": exp
+    }
+    token = jwt.encode(payload, secret, algorithm="HS256")
+    return IssuedToken(jti, user.id, exp, token.decode("utf-8"))
+
+
 class Backend(abc.ABC):
     """
     app metadata store
@@ -50,6 +246,9 @@ class Backend(abc.ABC):
     file system depending on the implementation. Backend provides a way
     to create manager user activity such as counting a meal, token auth, user
     profiles etc
+
+    Users passed to the methods are ``UserSnapshot`` like objects, only
+    their ``id`` and ``name`` are used.
     """
 
     def register_user(self, user):
@@ -57,3 +256,223 @@ class Backend(abc.ABC):
 
     def create_user_profile(self, user):
         pass
+
+    def init(self):
+        return self
+
+    def close_session(self):
+        """
+        release whatever the backend holds for the current request
+        """
+
+    def warm_up(self):
+        """
+        build the food search and autocompletion indexes now instead of
+        on the first requests using them
+        """
+        self.food_catalog_version()
+        self.food_popularity_refresh()
+
+    def before_fork(self):
+        """
+        release what a forked server process can't share with this one
+        """
+
+    def after_fork(self):
+        """
+        set up again in a forked server process what ``before_fork``
+        released
+        """
+
+    @abc.abstractmethod
+    def add_user(self, username, password):
+        """
+        create a user with an empty profile and return it, None when the
+        name is taken
+        """
+
+    @abc.abstractmethod
+    def get_user(self, username):
+        """
+        the user with this name or None
+        """
+
+    @abc.abstractmethod
+    def user_credentials(self, username):
+        """
+        the ``UserCredentials`` of a user or None
+        """
+
+    def user_exists(self, username):
+        return self.user_credentials(username) is not None
+
+    @abc.abstractmethod
+    def user_generate_token(self, user, secret):
+        """
+        issue a token for the user, returns an object with ``to_text``
+        and ``expires_on``
+        """
+
+    @abc.abstractmethod
+    def user_from_token(self, token, secret):
+        """
+        the ``UserSnapshot`` of a valid, unrevoked token or None
+        """
+
+    @abc.abstractmethod
+    def token_revoke(self, token, secret):
+        """
+        revoke a single token, returns False for an invalid one
+        """
+
+    @abc.abstractmethod
+    def user_tokens_revoke(self, user):
+        """
+        revoke every unexpired token of a user, returns how many
+        """
+
+    @abc.abstractmethod
+    def user_profile_get(self, user):
+        """
+        the user's profile, ``to_dict`` gives what the api returns
+        """
+
+    @abc.abstractmethod
+    def user_profile_update(self, user, changes, version=None):
+        """
+        set the profile fields in ``changes``, leaving the others as they
+        are. Returns the new version of the profile when ``version`` is
+        given and None otherwise
+
+        Raises ValueError for changes ``profile_changes`` rejects, and
+        ``VersionConflict`` when ``version`` isn't the current one
+        """
+
+    @abc.abstractmethod
+    def user_profiles_update(self, updates):
+        """
+        apply ``(username, changes, version)`` updates to many profiles at
+        once, all of them or none. ``version`` may be None to update
+        whatever the current version is. Returns ``{username: new
+        version}``
+
+        Raises ValueError for unknown users, repeated users or changes
+        ``profile_changes`` rejects, and ``VersionConflict`` listing every
+        user whose version didn't match
+        """
+
+    @abc.abstractmethod
+    def user_profile_version(self, user):
+        """
+        a number that goes up with every update of the user's profile
+        """
+
+    @abc.abstractmethod
+    def user_meals_add(self, user, meals):
+        """
+        log a batch of meals, raises ValueError for an unknown food id
+        """
+
+    @abc.abstractmethod
+    def user_meals_get(self, user, start=None, end=None, limit=100):
+        """
+        a user's meals logged in ``[start, end)``, oldest first
+        """
+
+    @abc.abstractmethod
+    def user_meals_export(self, user, start=None, end=None, after=None,
+                          batch_size=1000):
+        """
+        an iterator of all a user's meals logged in ``[start, end)``,
+        oldest first, starting after the meal with id ``after``. Raises
+        ValueError right away when the user has no meal ``after``
+
+        The iterator doesn't need the request, it can be consumed while
+        the response is sent and holds ``batch_size`` meals at most.
+        """
+
+    @abc.abstractmethod
+    def user_daily_nutrition(self, user, start, end):
+        """
+        a user's daily totals for every day in ``[start, end)``
+        """
+
+    @abc.abstractmethod
+    def user_metrics_add(self, user, samples):
+        """
+        record a batch of ``(metric, naive UTC datetime, value)`` body
+        metric samples, returns how many
+        """
+
+    @abc.abstractmethod
+    def user_metric_days(self, user, metric, start, end, resolution="raw"):
+        """
+        the ``timeseries.MetricDay`` chunks of a user's metric for the
+        days in ``[start, end)``, oldest first. Only chunks read for
+        ``raw`` series need their samples loaded
+        """
+
+    def user_metric_series(self, user, metric, start, end, resolution="raw"):
+        """
+        a user's samples of a metric between the naive UTC datetimes
+        ``start`` and ``end``, or their buckets, see ``timeseries.series``
+        """
+        first, last = day_range(start, end, resolution)
+        chunks = self.user_metric_days(user, metric, first, last, resolution)
+        return series(chunks, start, end, resolution)
+
+    def food_item_find_closest_match(self, name, max_results):
+        """
+        food records best matching a name, best first
+        """
+        return [record for _, record in self.food_page_by_name(
+            name, max_results=max_results)]
+
+    @abc.abstractmethod
+    def food_page_by_name(self, name, max_results, after=None):
+        """
+        ``(key, record)`` pairs of the foods best matching a name, best
+        first, starting after the food whose key is ``after``
+        """
+
+    @abc.abstractmethod
+    def food_autocomplete(self, prefix, max_results=10):
+        """
+        ``(foodid, record)`` pairs of the foods whose name starts with
+        ``prefix``, the most often logged first
+        """
+
+    @abc.abstractmethod
+    def food_popularity(self):
+        """
+        ``{foodid: count}`` of how many meals were logged of each food
+        """
+
+    def food_popularity_refresh(self):
+        """
+        rank autocompletion by the current ``food_popularity``
+        """
+        self.autocomplete_index.set_popularity(self.food_popularity())
+
+    @abc.abstractmethod
+    def food_catalog_version(self):
+        """
+        a string that changes whenever the food records served change
+        """
+
+    def food_items_by_nutrients(self, group=None, ranges=None, sort=None,
+                                descending=True, max_results=10):
+        """
+        food records matching nutrient ranges
+        """
+        return [record for _, record in self.food_page_by_nutrients(
+            group=group, ranges=ranges, sort=sort, descending=descending,
+            max_results=max_results)]
+
+    @abc.abstractmethod
+    def food_page_by_nutrients(self, group=None, ranges=None, sort=None,
+                               descending=True, max_results=10, after=None):
+        """
+        ``(key, record)`` pairs of the foods matching nutrient ranges,
+        starting after the food whose key is ``after``
+        """
@@ -1,24 +1,133 @@
 from datetime import timedelta
+import time
 
 import jwt
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import Column, Integer, String, ForeignKey, Date, Text, REAL
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy import DateTime, Index, LargeBinary
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import DBAPIError, IntegrityError, OperationalError
+from sqlalchemy.orm import sessionmaker, scoped_session, relationship
+from sqlalchemy.sql.expression import and_, bindparam, func, or_, select
+from sqlalchemy.pool import QueuePool
 
-from idiet.tracking.backend.core import Backend
-from idiet.tracking.timestamp import utcnow
+from idiet.tracking.autocomplete import PrefixIndex
+from idiet.tracking.backend.core import Backend, UserSnapshot, NUTRIENTS
+from idiet.tracking.backend.core import UserCredentials, issue_token
+from idiet.tracking.backend.core import PROFILE_FIELDS, VersionConflict
+from idiet.tracking.backend.core import daily_totals, profile_changes
+from idiet.tracking.backend.core import profile_updates
+from idiet.tracking.cache import LRUCache, TokenCache
+from idiet.tracking.metrics import timed
+from idiet.tracking.revocation import RevocationList
+from idiet.tracking.timestamp import utcnow, to_unix, from_unix
 from idiet.tracking.encrypt import hash_password, check_password_hash
+from idiet.tracking.search import FoodIndex
+from idiet.tracking.timeseries import MetricDay, day_samples
 
 
 Base = declarative_base()
 
 
+def generate_token(user, secret):
+    """
+    a signed token for ``user``, anything with an ``id`` and a ``name``
+
+    The returned ``Token`` row isn't added to a session yet.
+    """
+    issued = issue_token(user, secret)
+    token = Token(jti=issued.jti, user_id=issued.user_id,
+                  expires_on=issued.expires_on)
+    token.token = issued.token
+    return token
+
+
+# db config keys and the create_engine arguments they map to
+POOL_OPTIONS = {
+    "pool-size": "pool_size",
+    "max-overflow": "max_overflow",
+    "pool-recycle": "pool_recycle",
+    "pool-pre-ping": "pool_pre_ping",
+    "pool-timeout": "pool_timeout",
+}
+
+SQLITE_BUSY_TIMEOUT_MS = 5000
+
+
+def engine_from_config(db=None):
+    """
+    create an engine from the ``db`` section of the app config
+
+    ``url`` defaults to an in memory sqlite database. Sizing a pool with
+    ``pool-size`` or ``max-overflow`` always gives a ``QueuePool``, even
+    for sqlite which otherwise picks a pool that can't be sized. Note every
+    connection to an in memory sqlite database is a separate database.
+
+    File backed sqlite databases are tuned so several server processes
+    can share one file, see ``tune_sqlite``.
+    """
+    db = db or {}
+    url = make_url(db.get("url", "sqlite://"))
+    kwargs = {
+        argument: db[key]
+        for key, argument in POOL_OPTIONS.items() if key in db
+    }
+    if "pool_size" in kwargs or "max_overflow" in kwargs:
+        kwargs["poolclass"] = QueuePool
+    file_backed_sqlite = (
+        url.get_backend_name() == "sqlite"
+        and url.database not in (None, "", ":memory:")
+    )
+    if file_backed_sqlite:
+        kwargs["connect_args"] = {"check_same_thread": False}
+    engine = create_engine(url, **kwargs)
+    if file_backed_sqlite:
+        tune_sqlite(
+            engine,
+            busy_timeout=db.get("sqlite-busy-timeout", SQLITE_BUSY_TIMEOUT_MS)
+        )
+    return engine
+
+
+def tune_sqlite(engine, busy_timeout=SQLITE_BUSY_TIMEOUT_MS):
+    """
+    set up every new connection of a file backed sqlite engine for
+    concurrent use
+
+    WAL lets readers carry on while another process writes, the busy
+    timeout makes a writer wait for the lock instead of failing straight
+    away and synchronous=NORMAL is the durability level sqlite recommends
+    with WAL.
+    """
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout)}")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    return engine
+
+
 class Token(Base):
+    """
+    an issued token, identified by its ``jti`` claim
+
+    Only the id is stored and not the token itself, the signed token is
+    available as ``token`` on the object ``generate_token`` returns.
+    """
     __tablename__ = "jwt_tokens"
 
     id = Column(Integer, primary_key=True)
-    token = Column(String(256), unique=True)
-    expires_on = Column(Date, unique=False)
+    jti = Column(String(32), unique=True, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    expires_on = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime, index=True)
+
+    token = None
 
     def to_text(self):
         return self.token
@@ -28,7 +137,9 @@ class UserLogin(Base):
     __tablename__ = "users"
 
     id = Column(Integer, primary_key=True)
-    name = Column(String(128), unique=True)
+    # unique index ix_users_name, logins look users up by name and
+    # registration relies on it to reject a taken name
+    name = Column(String(128), unique=True, index=True)
     token = Column(String(256))
     profile = relationship("UserProfile", back_populates="user", uselist=False)
 
@@ -38,19 +149,11 @@ class UserLogin(Base):
     def validate(self, password):
         return check_password_hash(self.token, password)
 
+    def snapshot(self):
+        return UserSnapshot(self.id, self.name)
+
     def generate_token(self, secret):
-        now = utcnow()
-        exp = now + timedelta(hours=1)
-        payload = {
-            "user": self.name,
-            "iat": now,
-            "exp": exp
-        }
-        jwt_token = jwt.encode(payload, secret, algorithm="HS256")
-        token = Token()
-        token.expires_on = exp
-        token.token = jwt_token.decode("utf-8")
-        return token
+        return generate_token(self, secret)
 
 
 class UserProfile(Base):
@@ -61,18 +164,25 @@ class UserProfile(Base):
     gender = Column(String(16), nullable=True)
     member_since = Column(Date, nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"))
+    # bumped by every update, profile ETags are built from it
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # the rest of PROFILE_FIELDS, all optional
+    weight_in_kg = Column(REAL, nullable=True)
+    goal_weight_in_kg = Column(REAL, nullable=True)
+    target_calories = Column(REAL, nullable=True)
+    target_fat_in_grams = Column(REAL, nullable=True)
+    target_protein_in_grams = Column(REAL, nullable=True)
+    target_carbohydrates_in_grams = Column(REAL, nullable=True)
     user = relationship("UserLogin", back_populates="profile")
 
     def update(self, d):
-        self.name = d.get("name", self.name)
-        self.gender = d.get("gender", self.gender)
+        for field, value in profile_changes(d).items():
+            setattr(self, field, value)
 
     def to_dict(self):
-        return {
-            "name": self.name,
-            "gender": self.gender,
-            "member_since": self.member_since,
-        }
+        profile = {field: getattr(self, field) for field in PROFILE_FIELDS}
+        profile["member_since"] = self.member_since
+        return profile
 
 
 class FoodFact(Base):
@@ -110,35 +220,275 @@ class FoodFact(Base):
 
 
 class UserFoodItem(Base):
+    """
+    a meal a user logged, either a food from the food table or a free
+    form meal with its own nutrients
+    """
     __tablename__ = "user_meals"
+    __table_args__ = (
+        # a user's history is always read by time range
+        Index("ix_user_meals_user_id_logged_at", "user_id", "logged_at"),
+    )
 
     id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    foodid = Column(Integer, ForeignKey("idietfoodtable.foodid"),
+                    nullable=True)
+    logged_at = Column(DateTime, nullable=False)
+    servings = Column(REAL, nullable=False, default=1)
     name = Column(String(64), nullable=True)
-    fat_in_grams = Column(Integer, nullable=True, default=0)
-    carbs_in_grams = Column(Integer, nullable=True, default=0)
-    protein_in_grams = Column(Integer, nullable=True, default=0)
+    fat_in_grams = Column(REAL, nullable=True, default=0)
+    carbs_in_grams = Column(REAL, nullable=True, default=0)
+    protein_in_grams = Column(REAL, nullable=True, default=0)
+    calories = Column(REAL, nullable=True, default=0)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "food_id": self.foodid,
+            "name": self.name,
+            "servings": self.servings,
+            "logged_at": self.logged_at,
+            "fat_in_grams": self.fat_in_grams,
+            "carbs_in_grams": self.carbs_in_grams,
+            "protein_in_grams": self.protein_in_grams,
+            "calories": self.calories,
+        }
+
+
+class UserDailyNutrition(Base):
+    """
+    running nutrient totals of a user's meals per UTC day
+
+    Updated in the same transaction as the meals it sums, the primary key
+    doubles as the index for reading a range of days.
+    """
+    __tablename__ = "user_daily_nutrition"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    calories = Column(REAL, nullable=False, default=0)
+    fatg = Column(REAL, nullable=False, default=0)
+    proteing = Column(REAL, nullable=False, default=0)
+    carbohydrateg = Column(REAL, nullable=False, default=0)
+    meals = Column(Integer, nullable=False, default=0)
+
+    # columns in the order of backend.core.NUTRIENTS
+    nutrient_columns = ("calories", "fatg", "proteing", "carbohydrateg")
+
+    def to_dict(self):
+        day = {"day": self.day.isoformat()}
+        for nutrient, column in zip(NUTRIENTS, self.nutrient_columns):
+            day[nutrient] = getattr(self, column)
+        day["num_meals"] = self.meals
+        return day
+
+
+class FoodPicks(Base):
+    """
+    how many meals were logged of a food, the popularity autocompletion
+    ranks by
+
+    Updated in the same transaction as the meals it counts, so reading
+    the popularity never scans ``user_meals``.
+    """
+    __tablename__ = "food_picks"
+
+    foodid = Column(Integer, ForeignKey("idietfoodtable.foodid"),
+                    primary_key=True)
+    picks = Column(Integer, nullable=False, default=0)
+
+
+class UserMetricDay(Base):
+    """
+    a user's samples of a body metric on a UTC day, the stored form of
+    ``timeseries.MetricDay``
+
+    Rows are only ever replaced by rows with more samples, ``count``
+    doubles as the version writers check. The primary key is the index
+    for reading a range of days.
+    """
+    __tablename__ = "user_metric_days"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    metric = Column(String(32), primary_key=True)
+    day = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False)
+    total = Column(REAL, nullable=False)
+    minimum = Column(REAL, nullable=True)
+    maximum = Column(REAL, nullable=True)
+    # packed array('d') buffers, see timeseries.MetricDay
+    hours = Column(LargeBinary, nullable=False)
+    sample_times = Column(LargeBinary, nullable=False)
+    sample_values = Column(LargeBinary, nullable=False)
+
+
+# times a batch of metric samples is retried after losing a race with
+# another writer of the same chunks
+METRIC_WRITE_ATTEMPTS = 5
 
 
 class SqlAlchemyBackend(Backend):
 
-    def __init__(self, engine, encryption_key=None):
+    def __init__(self, engine, encryption_key=None, token_cache=None,
+                 revocation_sync_interval=1.0, profile_version_ttl=1.0,
+                 catalog_path=None, catalog_check_interval=1.0):
         self.engine = engine
         self.encryption_key = encryption_key
+        self.token_cache = token_cache if token_cache is not None \
+            else TokenCache()
+        self.revoked = RevocationList(
+            self._revoked_since, self._tokens_compact,
+            sync_interval=revocation_sync_interval)
+        # {user id: profile version}, updates through this process drop
+        # their entry, updates through other processes show after the ttl
+        self.profile_versions = LRUCache(1024 * 1024)
+        self.profile_version_ttl = profile_version_ttl
+        # objects stay readable after commit, the session only lives for
+        # a request so there's nothing to go stale
+        self.Session = scoped_session(
+            sessionmaker(bind=engine, expire_on_commit=False))
+        self._food_index = None
+        self._nutrient_store = None
+        self._catalog_version = None
+        self._autocomplete_index = None
+        self._warmed = False
+        # foods are served from this catalog file instead of the food
+        # table, see idiet.tracking.catalog
+        self.catalog_path = catalog_path
+        self.catalog_check_interval = catalog_check_interval
+        self._catalog = None
+        self._next_catalog_check = 0.0
 
     def init(self):
-        Base.metadata.create_all(self.engine)
+        self._drop_old_tokens_table()
+        counted = FoodPicks.__tablename__ in inspect(
+            self.engine).get_table_names()
+        try:
+            Base.metadata.create_all(self.engine)
+        except OperationalError:
+            # another server process sharing the database created a table
+            # between the existence check and the CREATE, the retry finds it
+            Base.metadata.create_all(self.engine)
+        self._add_profile_columns()
+        if not counted:
+            self._count_food_picks()
         return self
 
+    def warm_up(self):
+        super().warm_up()
+        self._prime_pool()
+        self._warmed = True
+
+    def _prime_pool(self):
+        # connect the pool's connections now rather than in the first
+        # requests, only a QueuePool keeps them
+        pool = self.engine.pool
+        if not isinstance(pool, QueuePool):
+            return
+        connections = [self.engine.connect() for _ in range(pool.size())]
+        for connection in connections:
+            connection.close()
+
+    def before_fork(self):
+        # a connection open in the parent would be used by every worker,
+        # close them before forking. Other pools hold no connection to a
+        # shared database, in memory sqlite can't be forked anyway
+        self.Session.remove()
+        if isinstance(self.engine.pool, QueuePool):
+            self.engine.dispose()
+
+    def after_fork(self):
+        self.Session.remove()
+        if isinstance(self.engine.pool, QueuePool):
+            self.engine.dispose()
+            if self._warmed:
+                self._prime_pool()
+
+    def _profile_columns(self):
+        return {
+            column["name"]
+            for column in inspect(self.engine).get_columns("user_profiles")
+        }
+
+    def _add_profile_columns(self):
+        # user_profiles was created with only a name and a gender before,
+        # existing profiles start at version 1 with the new fields empty
+        existing = self._profile_columns()
+        missing = [
+            column for column in UserProfile.__table__.columns
+            if column.name not in existing
+        ]
+        for column in missing:
+            ddl = (f"ALTER TABLE user_profiles ADD COLUMN {column.name} "
+                   f"{column.type.compile(dialect=self.engine.dialect)}")
+            if column.server_default is not None:
+                ddl += f" NOT NULL DEFAULT {column.server_default.arg}"
+            try:
+                with self.engine.begin() as connection:
+                    connection.execute(ddl)
+            except DBAPIError:
+                # another server process added it first
+                if column.name not in self._profile_columns():
+                    raise
+
+    def _count_food_picks(self):
+        # meals logged before food_picks existed are counted once, when
+        # the table is created
+        table = FoodPicks.__table__
+        meals = UserFoodItem.__table__
+        counts = select([meals.c.foodid, func.count()]).where(
+            meals.c.foodid.isnot(None)).group_by(meals.c.foodid)
+        try:
+            with self.engine.begin() as connection:
+                if connection.execute(
+                        select([table.c.foodid]).limit(1)).first() is None:
+                    connection.execute(table.insert().from_select(
+                        ["foodid", "picks"], counts))
+        except IntegrityError:
+            # another server process counted them first
+            pass
+
+    def _drop_old_tokens_table(self):
+        # jwt_tokens used to be created without ever being written to, an
+        # empty table without the jti column is replaced by the new one
+        if "jwt_tokens" not in inspect(self.engine).get_table_names():
+            return
+        columns = {
+            column["name"]
+            for column in inspect(self.engine).get_columns("jwt_tokens")
+        }
+        if "jti" in columns:
+            return
+        table = Token.__table__
+        with self.engine.begin() as connection:
+            empty = connection.execute(
+                select([table.c.id]).limit(1)).first() is None
+            if empty:
+                table.drop(connection)
+
     def _create_session(self):
-        return sessionmaker(bind=self.engine)()
+        # every call in a thread shares one session until close_session
+        return self.Session()
+
+    def close_session(self):
+        self.Session.remove()
 
     def add_user(self, username, password):
+        """
+        create a user with an empty profile, returns None when the name is
+        already taken
+        """
         session = self._create_session()
         password = hash_password(password)
         user = UserLogin(name=username, token=password)
         user.profile = UserProfile(member_since=utcnow())
         session.add(user)
-        session.commit()
+        try:
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+            return None
         return user
 
     user_add = add_user
@@ -150,35 +500,640 @@ class SqlAlchemyBackend(Backend):
 
     user_get = get_user
 
-    def user_exists(self, username):
-        user = self.get_user(username)
-        return user is not None
+    def user_credentials(self, username):
+        """
+        the id, name and password hash of a user from a single indexed
+        query, without loading the profile. None if there's no such user
+        """
+        session = self._create_session()
+        row = session.query(
+            UserLogin.id, UserLogin.name, UserLogin.token
+        ).filter_by(name=username).first()
+        return UserCredentials(*row) if row is not None else None
 
     def user_validate(self, user, password):
         return user.validate(password)
 
     def user_generate_token(self, user, secret):
-        return user.generate_token(secret)
+        session = self._create_session()
+        token = generate_token(user, secret)
+        session.add(token)
+        session.commit()
+        return token
 
     def user_profile_get(self, user):
-        return user.profile
+        session = self._create_session()
+        return session.query(UserProfile).filter_by(user_id=user.id).one()
 
-    def user_profile_update(self, user, post_data):
-        profile = user.profile
-        profile.update(post_data)
+    def user_profile_update(self, user, changes, version=None):
+        """
+        update the profile with a single ``UPDATE`` setting only the
+        changed columns, when ``version`` is given it only matches the row
+        while the profile is still at that version
+        """
+        changes = profile_changes(changes)
         session = self._create_session()
-        result = session.query(UserProfile).filter_by(id=profile.id)
-        result.update({UserProfile.name: post_data["name"],
-                       UserProfile.gender: post_data["gender"]})
+        query = session.query(UserProfile).filter(
+            UserProfile.user_id == user.id)
+        if version is not None:
+            query = query.filter(UserProfile.version == version)
+        # "evaluate" also applies the changes to a profile the session
+        # already loaded, without querying it
+        matched = query.update(
+            dict(changes, version=UserProfile.version + 1),
+            synchronize_session="evaluate")
+        new_version = None if version is None else version + 1
         session.commit()
+        self.token_cache.invalidate_user(user.name)
+        if version is None:
+            self.profile_versions.pop(user.id)
+            return None
+        if matched == 0:
+            self.profile_versions.pop(user.id)
+            raise VersionConflict([user.name])
+        self._profile_version_set(user.id, new_version)
+        return new_version
+
+    def user_profiles_update(self, updates):
+        """
+        update many profiles in one transaction, one query reading the
+        current versions and one ``UPDATE`` executed for all the profiles
+        changing the same set of fields
+        """
+        updates = profile_updates(updates)
+        table = UserProfile.__table__
+        session = self._create_session()
+        rows = session.execute(
+            select([UserLogin.id, UserLogin.name, table.c.version])
+            .select_from(UserLogin.__table__.join(
+                table, table.c.user_id == UserLogin.id))
+            .where(UserLogin.name.in_(list(updates)))
+        ).fetchall()
+        current = {name: (user_id, version) for user_id, name, version in rows}
+        unknown = sorted(set(updates) - set(current))
+        if unknown:
+            session.rollback()
+            raise ValueError(f"unknown users {', '.join(unknown)}")
+        conflicts = [
+            name for name, (_, version) in updates.items()
+            if version is not None and version != current[name][1]
+        ]
+        if conflicts:
+            session.rollback()
+            raise VersionConflict(conflicts)
+
+        groups = {}
+        for name, (changes, _) in updates.items():
+            groups.setdefault(tuple(sorted(changes)), []).append(name)
+        for fields, names in groups.items():
+            statement = table.update().where(and_(
+                table.c.user_id == bindparam("key_user_id"),
+                table.c.version == bindparam("key_version"),
+            )).values(dict(
+                {field: bindparam(field) for field in fields},
+                version=table.c.version + 1,
+            ))
+            result = session.execute(statement, [
+                dict(updates[name][0], key_user_id=current[name][0],
+                     key_version=current[name][1])
+                for name in names
+            ])
+            if result.rowcount != len(names):
+                # a profile changed between reading and writing it
+                session.rollback()
+                raise VersionConflict(names)
+        session.commit()
+        for instance in session.identity_map.values():
+            if isinstance(instance, UserProfile):
+                session.expire(instance)
+
+        versions = {}
+        for name in updates:
+            user_id, version = current[name]
+            self._profile_version_set(user_id, version + 1)
+            self.token_cache.invalidate_user(name)
+            versions[name] = version + 1
+        return versions
+
+    def user_profile_version(self, user):
+        """
+        the version of the user's profile, cached for
+        ``profile_version_ttl`` seconds so conditional requests answered
+        from the cache don't touch the database
+        """
+        version = self.profile_versions.get(user.id)
+        if version is None:
+            session = self._create_session()
+            version = session.query(UserProfile.version).filter_by(
+                user_id=user.id).scalar()
+            self._profile_version_set(user.id, version)
+        return version
+
+    def _profile_version_set(self, user_id, version):
+        self.profile_versions.set(
+            user_id, version,
+            expires_at=time.time() + self.profile_version_ttl)
 
     def user_from_token(self, token, secret):
-        payload = jwt.decode(token, secret, algorithms=["HS256"])
-        user = payload["user"]
-        return self.user_get(user)
+        """
+        return a ``UserSnapshot`` for a valid token, or None
+
+        Verified tokens are cached until they expire, a cache hit skips
+        both the signature check and the user lookup.
+        """
+        verified = self.token_cache.get_verified(token)
+        if verified is not None:
+            if self.revoked.is_revoked(verified.claims["jti"]):
+                return None
+            return verified.user
+        try:
+            with timed("jwt_decode"):
+                payload = jwt.decode(token, secret, algorithms=["HS256"])
+        except jwt.InvalidTokenError:
+            return None
+        # tokens issued before revocation existed are rejected
+        if "jti" not in payload or self.revoked.is_revoked(payload["jti"]):
+            return None
+        user = self.user_get(payload["user"])
+        if user is None:
+            return None
+        snapshot = user.snapshot()
+        self.token_cache.set_verified(token, payload, snapshot)
+        return snapshot
+
+    def token_revoke(self, token, secret):
+        """
+        revoke a single valid token, returns False for an invalid one
+        """
+        try:
+            payload = jwt.decode(token, secret, algorithms=["HS256"])
+        except jwt.InvalidTokenError:
+            return False
+        jti = payload.get("jti")
+        if jti is None:
+            return False
+        table = Token.__table__
+        session = self._create_session()
+        session.execute(
+            table.update()
+            .where(and_(table.c.jti == jti, table.c.revoked_at.is_(None)))
+            .values(revoked_at=utcnow())
+        )
+        session.commit()
+        self.revoked.add(jti, payload["exp"])
+        self.token_cache.pop(token)
+        return True
+
+    def user_tokens_revoke(self, user):
+        """
+        revoke every unexpired token of a user, returns how many
+        """
+        table = Token.__table__
+        now = utcnow()
+        live = and_(table.c.user_id == user.id,
+                    table.c.revoked_at.is_(None),
+                    table.c.expires_on > now)
+        session = self._create_session()
+        tokens = session.execute(
+            select([table.c.jti, table.c.expires_on]).where(live)).fetchall()
+        if tokens:
+            session.execute(table.update().where(
+                table.c.jti.in_([jti for jti, _ in tokens])
+            ).values(revoked_at=now))
+            session.commit()
+        for jti, expires_on in tokens:
+            self.revoked.add(jti, to_unix(expires_on))
+        self.token_cache.invalidate_user(user.name)
+        return len(tokens)
+
+    def _revoked_since(self, since):
+        table = Token.__table__
+        query = select([table.c.jti, table.c.expires_on]).where(
+            and_(table.c.revoked_at.isnot(None),
+                 table.c.expires_on > utcnow()))
+        if since is not None:
+            query = query.where(table.c.revoked_at >= from_unix(since))
+        # on a connection of its own, a sync doesn't end the transaction
+        # of the request it happens in
+        with self.engine.connect() as connection:
+            rows = connection.execute(query).fetchall()
+        return [(jti, to_unix(expires_on)) for jti, expires_on in rows]
+
+    def _tokens_compact(self, now):
+        table = Token.__table__
+        with self.engine.begin() as connection:
+            connection.execute(
+                table.delete().where(table.c.expires_on <= from_unix(now)))
+
+    @property
+    def food_index(self):
+        self._catalog_check()
+        if self._food_index is None:
+            self.food_index_rebuild()
+        return self._food_index
+
+    def user_meals_add(self, user, meals):
+        """
+        log a batch of meals for a user in a single transaction
+
+        ``meals`` is a list of dicts in the ``UserFoodItem.to_dict`` format
+        with ``logged_at`` already a datetime. The rows go to the database
+        as one executemany insert and the user's daily totals are updated
+        in the same transaction. Raises ValueError for an unknown food id.
+        """
+        if not meals:
+            return 0
+        try:
+            return self._user_meals_add(user, meals)
+        except IntegrityError:
+            # another request created one of the same days or food counts
+            # first, the second attempt updates it instead
+            self._create_session().rollback()
+            return self._user_meals_add(user, meals)
+
+    def _user_meals_add(self, user, meals):
+        session = self._create_session()
+        food_ids = {meal["food_id"] for meal in meals} - {None}
+        foods = {}
+        if food_ids:
+            query = session.query(FoodFact).filter(
+                FoodFact.foodid.in_(food_ids))
+            foods = {food.foodid: food.to_dict() for food in query}
+        unknown = food_ids - set(foods)
+        if unknown:
+            raise ValueError(f"unknown food_id {min(unknown)}")
+
+        rows = [
+            {
+                "user_id": user.id,
+                "foodid": meal.get("food_id"),
+                "logged_at": meal["logged_at"],
+                "servings": meal.get("servings", 1),
+                "name": meal.get("name"),
+                "fat_in_grams": meal.get("fat_in_grams"),
+                "carbs_in_grams": meal.get("carbs_in_grams"),
+                "protein_in_grams": meal.get("protein_in_grams"),
+                "calories": meal.get("calories"),
+            }
+            for meal in meals
+        ]
+        session.execute(UserFoodItem.__table__.insert(), rows)
+        self._daily_totals_add(session, user, daily_totals(meals, foods))
+        self._food_picks_add(session, [row["foodid"] for row in rows])
+        session.commit()
+        return len(rows)
+
+    def _food_picks_add(self, session, food_ids):
+        table = FoodPicks.__table__
+        picks = {}
+        for foodid in food_ids:
+            if foodid is not None:
+                picks[foodid] = picks.get(foodid, 0) + 1
+        if not picks:
+            return
+        existing = {
+            foodid for foodid, in session.execute(
+                select([table.c.foodid]).where(table.c.foodid.in_(picks)))
+        }
+        updates = [
+            {"key_foodid": foodid, "add_picks": count}
+            for foodid, count in picks.items() if foodid in existing
+        ]
+        inserts = [
+            {"foodid": foodid, "picks": count}
+            for foodid, count in picks.items() if foodid not in existing
+        ]
+        if updates:
+            # increment in the database so concurrent writers add up
+            session.execute(table.update().where(
+                table.c.foodid == bindparam("key_foodid")
+            ).values(picks=table.c.picks + bindparam("add_picks")), updates)
+        if inserts:
+            session.execute(table.insert(), inserts)
+
+    def _daily_totals_add(self, session, user, totals):
+        table = UserDailyNutrition.__table__
+        columns = UserDailyNutrition.nutrient_columns
+        existing = {
+            day for day, in session.query(UserDailyNutrition.day).filter(
+                UserDailyNutrition.user_id == user.id,
+                UserDailyNutrition.day.in_(totals))
+        }
+        rows = [
+            dict(zip(columns, values), meals=values[-1],
+                 user_id=user.id, day=day)
+            for day, values in totals.items()
+        ]
+        updates = [row for row in rows if row["day"] in existing]
+        inserts = [row for row in rows if row["day"] not in existing]
+        if updates:
+            # increment in the database so concurrent writers add up
+            statement = table.update().where(and_(
+                table.c.user_id == bindparam("key_user_id"),
+                table.c.day == bindparam("key_day"),
+            )).values({
+                column: table.c[column] + bindparam(f"add_{column}")
+                for column in columns + ("meals",)
+            })
+            session.execute(statement, [
+                dict(
+                    {f"add_{c}": row[c] for c in columns + ("meals",)},
+                    key_user_id=row["user_id"], key_day=row["day"]
+                )
+                for row in updates
+            ])
+        if inserts:
+            session.execute(table.insert(), inserts)
+
+    def user_metrics_add(self, user, samples):
+        """
+        merge samples into their day chunks, reading the chunks a batch
+        touches with one query and writing them back with one
+        ``executemany`` per update and insert. A chunk that another
+        writer changed meanwhile fails the batch, which is retried
+        """
+        days = day_samples(samples)
+        session = self._create_session()
+        for _ in range(METRIC_WRITE_ATTEMPTS):
+            try:
+                written = self._metric_days_add(session, user, days)
+            except IntegrityError:
+                written = False
+            if written:
+                session.commit()
+                return len(samples)
+            session.rollback()
+        raise RuntimeError("metric chunks kept changing while writing them")
+
+    def _metric_days_add(self, session, user, days):
+        table = UserMetricDay.__table__
+        if not days:
+            return True
+        rows = session.execute(select([table]).where(and_(
+            table.c.user_id == user.id,
+            table.c.metric.in_({metric for metric, _ in days}),
+            table.c.day.in_({day for _, day in days}),
+        ))).fetchall()
+        existing = {(row.metric, row.day): row for row in rows}
+        updates, inserts = [], []
+        for (metric, day), samples in days.items():
+            row = existing.get((metric, day))
+            if row is None:
+                chunk = MetricDay(day)
+            else:
+                chunk = MetricDay.from_bytes(
+                    day, row.sample_times, row.sample_values)
+            chunk = chunk.merged(samples)
+            times, values, hours = chunk.to_bytes()
+            columns = dict(
+                count=chunk.count, total=chunk.total,
+                minimum=chunk.minimum, maximum=chunk.maximum,
+                hours=hours, sample_times=times, sample_values=values)
+            if row is None:
+                inserts.append(dict(
+                    columns, user_id=user.id, metric=metric, day=day))
+            else:
+                updates.append(dict(
+                    {f"new_{column}": v for column, v in columns.items()},
+                    key_metric=metric, key_day=day, key_count=row.count))
+        if updates:
+            statement = table.update().where(and_(
+                table.c.user_id == user.id,
+                table.c.metric == bindparam("key_metric"),
+                table.c.day == bindparam("key_day"),
+                table.c.count == bindparam("key_count"),
+            )).values({
+                column: bindparam(f"new_{column}")
+                for column in ("count", "total", "minimum", "maximum",
+                               "hours", "sample_times", "sample_values")
+            })
+            result = session.execute(statement, updates)
+            if result.rowcount != len(updates):
+                return False
+        if inserts:
+            session.execute(table.insert(), inserts)
+        return True
+
+    def user_metric_days(self, user, metric, start, end, resolution="raw"):
+        """
+        the chunks of the days in ``[start, end)`` from one range read of
+        the primary key, loading the samples only for ``raw`` series and
+        the hourly buckets only for ``hour`` ones
+        """
+        table = UserMetricDay.__table__
+        columns = [table.c.day, table.c.count, table.c.total,
+                   table.c.minimum, table.c.maximum]
+        if resolution == "hour":
+            columns.append(table.c.hours)
+        elif resolution == "raw":
+            columns += [table.c.sample_times.label("times"),
+                        table.c.sample_values.label("values")]
+        rows = self._create_session().execute(
+            select(columns).where(and_(
+                table.c.user_id == user.id,
+                table.c.metric == metric,
+                table.c.day >= start,
+                table.c.day < end,
+            )).order_by(table.c.day)
+        )
+        return [MetricDay.from_bytes(**dict(row.items())) for row in rows]
+
+    def user_daily_nutrition(self, user, start, end):
+        """
+        a user's daily totals for every day in ``[start, end)``, days
+        without meals are zero
+        """
+        session = self._create_session()
+        rows = session.query(UserDailyNutrition).filter(
+            UserDailyNutrition.user_id == user.id,
+            UserDailyNutrition.day >= start,
+            UserDailyNutrition.day < end,
+        )
+        found = {row.day: row.to_dict() for row in rows}
+        days = []
+        day = start
+        while day < end:
+            empty = dict.fromkeys(NUTRIENTS, 0.0)
+            empty.update(day=day.isoformat(), num_meals=0)
+            days.append(found.get(day, empty))
+            day += timedelta(days=1)
+        return days
+
+    def user_meals_get(self, user, start=None, end=None, limit=100):
+        """
+        a user's meals logged in ``[start, end)``, oldest first
+        """
+        session = self._create_session()
+        meals = session.query(UserFoodItem).filter_by(user_id=user.id)
+        if start is not None:
+            meals = meals.filter(UserFoodItem.logged_at >= start)
+        if end is not None:
+            meals = meals.filter(UserFoodItem.logged_at < end)
+        meals = meals.order_by(UserFoodItem.logged_at, UserFoodItem.id)
+        return [meal.to_dict() for meal in meals.limit(limit)]
+
+    def user_meals_export(self, user, start=None, end=None, after=None,
+                          batch_size=1000):
+        """
+        a generator of a user's meals read from a server side cursor,
+        ``batch_size`` rows at a time
+
+        The generator reads on a connection of its own, it keeps working
+        after the request's session is gone and releases the connection
+        when it's exhausted or closed.
+        """
+        table = UserFoodItem.__table__
+        condition = table.c.user_id == user.id
+        if start is not None:
+            condition = and_(condition, table.c.logged_at >= start)
+        if end is not None:
+            condition = and_(condition, table.c.logged_at < end)
+        if after is not None:
+            logged_at = self._create_session().execute(
+                select([table.c.logged_at]).where(and_(
+                    table.c.user_id == user.id, table.c.id == after))
+            ).scalar()
+            if logged_at is None:
+                raise ValueError(f"unknown meal id {after}")
+            condition = and_(condition, or_(
+                table.c.logged_at > logged_at,
+                and_(table.c.logged_at == logged_at, table.c.id > after)))
+        query = select([table]).where(condition).order_by(
+            table.c.logged_at, table.c.id)
+        return self._meals_stream(query, batch_size)
 
-    def food_item_find_closest_match(self, name, max_results):
+    def _meals_stream(self, query, batch_size):
+        with self.engine.connect() as connection:
+            # what Query.yield_per sets, rows are fetched as they're read
+            # instead of all at once where the driver supports it
+            result = connection.execution_options(
+                stream_results=True).execute(query)
+            while True:
+                rows = result.fetchmany(batch_size)
+                if not rows:
+                    return
+                for row in rows:
+                    # rows have the attributes to_dict reads
+                    yield UserFoodItem.to_dict(row)
+
+    @property
+    def nutrient_store(self):
+        self._catalog_check()
+        if self._nutrient_store is None:
+            self.food_index_rebuild()
+        return self._nutrient_store
+
+    def food_records(self):
+        """
+        ``(foodid, FoodFact.to_dict)`` pairs of the food table in food id
+        order
+        """
         session = self._create_session()
-        # Check for exact match first
-        food = session.query(FoodFact).filter_by(foodname=name).one_or_none()
-        return [food.to_dict()]
+        foods = session.query(FoodFact).order_by(FoodFact.foodid)
+        return [(food.foodid, food.to_dict()) for food in foods]
+
+    def food_index_rebuild(self):
+        """
+        reload the search index and nutrient store from the food table,
+        or from the catalog file with ``catalog_path``
+
+        Call after the food table changes, a replaced catalog file is
+        picked up within ``catalog_check_interval`` seconds without. The
+        new structures are built before they replace the old ones, so
+        searches running concurrently keep using the previous ones until
+        the swap.
+        """
+        if self.catalog_path is not None:
+            return self._catalog_load()
+        foods = self.food_records()
+        # numpy only loads with the first catalog
+        from idiet.tracking.nutrients import NutrientStore
+
+        food_index = FoodIndex(foods)
+        nutrient_store = NutrientStore(foods)
+        self._catalog_version = nutrient_store.digest()
+        if self._autocomplete_index is not None:
+            # only rebuilt once it's used, carrying the popularity over
+            self._autocomplete_index = PrefixIndex(
+                foods, self._autocomplete_index.popularity)
+        self._food_index = food_index
+        self._nutrient_store = nutrient_store
+        return food_index
+
+    def _catalog_load(self):
+        from idiet.tracking.catalog import Catalog
+        from idiet.tracking.nutrients import NutrientStore
+
+        catalog = Catalog(self.catalog_path)
+        food_index = FoodIndex.from_catalog(catalog)
+        nutrient_store = NutrientStore.from_catalog(catalog)
+        self._catalog_version = catalog.digest
+        if self._autocomplete_index is not None:
+            self._autocomplete_index = PrefixIndex.from_catalog(
+                catalog, self._autocomplete_index.popularity)
+        self._catalog = catalog
+        self._food_index = food_index
+        self._nutrient_store = nutrient_store
+        return food_index
+
+    def _catalog_check(self):
+        # another process moved a new catalog file in place, the old
+        # mapping is released once the searches using it are done
+        now = time.monotonic()
+        if self._catalog is None or now < self._next_catalog_check:
+            return
+        self._next_catalog_check = now + self.catalog_check_interval
+        if self._catalog.replaced():
+            self.food_index_rebuild()
+
+    @property
+    def autocomplete_index(self):
+        self._catalog_check()
+        if self._autocomplete_index is None:
+            food_index = self.food_index
+            if self._catalog is not None:
+                self._autocomplete_index = PrefixIndex.from_catalog(
+                    self._catalog)
+            else:
+                self._autocomplete_index = PrefixIndex(
+                    zip(food_index.ids, food_index.records))
+        return self._autocomplete_index
+
+    def food_autocomplete(self, prefix, max_results=10):
+        return self.autocomplete_index.complete(prefix, max_results)
+
+    def food_popularity(self):
+        """
+        how many meals were logged of each food, from the counts kept up
+        to date as meals are logged
+        """
+        table = FoodPicks.__table__
+        rows = self._create_session().execute(
+            select([table.c.foodid, table.c.picks])).fetchall()
+        return dict(rows)
+
+    def food_catalog_version(self):
+        """
+        a digest of the loaded food records, the same in every server
+        process that loaded the same table
+        """
+        self._catalog_check()
+        if self._nutrient_store is None:
+            self.food_index_rebuild()
+        return self._catalog_version
+
+    def food_page_by_name(self, name, max_results, after=None):
+        matches = self.food_index.search_page(
+            name, max_results=max_results, after=after)
+        return [(key, record) for key, _, record in matches]
+
+    def food_page_by_nutrients(self, group=None, ranges=None, sort=None,
+                               descending=True, max_results=10, after=None):
+        """
+        foods matching nutrient ranges, see ``NutrientStore.query_page``
+        """
+        matches = self.nutrient_store.query_page(
+            group=group, ranges=ranges, sort=sort, descending=descending,
+            max_results=max_results, after=after
+        )
+        return [(key, record) for key, _, record in matches]
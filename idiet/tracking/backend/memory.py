@@ -0,0 +1,386 @@
+"""
+a backend keeping everything in dicts of the process
+
+Nothing is persisted or shared between server processes. It's meant for
+tests and for a single process serving a catalog loaded at start up.
+"""
+from datetime import timedelta
+import itertools
+import threading
+
+import jwt
+
+from idiet.tracking.autocomplete import PrefixIndex
+from idiet.tracking.backend.core import Backend, NUTRIENTS, PROFILE_FIELDS
+from idiet.tracking.backend.core import UserCredentials, UserSnapshot
+from idiet.tracking.backend.core import VersionConflict, daily_totals
+from idiet.tracking.backend.core import issue_token, profile_changes
+from idiet.tracking.backend.core import profile_updates
+from idiet.tracking.encrypt import hash_password, check_password_hash
+from idiet.tracking.metrics import timed
+from idiet.tracking.search import FoodIndex
+from idiet.tracking.timeseries import MetricDay, day_samples
+from idiet.tracking.timestamp import utcnow, to_unix
+
+
+class MemoryProfile:
+    """
+    a profile, ``fields`` holds the ``PROFILE_FIELDS`` values
+    """
+
+    __slots__ = ("fields", "member_since", "version")
+
+    def __init__(self, member_since):
+        self.fields = dict.fromkeys(PROFILE_FIELDS)
+        self.member_since = member_since
+        self.version = 1
+
+    def to_dict(self):
+        return dict(self.fields, member_since=self.member_since)
+
+
+class MemoryUser:
+    """
+    a user, ``token`` is the password hash as on ``UserLogin``
+    """
+
+    __slots__ = ("id", "name", "token", "profile", "meals", "days",
+                 "tokens", "metrics")
+
+    def __init__(self, id, name, password_hash, member_since):
+        self.id = id
+        self.name = name
+        self.token = password_hash
+        self.profile = MemoryProfile(member_since)
+        # meal dicts in UserFoodItem.to_dict format, in insertion order
+        self.meals = []
+        # {day: [*NUTRIENTS, number of meals]}
+        self.days = {}
+        # {jti: unix expiry} of issued tokens
+        self.tokens = {}
+        # {metric: {day: MetricDay}}
+        self.metrics = {}
+
+    def __eq__(self, other):
+        return self.name == other.name
+
+    def validate(self, password):
+        return check_password_hash(self.token, password)
+
+    def snapshot(self):
+        return UserSnapshot(self.id, self.name)
+
+
+class MemoryBackend(Backend):
+    """
+    ``Backend`` storing users, meals and foods in memory
+
+    Parameters
+    ----------
+    foods:
+        iterable of ``FoodFact.to_dict`` records to start the food catalog
+        with
+    """
+
+    def __init__(self, foods=()):
+        self.users = {}
+        self.foods = {}
+        self.revoked = {}
+        self._compact_at = 1024
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._food_index = None
+        self._nutrient_store = None
+        self._catalog_version = None
+        self._autocomplete_index = None
+        self._popularity = {}
+        # {foodid: meals logged of it}
+        self._picks = {}
+        self._next_foodid = 1
+        self.food_add(foods)
+
+    def add_user(self, username, password):
+        password_hash = hash_password(password)
+        with self._lock:
+            if username in self.users:
+                return None
+            user = MemoryUser(next(self._ids), username, password_hash,
+                              utcnow().date())
+            self.users[username] = user
+        return user
+
+    user_add = add_user
+
+    def get_user(self, username):
+        return self.users.get(username)
+
+    user_get = get_user
+
+    def user_credentials(self, username):
+        user = self.users.get(username)
+        if user is None:
+            return None
+        return UserCredentials(user.id, user.name, user.token)
+
+    def user_generate_token(self, user, secret):
+        token = issue_token(user, secret)
+        self.users[user.name].tokens[token.jti] = to_unix(token.expires_on)
+        return token
+
+    def user_from_token(self, token, secret):
+        try:
+            with timed("jwt_decode"):
+                payload = jwt.decode(token, secret, algorithms=["HS256"])
+        except jwt.InvalidTokenError:
+            return None
+        if payload.get("jti") is None or payload["jti"] in self.revoked:
+            return None
+        user = self.users.get(payload["user"])
+        return user.snapshot() if user is not None else None
+
+    def token_revoke(self, token, secret):
+        try:
+            payload = jwt.decode(token, secret, algorithms=["HS256"])
+        except jwt.InvalidTokenError:
+            return False
+        if payload.get("jti") is None:
+            return False
+        self._revoke(payload["jti"], payload["exp"])
+        return True
+
+    def user_tokens_revoke(self, user):
+        now = to_unix(utcnow())
+        revoked = 0
+        for jti, expires_at in list(self.users[user.name].tokens.items()):
+            if expires_at > now and jti not in self.revoked:
+                self._revoke(jti, expires_at)
+                revoked += 1
+        return revoked
+
+    def _revoke(self, jti, expires_at):
+        with self._lock:
+            self.revoked[jti] = expires_at
+            if len(self.revoked) >= self._compact_at:
+                now = to_unix(utcnow())
+                self.revoked = {
+                    jti: expires_at
+                    for jti, expires_at in self.revoked.items()
+                    if expires_at > now
+                }
+                self._compact_at = max(1024, 2 * len(self.revoked))
+
+    def user_profile_get(self, user):
+        return self.users[user.name].profile
+
+    def user_profile_update(self, user, changes, version=None):
+        changes = profile_changes(changes)
+        profile = self.users[user.name].profile
+        with self._lock:
+            if version is not None and version != profile.version:
+                raise VersionConflict([user.name])
+            profile.fields.update(changes)
+            profile.version += 1
+            current = profile.version
+        return current if version is not None else None
+
+    def user_profiles_update(self, updates):
+        updates = profile_updates(updates)
+        unknown = sorted(set(updates) - set(self.users))
+        if unknown:
+            raise ValueError(f"unknown users {', '.join(unknown)}")
+        versions = {}
+        with self._lock:
+            profiles = {name: self.users[name].profile for name in updates}
+            conflicts = [
+                name for name, (_, version) in updates.items()
+                if version is not None and version != profiles[name].version
+            ]
+            if conflicts:
+                raise VersionConflict(conflicts)
+            for name, (changes, _) in updates.items():
+                profiles[name].fields.update(changes)
+                profiles[name].version += 1
+                versions[name] = profiles[name].version
+        return versions
+
+    def user_profile_version(self, user):
+        return self.users[user.name].profile.version
+
+    def user_meals_add(self, user, meals):
+        if not meals:
+            return 0
+        food_ids = {meal["food_id"] for meal in meals} - {None}
+        unknown = food_ids - set(self.foods)
+        if unknown:
+            raise ValueError(f"unknown food_id {min(unknown)}")
+        record = self.users[user.name]
+        foods = {foodid: self.foods[foodid] for foodid in food_ids}
+        with self._lock:
+            for meal in meals:
+                record.meals.append({
+                    "id": next(self._ids),
+                    "food_id": meal.get("food_id"),
+                    "name": meal.get("name"),
+                    "servings": meal.get("servings", 1),
+                    "logged_at": meal["logged_at"],
+                    "fat_in_grams": meal.get("fat_in_grams"),
+                    "carbs_in_grams": meal.get("carbs_in_grams"),
+                    "protein_in_grams": meal.get("protein_in_grams"),
+                    "calories": meal.get("calories"),
+                })
+                foodid = meal.get("food_id")
+                if foodid is not None:
+                    self._picks[foodid] = self._picks.get(foodid, 0) + 1
+            for day, values in daily_totals(meals, foods).items():
+                totals = record.days.setdefault(day, [0.0] * len(values))
+                for i, value in enumerate(values):
+                    totals[i] += value
+        return len(meals)
+
+    def user_meals_get(self, user, start=None, end=None, limit=100):
+        meals = [
+            dict(meal) for meal in self.users[user.name].meals
+            if (start is None or meal["logged_at"] >= start)
+            and (end is None or meal["logged_at"] < end)
+        ]
+        meals.sort(key=lambda meal: (meal["logged_at"], meal["id"]))
+        return meals[:limit]
+
+    def user_meals_export(self, user, start=None, end=None, after=None,
+                          batch_size=1000):
+        meals = self.users[user.name].meals
+        key = None
+        if after is not None:
+            found = [meal for meal in meals if meal["id"] == after]
+            if not found:
+                raise ValueError(f"unknown meal id {after}")
+            key = (found[0]["logged_at"], after)
+        return self._meals_stream(meals, start, end, key)
+
+    def _meals_stream(self, meals, start, end, key):
+        # sorts references to the meals once when the stream starts, like
+        # the sql backend's cursor selects its rows, and copies each meal
+        # only as it's read
+        def order(meal):
+            return meal["logged_at"], meal["id"]
+
+        selected = sorted((
+            meal for meal in meals
+            if (start is None or meal["logged_at"] >= start)
+            and (end is None or meal["logged_at"] < end)
+            and (key is None or order(meal) > key)
+        ), key=order)
+        for meal in selected:
+            yield dict(meal)
+
+    def user_daily_nutrition(self, user, start, end):
+        found = self.users[user.name].days
+        days = []
+        day = start
+        while day < end:
+            totals = found.get(day)
+            if totals is None:
+                totals = [0.0] * len(NUTRIENTS) + [0]
+            entry = dict(zip(NUTRIENTS, totals))
+            entry.update(day=day.isoformat(), num_meals=int(totals[-1]))
+            days.append(entry)
+            day += timedelta(days=1)
+        return days
+
+    def user_metrics_add(self, user, samples):
+        metrics = self.users[user.name].metrics
+        with self._lock:
+            for (metric, day), added in day_samples(samples).items():
+                chunks = metrics.setdefault(metric, {})
+                chunk = chunks.get(day) or MetricDay(day)
+                chunks[day] = chunk.merged(added)
+        return len(samples)
+
+    def user_metric_days(self, user, metric, start, end, resolution="raw"):
+        with self._lock:
+            chunks = dict(self.users[user.name].metrics.get(metric, {}))
+        return [chunks[day] for day in sorted(chunks) if start <= day < end]
+
+    def food_add(self, foods):
+        """
+        add ``FoodFact.to_dict`` records to the catalog, records with a
+        ``foodid`` replace the food with that id
+        """
+        added = 0
+        with self._lock:
+            for food in foods:
+                food = dict(food)
+                foodid = food.pop("foodid", None)
+                if foodid is None:
+                    foodid = self._next_foodid
+                self._next_foodid = max(self._next_foodid, foodid + 1)
+                self.foods[foodid] = food
+                added += 1
+            if added:
+                self._food_index = None
+                self._nutrient_store = None
+                if self._autocomplete_index is not None:
+                    # rebuilt when it's next used, ranked as it was
+                    self._popularity = self._autocomplete_index.popularity
+                    self._autocomplete_index = None
+        return added
+
+    @property
+    def food_index(self):
+        if self._food_index is None:
+            self.food_index_rebuild()
+        return self._food_index
+
+    @property
+    def nutrient_store(self):
+        if self._nutrient_store is None:
+            self.food_index_rebuild()
+        return self._nutrient_store
+
+    def food_index_rebuild(self):
+        foods = sorted(self.foods.items())
+        # numpy only loads with the first catalog
+        from idiet.tracking.nutrients import NutrientStore
+
+        food_index = FoodIndex(foods)
+        nutrient_store = NutrientStore(foods)
+        self._catalog_version = nutrient_store.digest()
+        if self._autocomplete_index is not None:
+            self._autocomplete_index = PrefixIndex(
+                foods, self._autocomplete_index.popularity)
+        self._nutrient_store = nutrient_store
+        self._food_index = food_index
+        return food_index
+
+    @property
+    def autocomplete_index(self):
+        if self._autocomplete_index is None:
+            food_index = self.food_index
+            self._autocomplete_index = PrefixIndex(
+                zip(food_index.ids, food_index.records), self._popularity)
+        return self._autocomplete_index
+
+    def food_autocomplete(self, prefix, max_results=10):
+        return self.autocomplete_index.complete(prefix, max_results)
+
+    def food_popularity(self):
+        with self._lock:
+            return dict(self._picks)
+
+    def food_catalog_version(self):
+        if self._nutrient_store is None:
+            self.food_index_rebuild()
+        return self._catalog_version
+
+    def food_page_by_name(self, name, max_results, after=None):
+        matches = self.food_index.search_page(
+            name, max_results=max_results, after=after)
+        return [(key, record) for key, _, record in matches]
+
+    def food_page_by_nutrients(self, group=None, ranges=None, sort=None,
+                               descending=True, max_results=10, after=None):
+        matches = self.nutrient_store.query_page(
+            group=group, ranges=ranges, sort=sort, descending=descending,
+            max_results=max_results, after=after
+        )
+        return [(key, record) for key, _, record in matches]
@@ -0,0 +1,196 @@
+from collections import OrderedDict
+import sys
+import threading
+import time
+
+
+class LRUCache:
+    """
+    bounded least recently used cache with per entry expiry
+
+    The cache is bounded by the estimated size of its entries rather than
+    their count, ``sizeof`` is called once per entry when it's stored.
+    Entries past their ``expires_at`` are dropped when they're read.
+
+    Parameters
+    ----------
+    max_size:
+        size budget in bytes, a budget of 0 disables the cache
+    sizeof:
+        estimates the size of a ``(key, value)`` pair in bytes
+    clock:
+        returns the current unix time, the clock ``expires_at`` is
+        compared against
+    """
+
+    def __init__(self, max_size, sizeof=None, clock=time.time):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._sizeof = sizeof or _sizeof
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at, _ = entry
+                if expires_at is None or expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+            self.misses += 1
+            return default
+
+    def set(self, key, value, expires_at=None):
+        size = self._sizeof(key, value)
+        if size > self.max_size:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires_at, size)
+            self.size += size
+            self._added(key, value)
+            while self.size > self.max_size:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            return self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "size": self.size,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _remove(self, key):
+        value, _, size = self._entries.pop(key)
+        self.size -= size
+        self._removed(key, value)
+        return value
+
+    def _added(self, key, value):
+        """
+        called with the lock held after an entry is stored
+        """
+
+    def _removed(self, key, value):
+        """
+        called with the lock held after an entry is dropped for any reason
+        """
+
+
+def _sizeof(key, value):
+    return sys.getsizeof(key) + sys.getsizeof(value)
+
+
+class VerifiedToken:
+    """
+    a token that passed signature and expiry checks
+    """
+
+    __slots__ = ("claims", "user")
+
+    def __init__(self, claims, user):
+        self.claims = claims
+        self.user = user
+
+
+class TokenCache(LRUCache):
+    """
+    verified jwt tokens keyed by the raw token
+
+    Entries expire at the token's ``exp`` claim, so a cached token is
+    never accepted for longer than decoding it would have been. Tokens
+    are also indexed by user name so every token of a user can be dropped
+    when the user changes.
+    """
+
+    def __init__(self, max_size=4 * 1024 * 1024, clock=time.time):
+        super().__init__(max_size, sizeof=self._token_size, clock=clock)
+        self._by_user = {}
+
+    def get_verified(self, token):
+        return self.get(token)
+
+    def set_verified(self, token, claims, user):
+        self.set(token, VerifiedToken(claims, user),
+                 expires_at=claims.get("exp"))
+
+    def invalidate_user(self, name):
+        with self._lock:
+            for token in list(self._by_user.get(name, ())):
+                self._remove(token)
+
+    def _added(self, key, value):
+        self._by_user.setdefault(value.user.name, set()).add(key)
+
+    def _removed(self, key, value):
+        tokens = self._by_user.get(value.user.name)
+        if tokens is not None:
+            tokens.discard(key)
+            if not tokens:
+                del self._by_user[value.user.name]
+
+    @staticmethod
+    def _token_size(token, verified):
+        return (
+            sys.getsizeof(token)
+            + sys.getsizeof(verified.claims)
+            + sys.getsizeof(verified.user)
+            + sys.getsizeof(verified.user.name)
+        )
+
+
+class ResponseCache(LRUCache):
+    """
+    rendered response bodies of one version of the data they're read from
+
+    Looking an entry up with a new ``version`` drops every entry of the
+    previous one, e.g. food searches are cached per food catalog version
+    and all go once the catalog is reloaded.
+    """
+
+    def __init__(self, max_size=4 * 1024 * 1024, clock=time.time):
+        super().__init__(max_size, clock=clock)
+        self.version = None
+
+    def get_response(self, version, key):
+        if version != self.version:
+            with self._lock:
+                if version != self.version:
+                    for old in list(self._entries):
+                        self._remove(old)
+                    self.version = version
+        return self.get((version, key))
+
+    def set_response(self, version, key, body):
+        # keyed by version too, a response rendered from a catalog that was
+        # replaced meanwhile is never served for the new one
+        self.set((version, key), body)
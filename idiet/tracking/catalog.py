@@ -0,0 +1,414 @@
+"""
+the food catalog and its search indexes in one memory mapped file
+
+    idiet-tracking-catalog /srv/idiet/catalog.bin \\
+        --db-url sqlite:///idiet-tracking.db
+
+Server processes configured with the file map it read only instead of
+loading the food table. The nutrient columns, the name and group string
+tables, the word and trigram posting lists of ``FoodIndex`` and the
+sorted names and prefix runs of ``PrefixIndex`` are fixed width arrays
+read in place, every process of a host shares the one copy in the page
+cache. Each process still decodes the vocabulary of the food names and
+ranks the foods by popularity, both a few numpy or dict operations per
+food.
+
+The file starts with ``MAGIC``, the length of a JSON header and the
+header, which holds the number of foods, the catalog digest and the
+offset, item format and length of every section. Sections are aligned to
+8 bytes and in the byte order of the host writing the file. A catalog is
+written to a temporary file next to its path and moved over it, readers
+see either the old or the new file, never a partial one, and processes
+still mapping the old one keep reading it until they reload.
+"""
+from array import array
+import argparse
+from collections.abc import Mapping, Sequence
+import json
+import mmap
+import os
+import struct
+import sys
+
+from idiet.tracking.autocomplete import PrefixIndex
+from idiet.tracking.nutrients import COLUMNS, NutrientStore
+from idiet.tracking.search import ALPHABET, FoodIndex, code, trigrams
+
+
+MAGIC = b"IDIETCAT"
+FORMAT_VERSION = 2
+# sections start at multiples of the largest item size
+_ALIGNMENT = 8
+_PREAMBLE = struct.Struct("<8sI")
+
+
+def _aligned(offset):
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def _string_table(strings):
+    # an empty string and None are stored alike
+    data = [(string or "").encode("utf-8") for string in strings]
+    offsets = array("q", [0])
+    for encoded in data:
+        offsets.append(offsets[-1] + len(encoded))
+    return offsets, b"".join(data)
+
+
+def _sections(foods):
+    store = NutrientStore(foods)
+    index = FoodIndex(foods)
+    prefixes = PrefixIndex(foods)
+    positions = {foodid: p for p, (foodid, _) in enumerate(foods)}
+
+    sections = {"ids": array("q", store.ids.tolist())}
+    for column in COLUMNS:
+        sections[f"nutrients.{column}"] = array(
+            "d", store.columns[column].tolist())
+    sections["groups"] = array("i", store.groups.tolist())
+    sections["group_names.offsets"], sections["group_names.data"] = \
+        _string_table(store.group_names)
+    sections["names.offsets"], sections["names.data"] = _string_table(
+        record.get("name") for _, record in foods)
+
+    vocabulary = sorted(index._postings)
+    word_ids = {word: i for i, word in enumerate(vocabulary)}
+    sections["vocabulary.offsets"], sections["vocabulary.data"] = \
+        _string_table(vocabulary)
+    offsets = array("q", [0])
+    postings = array("i")
+    lengths = array("i")
+    for word in vocabulary:
+        postings.extend(index._postings[word])
+        lengths.extend(index._lengths[word])
+        offsets.append(len(postings))
+    sections["postings.offsets"] = offsets
+    sections["postings.positions"] = postings
+    sections["postings.lengths"] = lengths
+    offsets = array("q", [0])
+    food_words = array("i")
+    for words in index._words:
+        food_words.extend(word_ids[word] for word in words)
+        offsets.append(len(food_words))
+    sections["words.offsets"] = offsets
+    sections["words.ids"] = food_words
+    grams = [[] for _ in range(len(ALPHABET) ** 3)]
+    for i, word in enumerate(vocabulary):
+        for gram in trigrams(word):
+            grams[code(gram)].append(i)
+    offsets = array("q", [0])
+    gram_words = array("i")
+    for words in grams:
+        gram_words.extend(words)
+        offsets.append(len(gram_words))
+    sections["grams.offsets"] = offsets
+    sections["grams.words"] = gram_words
+
+    sections["prefix.ids"] = array("q", prefixes.ids.tolist())
+    sections["prefix.positions"] = array(
+        "i", [positions[int(foodid)] for foodid in prefixes.ids])
+    sections["prefix.lengths"] = array("i", prefixes._lengths.tolist())
+    sections["prefix.names.offsets"], sections["prefix.names.data"] = \
+        _string_table(prefixes.names)
+    for length, (starts, ends) in prefixes._runs.items():
+        sections[f"prefix.starts.{length}"] = array("i", starts.tolist())
+        sections[f"prefix.ends.{length}"] = array("i", ends.tolist())
+    sorted_ids, indexes = prefixes._by_id
+    sections["prefix.sorted_ids"] = array("q", sorted_ids.tolist())
+    sections["prefix.sorted_indexes"] = array("i", indexes.tolist())
+    return store.digest(), sections
+
+
+def write_catalog(path, foods):
+    """
+    write a catalog of ``(foodid, record)`` pairs, ``FoodFact.to_dict``
+    records in food id order, to ``path`` and return its digest
+
+    The digest is the ``NutrientStore.digest`` of the foods, the catalog
+    version a server process loading them from the food table reports.
+    """
+    foods = list(foods)
+    digest, sections = _sections(foods)
+    layout = {}
+    offset = 0
+    for name, section in sections.items():
+        typecode = section.typecode if isinstance(section, array) else "B"
+        layout[name] = (offset, typecode, len(section))
+        offset = _aligned(offset + len(section) * struct.calcsize(typecode))
+    header = json.dumps({
+        "version": FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "count": len(foods),
+        "digest": digest,
+        "sections": layout,
+    }).encode("utf-8")
+
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary, "wb") as fd:
+            fd.write(_PREAMBLE.pack(MAGIC, len(header)) + header)
+            fd.write(bytes(_aligned(fd.tell()) - fd.tell()))
+            start = fd.tell()
+            for name, section in sections.items():
+                fd.write(bytes(start + layout[name][0] - fd.tell()))
+                fd.write(section)
+            fd.flush()
+            os.fsync(fd.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    return digest
+
+
+class StringTable(Sequence):
+    """
+    the strings of a string table, decoded when they're read
+    """
+
+    def __init__(self, offsets, data):
+        self._offsets = offsets
+        self._data = data
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        # the offsets raise the IndexError of indexes past the end
+        if i < 0:
+            i += len(self._offsets) - 1
+            if i < 0:
+                raise IndexError("string table index out of range")
+        return str(self._data[self._offsets[i]:self._offsets[i + 1]],
+                   "utf-8")
+
+
+class CatalogRecords(Sequence):
+    """
+    ``FoodFact.to_dict`` records of a catalog, built when they're read
+
+    With ``positions`` the i-th record is the food at ``positions[i]``.
+    """
+
+    def __init__(self, catalog, positions=None):
+        self._catalog = catalog
+        self._positions = positions
+
+    def __len__(self):
+        if self._positions is not None:
+            return len(self._positions)
+        return self._catalog.count
+
+    def __getitem__(self, i):
+        # indexing the sections handles negative and invalid indexes
+        if self._positions is not None:
+            i = self._positions[i]
+        catalog = self._catalog
+        group = catalog.groups[i]
+        record = {
+            "name": catalog.names[i] or None,
+            "group": catalog.group_names[group] if group >= 0 else None,
+        }
+        # in the order of FoodFact.to_dict
+        for column, key in COLUMNS.items():
+            value = catalog.nutrients[column][i]
+            # missing values are stored as NaN
+            record[key] = value if value == value else None
+        return record
+
+
+class _FoodWords(Sequence):
+    # the distinct words of each food name, as vocabulary strings
+
+    def __init__(self, vocabulary, offsets, word_ids):
+        self._vocabulary = vocabulary
+        self._offsets = offsets
+        self._word_ids = word_ids
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, position):
+        vocabulary = self._vocabulary
+        return tuple(
+            vocabulary[i] for i in self._word_ids[
+                self._offsets[position]:self._offsets[position + 1]])
+
+
+class _Postings(Mapping):
+    # {vocabulary word: the slice of a per word array}
+
+    def __init__(self, word_ids, offsets, values):
+        self._word_ids = word_ids
+        self._offsets = offsets
+        self._values = values
+
+    def __len__(self):
+        return len(self._word_ids)
+
+    def __iter__(self):
+        return iter(self._word_ids)
+
+    def __contains__(self, word):
+        return word in self._word_ids
+
+    def __getitem__(self, word):
+        i = self._word_ids[word]
+        return self._values[self._offsets[i]:self._offsets[i + 1]]
+
+
+class _GramPostings(Mapping):
+    # {trigram: the vocabulary words containing it}, trigrams no word
+    # contains are missing
+
+    def __init__(self, vocabulary, offsets, word_ids):
+        self._vocabulary = vocabulary
+        self._offsets = offsets
+        self._word_ids = word_ids
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __iter__(self):
+        offsets = self._offsets
+        for value in range(len(offsets) - 1):
+            if offsets[value] < offsets[value + 1]:
+                yield "".join(
+                    ALPHABET[value // len(ALPHABET) ** power % len(ALPHABET)]
+                    for power in (2, 1, 0))
+
+    def __getitem__(self, gram):
+        if not isinstance(gram, str) or len(gram) != 3:
+            raise KeyError(gram)
+        value = code(gram)
+        start, end = self._offsets[value], self._offsets[value + 1]
+        if start == end:
+            raise KeyError(gram)
+        vocabulary = self._vocabulary
+        return [vocabulary[i] for i in self._word_ids[start:end]]
+
+
+class Catalog:
+    """
+    a catalog file mapped read only
+
+    Sections are read through memoryviews of the mapping, numeric ones
+    index to python ints and floats. The mapping stays open as long as
+    anything built from the catalog is referenced.
+
+    Parameters
+    ----------
+    path:
+        a file written by ``write_catalog``
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fd:
+            self.stat = os.fstat(fd.fileno())
+            self._map = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._map)
+        try:
+            magic, length = _PREAMBLE.unpack_from(self._map)
+        except struct.error:
+            magic = None
+        if magic != MAGIC:
+            raise ValueError(f"{path} isn't a food catalog")
+        header = json.loads(
+            str(view[_PREAMBLE.size:_PREAMBLE.size + length], "utf-8"))
+        if header["version"] != FORMAT_VERSION:
+            raise ValueError(f"{path} has catalog format "
+                             f"{header['version']}, expected "
+                             f"{FORMAT_VERSION}")
+        if header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} was written on a {header['byteorder']}"
+                             f" endian host")
+        start = _aligned(_PREAMBLE.size + length)
+        sections = {}
+        for name, (offset, typecode, count) in header["sections"].items():
+            offset += start
+            size = count * struct.calcsize(typecode)
+            sections[name] = view[offset:offset + size].cast(typecode)
+
+        self.count = header["count"]
+        self.digest = header["digest"]
+        self.ids = sections["ids"]
+        self.groups = sections["groups"]
+        self.nutrients = {
+            column: sections[f"nutrients.{column}"] for column in COLUMNS
+        }
+        self.group_names = list(StringTable(
+            sections["group_names.offsets"], sections["group_names.data"]))
+        self.names = StringTable(
+            sections["names.offsets"], sections["names.data"])
+        self.records = CatalogRecords(self)
+
+        # intern so every lookup shares a single str object per word
+        vocabulary = [
+            sys.intern(word) for word in StringTable(
+                sections["vocabulary.offsets"], sections["vocabulary.data"])
+        ]
+        word_ids = {word: i for i, word in enumerate(vocabulary)}
+        self.postings = _Postings(
+            word_ids, sections["postings.offsets"],
+            sections["postings.positions"])
+        self.posting_lengths = _Postings(
+            word_ids, sections["postings.offsets"],
+            sections["postings.lengths"])
+        self.food_words = _FoodWords(
+            vocabulary, sections["words.offsets"], sections["words.ids"])
+        self.vocabulary_grams = _GramPostings(
+            vocabulary, sections["grams.offsets"], sections["grams.words"])
+
+        self.prefix_ids = sections["prefix.ids"]
+        self.prefix_lengths = sections["prefix.lengths"]
+        self.prefix_names = StringTable(
+            sections["prefix.names.offsets"], sections["prefix.names.data"])
+        self.prefix_records = CatalogRecords(
+            self, sections["prefix.positions"])
+        self.prefix_runs = {
+            length: (sections[f"prefix.starts.{length}"],
+                     sections[f"prefix.ends.{length}"])
+            for length in range(1, PrefixIndex.precomputed_length + 1)
+        }
+        self.prefix_sorted_ids = sections["prefix.sorted_ids"]
+        self.prefix_sorted_indexes = sections["prefix.sorted_indexes"]
+
+    def __len__(self):
+        return self.count
+
+    def replaced(self):
+        """
+        whether another file was moved to ``path`` since it was mapped
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return (stat.st_ino, stat.st_dev, stat.st_mtime_ns) != (
+            self.stat.st_ino, self.stat.st_dev, self.stat.st_mtime_ns)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("path", help="catalog file to write")
+    parser.add_argument(
+        "--db-url", default=os.environ.get("IDIET_TRACKING_DB_URL",
+                                           "sqlite:///idiet-tracking.db"))
+    args = parser.parse_args(argv)
+
+    from idiet.tracking.backend.db import SqlAlchemyBackend
+    from idiet.tracking.backend.db import engine_from_config
+
+    backend = SqlAlchemyBackend(engine_from_config({"url": args.db_url}))
+    foods = backend.init().food_records()
+    backend.close_session()
+    digest = write_catalog(args.path, foods)
+    print(f"wrote {len(foods)} foods to {args.path}, version {digest}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,11 +8,24 @@ import toml
 class Config:
     secret_key = attr.ib()
     db = attr.ib()
+    extra = attr.ib(factory=dict)
 
     @classmethod
     def from_toml(cls, path):
         path = pathlib.Path(path)
         with path.open(mode="rt") as fd:
-            config = toml.loads(fd)
+            config = toml.load(fd)
 
-        return cls(config["app"]["secret-key"], config["db"])
+        app = dict(config.pop("app", {}))
+        secret_key = app.pop("secret-key")
+        db = config.pop("db", {})
+        # anything else, e.g. [password-hashing], is passed through as is
+        return cls(secret_key, db, {**app, **config})
+
+    def to_dict(self):
+        """
+        the config in the format create_app expects
+        """
+        config = dict(self.extra)
+        config.update({"secret-key": self.secret_key, "db": dict(self.db)})
+        return config
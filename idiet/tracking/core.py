@@ -4,9 +4,16 @@ from flask import Flask
 from flask import Blueprint, g, current_app, jsonify, make_response
 from flask_cors import CORS
 from flask_httpauth import HTTPTokenAuth
-from sqlalchemy import create_engine
 
-from idiet.tracking.backend.db import SqlAlchemyBackend
+from idiet.tracking.autocomplete import PopularityUpdater
+from idiet.tracking.backend.db import SqlAlchemyBackend, engine_from_config
+from idiet.tracking.backend.memory import MemoryBackend
+from idiet.tracking.cache import ResponseCache, TokenCache
+from idiet.tracking.config import Config
+from idiet.tracking.encrypt import configure_hashing
+from idiet.tracking.metrics import Metrics
+from idiet.tracking.ratelimit import AdmissionControl, AuthLimits
+from idiet.tracking.serialize import JSONProvider
 
 
 token_auth = HTTPTokenAuth(scheme="Bearer")
@@ -14,12 +21,44 @@ token_auth = HTTPTokenAuth(scheme="Bearer")
 
 class Tracking(Flask):
 
+    json_provider_class = JSONProvider
+
     def __init__(self, backend=None, config=None, secret_key=None,
                  *args, **kwargs):
         super().__init__(__name__, *args, **kwargs)
         self.backend = backend
         self.app_config = config
         self.secret_key = secret_key
+        self.metrics = None
+        self.response_cache = ResponseCache()
+        self.popularity_updater = None
+        self.rate_limits = None
+        self.admission = None
+        self.teardown_appcontext(self._close_backend_session)
+
+    def _close_backend_session(self, exc):
+        if self.backend is not None:
+            self.backend.close_session()
+
+    def warm_up(self):
+        """
+        do the work of a server process's first requests up front
+
+        Builds the backend's food indexes, opens its database connections
+        and sends the app a health check, which runs flask's first request
+        setup and loads the modules of the request path. Called before a
+        server forks its workers (gunicorn ``--preload``) the indexes are
+        built once and shared by the workers.
+        """
+        self.backend.warm_up()
+        self.test_client().get("/api/hc")
+        return self
+
+    def before_fork(self):
+        self.backend.before_fork()
+
+    def after_fork(self):
+        self.backend.after_fork()
 
 
 app = Blueprint("app", __name__)
@@ -33,6 +72,7 @@ def verify_token(token):
     user = backend.user_from_token(token, secret_key)
     if user:
         g.user = user
+        g.token = token
         return True
     return False
 
@@ -43,15 +83,59 @@ def hc():
 
 
 def create_app(config=None, backend=None, secret_key=None):
+    if isinstance(config, Config):
+        config = config.to_dict()
+    if backend == "memory":
+        backend = MemoryBackend()
     if backend is None:
-        engine = create_engine("sqlite://")
-        backend = SqlAlchemyBackend(engine)
+        engine = engine_from_config(config and config.get("db"))
+        token_cache = None
+        if config and "token-cache-size" in config:
+            token_cache = TokenCache(max_size=config["token-cache-size"])
+        revocation = (config or {}).get("token-revocation", {})
+        catalog = (config or {}).get("catalog", {})
+        backend = SqlAlchemyBackend(
+            engine, token_cache=token_cache,
+            revocation_sync_interval=revocation.get("sync-interval", 1.0),
+            profile_version_ttl=(config or {}).get(
+                "profile-version-ttl", 1.0),
+            catalog_path=catalog.get("path"),
+            catalog_check_interval=catalog.get("check-interval", 1.0))
         backend.init()
     if config and config.get("secret-key") == "":
         raise ValueError("Cannot create app without encryption key")
+    if config and "password-hashing" in config:
+        hashing = config["password-hashing"]
+        configure_hashing(
+            method=hashing.get("method", "pbkdf2:sha256"),
+            workers=hashing.get("workers", 0),
+            max_pending=hashing.get("max-pending"),
+        )
     app = Tracking(backend=backend, config=(config or {}),
                    secret_key=secret_key)
+    if config and "response-cache-size" in config:
+        app.response_cache = ResponseCache(
+            max_size=config["response-cache-size"])
+    if config and "rate-limit" in config:
+        app.rate_limits = AuthLimits.from_config(config["rate-limit"])
+    if config and "admission" in config:
+        admission = config["admission"]
+        app.admission = AdmissionControl(
+            max_concurrent=admission.get("max-concurrent", 32),
+            expensive_share=admission.get("expensive-share", 0.5))
+        app.admission.init_app(app)
+    autocomplete = (config or {}).get("autocomplete", {})
+    interval = autocomplete.get("popularity-interval", 60.0)
+    if interval:
+        app.popularity_updater = PopularityUpdater(
+            backend.food_popularity_refresh, interval=interval)
     import idiet.tracking.api  # noqa: F401
     app.register_blueprint(api)
+    metrics = (config or {}).get("metrics", {})
+    if metrics.get("enabled"):
+        app.metrics = Metrics(server_timing=metrics.get("server-timing", True))
+        app.metrics.init_app(app, path=metrics.get("path", "/metrics"))
     CORS(app)
+    if (config or {}).get("startup", {}).get("warm-up"):
+        app.warm_up()
     return app
@@ -1,17 +1,108 @@
+from concurrent.futures import ProcessPoolExecutor
 from datetime import timedelta
+import threading
 
 import jwt
 from werkzeug import security
 
+from idiet.tracking.metrics import timed
 from idiet.tracking.timestamp import utcnow
 
 
+class HasherBusy(Exception):
+    """
+    raised when every password hashing slot is taken
+    """
+
+
+def _generate_password_hash(password, method):
+    return security.generate_password_hash(password, method=method,
+                                           salt_length=10)
+
+
+class PasswordHasher:
+    """
+    hashes and checks passwords, optionally in a process pool
+
+    PBKDF2 is deliberately slow. Run inline it holds the request thread
+    for the whole hash, with ``workers`` set it runs in a pool of
+    processes instead so other requests on the same server process keep
+    being served. At most ``max_pending`` hashes are queued or running at
+    once, past that ``HasherBusy`` is raised straight away rather than
+    letting requests pile up behind the pool.
+
+    Parameters
+    ----------
+    method:
+        werkzeug hash method, the iteration count sets the cost e.g.
+        ``pbkdf2:sha256:150000``
+    workers:
+        size of the process pool, 0 hashes inline
+    max_pending:
+        hashes allowed in flight, defaults to 4 per worker
+    """
+
+    def __init__(self, method="pbkdf2:sha256", workers=0, max_pending=None):
+        self.method = method
+        self.workers = workers
+        self.max_pending = max_pending or 4 * workers
+        self._slots = threading.BoundedSemaphore(self.max_pending or 1)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def hash(self, password):
+        return self._run(_generate_password_hash, password, self.method)
+
+    def check(self, password_hash, password):
+        return self._run(security.check_password_hash,
+                         password_hash, password)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            with timed("password_hash"):
+                return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            with timed("password_hash"):
+                return self._pool().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def _pool(self):
+        # created on first use so each forked server worker gets its own
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.workers)
+            return self._executor
+
+
+_hasher = PasswordHasher()
+
+
+def configure_hashing(method="pbkdf2:sha256", workers=0, max_pending=None):
+    """
+    replace the hasher used by ``hash_password`` and
+    ``check_password_hash``
+    """
+    global _hasher
+    previous, _hasher = _hasher, PasswordHasher(method, workers, max_pending)
+    previous.shutdown()
+    return _hasher
+
+
 def hash_password(password):
-    return security.generate_password_hash(password, salt_length=10)
+    return _hasher.hash(password)
 
 
 def check_password_hash(password_hash, password):
-    return security.check_password_hash(password_hash, password)
+    return _hasher.check(password_hash, password)
 
 
 def jwt_encode(user, secret, **jwt_args):
@@ -0,0 +1,89 @@
+"""
+exports of a user's meal history as NDJSON or CSV
+
+Exports are generators encoding records while the response is sent,
+``chunk_size`` records at a time, so a worker holds one chunk whatever
+the size of the history. Meals come with their ``id``, an export that
+broke off is resumed from the last one received.
+"""
+import csv
+import datetime
+import io
+
+from idiet.tracking.serialize import dumps, isoformat
+
+
+#: records encoded per chunk of an export
+EXPORT_CHUNK_SIZE = 256
+#: exported meal fields, in the order of the CSV columns
+MEAL_FIELDS = (
+    "id",
+    "logged_at",
+    "food_id",
+    "name",
+    "servings",
+    "calories",
+    "fat_in_grams",
+    "carbs_in_grams",
+    "protein_in_grams",
+)
+MIMETYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def iter_ndjson(records, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    yield records as JSON lines, ``chunk_size`` lines at a time
+    """
+    lines = []
+    for record in records:
+        lines.append(dumps(record))
+        if len(lines) == chunk_size:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (datetime.date, datetime.time)):
+        return isoformat(value)
+    return value
+
+
+def iter_csv(records, fields, header=True, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    yield the ``fields`` of records as CSV rows, ``chunk_size`` rows at a
+    time, after a row of the field names with ``header``
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(fields)
+    for i, record in enumerate(records, 1):
+        writer.writerow([_csv_value(record.get(field)) for field in fields])
+        if i % chunk_size == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def export_meals(meals, format="ndjson", resumed=False):
+    """
+    the encoded chunks of an export of ``meals`` in ``format``. Resumed
+    CSV exports leave out the header so they can be appended to the
+    part received before
+    """
+    if format == "csv":
+        return iter_csv(meals, MEAL_FIELDS, header=not resumed)
+    if format == "ndjson":
+        return iter_ndjson(
+            {field: meal.get(field) for field in MEAL_FIELDS}
+            for meal in meals)
+    raise ValueError(f"format must be one of {', '.join(MIMETYPES)}")
@@ -0,0 +1,32 @@
+"""
+gunicorn settings for serving ``idiet.tracking.wsgi:app``
+
+    gunicorn --config python:idiet.tracking.gunicorn_conf \\
+        idiet.tracking.wsgi:app
+
+The app is loaded and, with ``IDIET_TRACKING_WARM_UP=1``, warmed up once
+in the master before it forks the workers. The workers share the imported
+modules and the food indexes with the master until they write to them.
+The objects that exist at that point are moved out of the garbage
+collector's reach, the collector's bookkeeping would otherwise write to
+every one of them and copy the pages they're on into each worker.
+"""
+import gc
+from os import environ
+
+
+bind = environ.get("IDIET_TRACKING_BIND", "0.0.0.0:8080")
+workers = int(environ.get("IDIET_TRACKING_WORKERS", 4))
+threads = int(environ.get("IDIET_TRACKING_THREADS", 4))
+preload_app = True
+
+
+def when_ready(server):
+    # database connections opened loading the app aren't forked
+    server.app.wsgi().before_fork()
+    if hasattr(gc, "freeze"):
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    server.app.wsgi().after_fork()
@@ -0,0 +1,282 @@
+"""
+bulk load a food catalog into the food table
+
+    idiet-tracking-import foods.csv --db-url sqlite:///idiet-tracking.db
+
+Rows are streamed from a CSV file or a JSON lines file, validated and
+written in batches with one executemany insert per batch, so memory use
+is bounded by the batch size and not by the size of the file. Columns
+use the names of the food search results (``name``, ``group``,
+``fat_in_grams``, ...) or of the food table (``foodname``, ``foodgroup``,
+``fatg``, ...). With ``--upsert`` rows carrying a ``foodid`` replace the
+existing food with that id, without it they're skipped. A ``foodid``
+repeated in the file is skipped too, or with ``--upsert`` replaces the
+row before it.
+"""
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+import sys
+import time
+
+from sqlalchemy import select
+from sqlalchemy.sql.expression import bindparam
+
+from idiet.tracking.backend.db import FoodFact, SqlAlchemyBackend
+from idiet.tracking.backend.db import engine_from_config
+
+
+# accepted input names of every food table column
+ALIASES = {
+    "foodid": ("foodid", "food_id", "id"),
+    "foodname": ("foodname", "name"),
+    "foodgroup": ("foodgroup", "group"),
+    "fatg": ("fatg", "fat_in_grams"),
+    "proteing": ("proteing", "protein_in_grams"),
+    "carbohydrateg": ("carbohydrateg", "carbohydrates_in_grams"),
+    "calories": ("calories",),
+}
+NUMBERS = ("fatg", "proteing", "carbohydrateg", "calories")
+
+
+class InvalidRow(ValueError):
+    pass
+
+
+def read_csv(fd):
+    return csv.DictReader(fd)
+
+
+def read_jsonl(fd):
+    for line in fd:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # not json, validate reports it as an invalid row
+            yield line
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl}
+
+
+def _pick(record, names):
+    for name in names:
+        if name in record:
+            return record[name]
+    return None
+
+
+def _number(value, column):
+    if value is None or value == "":
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise InvalidRow(f"{column} is not a number: {value!r}")
+    if not math.isfinite(number) or number < 0:
+        raise InvalidRow(
+            f"{column} must be a finite non-negative number: {value!r}")
+    return number
+
+
+def validate(record):
+    """
+    turn an input record into a food table row, raises InvalidRow
+    """
+    if not isinstance(record, dict):
+        raise InvalidRow("row is not an object")
+    row = {column: _pick(record, names) for column, names in ALIASES.items()}
+    name = (row["foodname"] or "").strip()
+    if not name:
+        raise InvalidRow("food name is missing")
+    row["foodname"] = name
+    row["foodgroup"] = (row["foodgroup"] or "").strip() or None
+    for column in NUMBERS:
+        row[column] = _number(row[column], column)
+    if row["foodid"] in (None, ""):
+        row["foodid"] = None
+    else:
+        try:
+            row["foodid"] = int(row["foodid"])
+        except (TypeError, ValueError):
+            raise InvalidRow(f"foodid is not an integer: {row['foodid']!r}")
+    return row
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Importer:
+    """
+    writes validated food rows to the database in batches
+
+    Parameters
+    ----------
+    engine:
+        sqlalchemy engine of the tracking database
+    batch_size:
+        rows per insert and per transaction
+    upsert:
+        update foods whose ``foodid`` already exists instead of skipping
+        them
+    """
+
+    def __init__(self, engine, batch_size=5000, upsert=False, out=sys.stdout):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.upsert = upsert
+        self.out = out
+        self.inserted = 0
+        self.updated = 0
+        self.invalid = 0
+        self.duplicates = 0
+        self.table = FoodFact.__table__
+
+    def run(self, records):
+        start = time.perf_counter()
+        rows = self._valid_rows(records)
+        for batch in batches(rows, self.batch_size):
+            with self.engine.begin() as connection:
+                self._write(connection, batch)
+            elapsed = time.perf_counter() - start
+            done = self.inserted + self.updated
+            self.report(f"{done} rows in {elapsed:.1f}s "
+                        f"({done / elapsed:.0f} rows/s)")
+        return self
+
+    def report(self, message):
+        print(message, file=self.out, flush=True)
+
+    def _skip(self, record, reason):
+        # the first few skipped records are reported
+        if self.invalid + self.duplicates <= 10:
+            self.report(f"skipping record {record}: {reason}")
+
+    def _valid_rows(self, records):
+        """
+        ``(record number, row)`` pairs of the valid records
+        """
+        for number, record in enumerate(records, start=1):
+            try:
+                yield number, validate(record)
+            except InvalidRow as error:
+                self.invalid += 1
+                self._skip(number, error)
+
+    def _unique(self, connection, batch):
+        """
+        the rows of a batch to insert and to update, rows whose ``foodid``
+        was already written are skipped unless upserting
+        """
+        table = self.table
+        by_id = {}
+        rows = []
+        for number, row in batch:
+            foodid = row["foodid"]
+            if foodid is None:
+                rows.append(row)
+            elif foodid not in by_id:
+                by_id[foodid] = row
+            elif self.upsert:
+                # the last row of an id wins, like a second upsert would
+                by_id[foodid] = row
+            else:
+                self.duplicates += 1
+                self._skip(number, f"foodid {foodid} repeats an earlier row")
+        existing = set()
+        if by_id:
+            found = connection.execute(
+                select([table.c.foodid]).where(table.c.foodid.in_(by_id)))
+            existing = {foodid for foodid, in found}
+        updates = []
+        if self.upsert:
+            updates = [by_id[foodid] for foodid in existing]
+        elif existing:
+            for number, row in batch:
+                if row["foodid"] in existing and \
+                        by_id.get(row["foodid"]) is row:
+                    self.duplicates += 1
+                    self._skip(number,
+                               f"foodid {row['foodid']} already exists")
+        rows.extend(
+            row for foodid, row in by_id.items() if foodid not in existing)
+        return rows, updates
+
+    def _write(self, connection, batch):
+        table = self.table
+        batch, updates = self._unique(connection, batch)
+        if updates:
+            columns = [column for column in ALIASES if column != "foodid"]
+            statement = table.update().where(
+                table.c.foodid == bindparam("key_foodid")
+            ).values({column: bindparam(column) for column in columns})
+            params = []
+            for row in updates:
+                values = {column: row[column] for column in columns}
+                values["key_foodid"] = row["foodid"]
+                params.append(values)
+            connection.execute(statement, params)
+            self.updated += len(updates)
+        # rows without an id get one from the database, they can't share
+        # an executemany with rows that have one
+        with_id = [row for row in batch if row["foodid"] is not None]
+        without_id = [
+            {k: v for k, v in row.items() if k != "foodid"}
+            for row in batch if row["foodid"] is None
+        ]
+        for rows in (with_id, without_id):
+            if rows:
+                connection.execute(table.insert(), rows)
+                self.inserted += len(rows)
+
+
+def guess_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    return "jsonl" if extension in (".jsonl", ".ndjson", ".json") else "csv"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("path", help="CSV or JSON lines file, - for stdin")
+    parser.add_argument(
+        "--db-url", default=os.environ.get("IDIET_TRACKING_DB_URL",
+                                           "sqlite:///idiet-tracking.db"))
+    parser.add_argument("--format", choices=sorted(READERS))
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--upsert", action="store_true")
+    args = parser.parse_args(argv)
+
+    engine = engine_from_config({"url": args.db_url})
+    SqlAlchemyBackend(engine).init()
+    file_format = args.format or guess_format(args.path)
+    importer = Importer(engine, batch_size=args.batch_size,
+                        upsert=args.upsert)
+
+    if args.path == "-":
+        importer.run(READERS[file_format](sys.stdin))
+    else:
+        with open(args.path, newline="", encoding="utf-8") as fd:
+            importer.run(READERS[file_format](fd))
+    importer.report(
+        f"inserted {importer.inserted}, updated {importer.updated}, "
+        f"skipped {importer.invalid} invalid rows and "
+        f"{importer.duplicates} rows of existing food ids"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+"""
+request timing and database query instrumentation
+
+Enabled with the ``metrics`` section of the app config
+
+    [metrics]
+    enabled = true
+    path = "/metrics"
+    server-timing = true
+
+Every request is timed per endpoint and the time spent in database
+queries, jwt decoding and password hashing is added up per request.
+Totals are served in the Prometheus text format on ``path`` and each
+response gets a ``Server-Timing`` header breaking its time down. Every
+server process keeps its own metrics.
+
+When metrics are disabled nothing is registered on the app or the engine,
+the only cost left is the ``timed`` calls around jwt decoding and
+password hashing, a thread local lookup each.
+"""
+import bisect
+import contextlib
+import threading
+import time
+
+from flask import request, Response
+from sqlalchemy import event
+
+
+#: histogram buckets in seconds
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+    2.5, 5.0, 10.0,
+)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_local = threading.local()
+
+
+class _NotTimed:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOT_TIMED = _NotTimed()
+
+
+class Counter:
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = \
+                self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            yield self.name, self._label_pairs(label_values), value
+
+    def _label_pairs(self, label_values):
+        return list(zip(self.labels, label_values))
+
+
+class Histogram(Counter):
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                # per bucket counts, the last one past every bucket, the sum
+                series = self._values[label_values] = \
+                    [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def count(self, *label_values):
+        series = self._values.get(label_values)
+        return sum(series[0]) if series else 0
+
+    def samples(self):
+        with self._lock:
+            values = sorted(
+                (label_values, (list(counts), total))
+                for label_values, (counts, total) in self._values.items()
+            )
+        for label_values, (counts, total) in values:
+            pairs = self._label_pairs(label_values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield (f"{self.name}_bucket",
+                       pairs + [("le", _number(bound))], cumulative)
+            yield f"{self.name}_sum", pairs, total
+            yield f"{self.name}_count", pairs, cumulative
+
+
+def _number(value):
+    if isinstance(value, str):
+        return value
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return (str(value).replace("\\", "\\\\").replace("\n", "\\n")
+            .replace('"', '\\"'))
+
+
+class RequestTimings:
+    """
+    time spent in each section of a single request
+    """
+
+    __slots__ = ("start", "sections", "queries")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sections = {}
+        self.queries = 0
+
+    def add(self, section, seconds):
+        self.sections[section] = self.sections.get(section, 0.0) + seconds
+
+    def server_timing(self, total):
+        entries = []
+        for section, seconds in self.sections.items():
+            entry = f"{section};dur={seconds * 1e3:.3f}"
+            if section == "db":
+                entry += f';desc="{self.queries} queries"'
+            entries.append(entry)
+        entries.append(f"total;dur={total * 1e3:.3f}")
+        return ", ".join(entries)
+
+
+@contextlib.contextmanager
+def _timed(timings, section, metrics):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        timings.add(section, elapsed)
+        metrics.sections.observe(elapsed, section)
+
+
+def timed(section):
+    """
+    context manager timing a section of the current request, a no-op
+    outside of a request of an app with metrics enabled
+    """
+    timings = getattr(_local, "timings", None)
+    if timings is None:
+        return _NOT_TIMED
+    return _timed(timings, section, _local.metrics)
+
+
+class Metrics:
+    """
+    the metrics of one app
+
+    Parameters
+    ----------
+    server_timing:
+        add a ``Server-Timing`` header to every response
+    """
+
+    def __init__(self, server_timing=True):
+        self.server_timing = server_timing
+        self.requests = Histogram(
+            "idiet_request_duration_seconds",
+            "wall time of requests by endpoint",
+            ("endpoint", "method", "status"))
+        self.sections = Histogram(
+            "idiet_section_duration_seconds",
+            "time spent in jwt decoding and password hashing",
+            ("section",))
+        self.queries = Counter(
+            "idiet_db_queries_total",
+            "database queries by endpoint", ("endpoint",))
+        self.query_seconds = Counter(
+            "idiet_db_query_seconds_total",
+            "time spent in database queries by endpoint", ("endpoint",))
+        self.queries_per_request = Histogram(
+            "idiet_db_queries_per_request",
+            "database queries per request by endpoint", ("endpoint",),
+            buckets=QUERY_COUNT_BUCKETS)
+
+    def init_app(self, app, path="/metrics"):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule(path, "metrics", self.export)
+        engine = getattr(app.backend, "engine", None)
+        if engine is not None:
+            self.instrument_engine(engine)
+
+    def instrument_engine(self, engine):
+        event.listen(engine, "before_cursor_execute", self._before_query)
+        event.listen(engine, "after_cursor_execute", self._after_query)
+
+    def export(self):
+        return Response(self.render(),
+                        mimetype="text/plain; version=0.0.4")
+
+    def render(self):
+        lines = []
+        for metric in (self.requests, self.sections, self.queries,
+                       self.query_seconds, self.queries_per_request):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, pairs, value in metric.samples():
+                labels = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+                labels = "{" + labels + "}" if labels else ""
+                lines.append(f"{name}{labels} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _before_request(self):
+        _local.timings = RequestTimings()
+        _local.metrics = self
+
+    def _after_request(self, response):
+        timings = getattr(_local, "timings", None)
+        if timings is None:
+            return response
+        total = time.perf_counter() - timings.start
+        endpoint = request.endpoint or "none"
+        self.requests.observe(total, endpoint, request.method,
+                              str(response.status_code))
+        self.queries_per_request.observe(timings.queries, endpoint)
+        if self.server_timing:
+            response.headers["Server-Timing"] = timings.server_timing(total)
+        return response
+
+    def _teardown_request(self, exc):
+        _local.timings = None
+        _local.metrics = None
+
+    def _before_query(self, conn, cursor, statement, parameters, context,
+                      executemany):
+        # kept on the execution context, a failing query leaves nothing
+        # behind on the connection. The few statements sqlalchemy runs
+        # without a context aren't recorded
+        if context is not None:
+            context._query_start = time.perf_counter()
+
+    def _after_query(self, conn, cursor, statement, parameters, context,
+                     executemany):
+        start = getattr(context, "_query_start", None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        timings = getattr(_local, "timings", None)
+        endpoint = "none"
+        if timings is not None:
+            timings.add("db", elapsed)
+            timings.queries += 1
+            endpoint = request.endpoint or "none"
+        self.queries.inc(1, endpoint)
+        self.query_seconds.inc(elapsed, endpoint)
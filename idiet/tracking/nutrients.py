@@ -0,0 +1,203 @@
+import hashlib
+
+import numpy as np
+
+
+# query names of the nutrient columns and the FoodFact.to_dict keys they
+# are loaded from
+COLUMNS = {
+    "fat": "fat_in_grams",
+    "protein": "protein_in_grams",
+    "carbs": "carbohydrates_in_grams",
+    "calories": "calories",
+}
+
+
+class NutrientStore:
+    """
+    the nutrient columns of the food table as numpy arrays
+
+    Queries are answered with vectorized masks over whole columns instead
+    of row by row. Missing nutrient values are stored as NaN, so they
+    never satisfy a range and sort last.
+
+    Parameters
+    ----------
+    foods:
+        iterable of ``(foodid, record)`` pairs where record is a
+        ``FoodFact.to_dict`` dict
+    """
+
+    #: sort keys, each computed from the nutrient columns
+    sort_keys = {
+        "fat": lambda c: c["fat"],
+        "protein": lambda c: c["protein"],
+        "carbs": lambda c: c["carbs"],
+        "calories": lambda c: c["calories"],
+        "protein_per_calorie": lambda c: _ratio(c["protein"], c["calories"]),
+    }
+
+    def __init__(self, foods=()):
+        ids = []
+        groups = []
+        self.records = []
+        values = {column: [] for column in COLUMNS}
+        for foodid, record in foods:
+            ids.append(foodid)
+            groups.append(record.get("group"))
+            self.records.append(record)
+            for column, key in COLUMNS.items():
+                value = record.get(key)
+                values[column].append(np.nan if value is None else value)
+
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.group_names = sorted({g for g in groups if g is not None})
+        self._group_codes = {g: i for i, g in enumerate(self.group_names)}
+        self.groups = np.asarray(
+            [self._group_codes.get(g, -1) for g in groups], dtype=np.int32)
+        self.columns = {
+            column: np.asarray(column_values, dtype=np.float64)
+            for column, column_values in values.items()
+        }
+
+    @classmethod
+    def from_catalog(cls, catalog):
+        """
+        a store whose columns are the arrays of a ``Catalog``, read in
+        place
+        """
+        store = cls.__new__(cls)
+        store.ids = np.asarray(catalog.ids)
+        store.records = catalog.records
+        store.group_names = list(catalog.group_names)
+        store._group_codes = {g: i for i, g in enumerate(store.group_names)}
+        store.groups = np.asarray(catalog.groups)
+        store.columns = {
+            column: np.asarray(catalog.nutrients[column])
+            for column in COLUMNS
+        }
+        return store
+
+    def __len__(self):
+        return len(self.ids)
+
+    def digest(self):
+        """
+        a hex digest of every food's id, name, group and nutrients
+
+        Stores built from the same foods have the same digest, so it
+        identifies a version of the catalog across server processes.
+        """
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update(self.ids.tobytes())
+        digest.update(self.groups.tobytes())
+        digest.update("\0".join(self.group_names).encode())
+        for column in COLUMNS:
+            digest.update(self.columns[column].tobytes())
+        digest.update("\0".join(
+            record.get("name") or "" for record in self.records).encode())
+        return digest.hexdigest()
+
+    def query(self, group=None, ranges=None, sort=None, descending=True,
+              max_results=10):
+        """
+        return up to ``max_results`` ``(foodid, record)`` pairs
+
+        Parameters
+        ----------
+        group:
+            only foods in this food group
+        ranges:
+            ``{column: (low, high)}`` inclusive bounds, either bound can be
+            None
+        sort:
+            one of ``sort_keys``, results are in food id order without one
+        descending:
+            sort from the largest value down
+        """
+        return [
+            (foodid, record) for _, foodid, record in self.query_page(
+                group=group, ranges=ranges, sort=sort,
+                descending=descending, max_results=max_results)
+        ]
+
+    def query_page(self, group=None, ranges=None, sort=None,
+                   descending=True, max_results=10, after=None):
+        """
+        like ``query`` but returns ``(key, foodid, record)`` tuples, passing
+        the ``key`` of the last result as ``after`` returns the next page
+
+        Keys are ``(sort value, foodid)``, or ``(foodid,)`` without a
+        sort, a missing sort value is None. Every page is a single pass
+        over the columns however deep it is.
+        """
+        mask = np.ones(len(self.ids), dtype=bool)
+        if group is not None:
+            code = self._group_codes.get(group)
+            if code is None:
+                return []
+            mask &= self.groups == code
+        # comparisons with NaN are False, foods missing a value drop out
+        with np.errstate(invalid="ignore"):
+            for column, (low, high) in (ranges or {}).items():
+                values = self.columns[column]
+                if low is not None:
+                    mask &= values >= low
+                if high is not None:
+                    mask &= values <= high
+        if sort is None:
+            if after is not None:
+                mask &= self.ids > after[-1]
+            positions = np.flatnonzero(mask)[:max_results]
+            return [
+                ((int(self.ids[p]),), int(self.ids[p]), self.records[p])
+                for p in positions
+            ]
+        positions = np.flatnonzero(mask)
+        values = self.sort_keys[sort](self.columns)
+        positions = self._top(positions, values, descending, max_results,
+                              after)
+        return [
+            ((_value(values[p]), int(self.ids[p])), int(self.ids[p]),
+             self.records[p])
+            for p in positions[:max_results]
+        ]
+
+    def _top(self, positions, values, descending, k, after=None):
+        key = values[positions]
+        if descending:
+            key = -key
+        if after is not None:
+            # ids are in position order, so ties continue by position
+            value, foodid = after
+            ids = self.ids[positions]
+            if value is None:
+                keep = np.isnan(key) & (ids > foodid)
+            else:
+                after_key = -value if descending else value
+                with np.errstate(invalid="ignore"):
+                    keep = ((key > after_key)
+                            | ((key == after_key) & (ids > foodid))
+                            | np.isnan(key))
+            positions, key = positions[keep], key[keep]
+        if 0 < k < len(key):
+            # only the foods up to the k-th key need a full sort, ties with
+            # it are kept so equal keys always come back in food id order
+            kth = np.partition(key, k - 1)[k - 1]
+            if not np.isnan(kth):
+                keep = key <= kth
+                positions, key = positions[keep], key[keep]
+        # NaN sorts last
+        order = np.lexsort((positions, key))
+        return positions[order]
+
+
+def _value(value):
+    return None if np.isnan(value) else float(value)
+
+
+def _ratio(numerator, denominator):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = numerator / denominator
+    ratio[~np.isfinite(ratio)] = np.nan
+    return ratio
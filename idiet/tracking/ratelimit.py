@@ -0,0 +1,304 @@
+"""
+rate limits and admission control for the auth endpoints
+
+Enabled with the ``rate-limit`` and ``admission`` sections of the app
+config
+
+    [rate-limit]
+    per-ip = "20/minute"
+    per-username = "10/minute"
+    store = "/run/idiet/ratelimit.db"
+
+    [admission]
+    max-concurrent = 32
+    expensive-share = 0.5
+
+Rate limits are token buckets, a client gets a burst of as many requests
+as the limit allows per period and then one more each time a token
+refills. Buckets live in ``store``, a sqlite file every server process on
+the host shares, or in the memory of each process without one. Every
+process also remembers what the store last said about a key, a client
+already out of tokens is turned away from that copy without touching the
+store.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from flask import g, request
+
+from idiet.tracking.serialize import json_response
+
+
+PERIODS = {"second": 1.0, "minute": 60.0, "hour": 3600.0, "day": 86400.0}
+
+
+class Limit:
+    """
+    ``burst`` requests at once, refilling at ``rate`` per second
+    """
+
+    __slots__ = ("rate", "burst")
+
+    def __init__(self, rate, burst):
+        if rate <= 0 or burst < 1:
+            raise ValueError("a limit needs a positive rate and burst")
+        self.rate = rate
+        self.burst = burst
+
+    @classmethod
+    def parse(cls, text):
+        """
+        a limit from text like ``20/minute``, 20 requests at once and 20
+        more a minute
+        """
+        try:
+            count, period = text.split("/")
+            count = int(count)
+            seconds = PERIODS[period.strip()]
+        except (AttributeError, ValueError, KeyError):
+            raise ValueError(f"not a rate limit: {text!r}, expected e.g. "
+                             f"'20/minute'")
+        return cls(count / seconds, count)
+
+    def refill(self, tokens, elapsed):
+        return min(self.burst, tokens + max(elapsed, 0.0) * self.rate)
+
+    def full_at(self, tokens, now):
+        """
+        when a bucket holding ``tokens`` at ``now`` is full again
+        """
+        return now + (self.burst - tokens) / self.rate
+
+
+class MemoryStore:
+    """
+    token buckets in a dict, limits apply per server process
+
+    Keys whose bucket refilled completely are dropped once there are more
+    than ``max_keys``, a full bucket and no bucket are the same.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, limit, now):
+        """
+        take a token from a bucket, returns whether there was one and the
+        tokens left
+        """
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (limit.burst, now, 0))
+            tokens = limit.refill(tokens, now - updated)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now, limit.full_at(tokens, now))
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+        return allowed, tokens
+
+    def _prune(self, now):
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if bucket[2] > now
+        }
+        if len(self._buckets) > self.max_keys:
+            self._buckets.clear()
+
+
+class SqliteStore:
+    """
+    token buckets in a sqlite file shared by the server processes of a host
+
+    Every take is one short write transaction. Nothing is synced to disk,
+    losing the buckets in a crash only resets the limits.
+
+    Parameters
+    ----------
+    path:
+        the database file, created when it doesn't exist
+    prune_interval:
+        seconds between deleting buckets that refilled completely
+    """
+
+    def __init__(self, path, prune_interval=60.0):
+        self.path = path
+        self.prune_interval = prune_interval
+        self._local = threading.local()
+        self._next_prune = 0.0
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, "
+            "updated REAL NOT NULL, full_at REAL NOT NULL)")
+
+    def _connect(self):
+        # one connection per thread, and a new one in a forked process
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def take(self, key, limit, now):
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT tokens, updated FROM buckets WHERE key = ?",
+                (key,)).fetchone()
+            tokens, updated = row if row is not None else (limit.burst, now)
+            tokens = limit.refill(tokens, now - updated)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            connection.execute(
+                "INSERT OR REPLACE INTO buckets "
+                "(key, tokens, updated, full_at) VALUES (?, ?, ?, ?)",
+                (key, tokens, now, limit.full_at(tokens, now)))
+            if now >= self._next_prune:
+                self._next_prune = now + self.prune_interval
+                connection.execute(
+                    "DELETE FROM buckets WHERE full_at < ?", (now,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return allowed, tokens
+
+
+class RateLimiter:
+    """
+    token bucket rate limits kept in ``store``
+
+    The tokens the store last returned for a key are remembered in
+    process. Buckets only refill with time while other processes also
+    take from them, so when the remembered tokens refilled since are
+    still short of one the store can't have one either and the request
+    is refused without asking it.
+
+    Parameters
+    ----------
+    store:
+        a ``MemoryStore`` or ``SqliteStore``
+    """
+
+    def __init__(self, store=None, clock=time.time, max_keys=100000):
+        self.store = store if store is not None else MemoryStore(max_keys)
+        self.max_keys = max_keys
+        self._clock = clock
+        self._seen = {}
+
+    def acquire(self, key, limit):
+        """
+        take a request from the bucket of ``key``, returns 0 when it's
+        allowed and otherwise the seconds until it would be
+        """
+        now = self._clock()
+        seen = self._seen.get(key)
+        if seen is not None:
+            tokens = limit.refill(seen[0], now - seen[1])
+            if tokens < 1:
+                return (1 - tokens) / limit.rate
+        allowed, tokens = self.store.take(key, limit, now)
+        if len(self._seen) >= self.max_keys:
+            self._seen = {}
+        self._seen[key] = (tokens, now)
+        return 0.0 if allowed else (1 - tokens) / limit.rate
+
+
+class AuthLimits:
+    """
+    the rate limits of the register and login endpoints, per client
+    address and per username
+    """
+
+    def __init__(self, limiter, per_ip=None, per_username=None):
+        self.limiter = limiter
+        self.per_ip = per_ip
+        self.per_username = per_username
+
+    @classmethod
+    def from_config(cls, config):
+        store = config.get("store")
+        store = SqliteStore(store) if store else MemoryStore()
+        per_ip = config.get("per-ip")
+        per_username = config.get("per-username")
+        return cls(
+            RateLimiter(store),
+            per_ip=Limit.parse(per_ip) if per_ip else None,
+            per_username=Limit.parse(per_username) if per_username else None,
+        )
+
+    def retry_after(self, address, username=None):
+        """
+        0 when a request from ``address`` for ``username`` is allowed,
+        otherwise the seconds until it would be
+        """
+        if self.per_ip is not None:
+            wait = self.limiter.acquire(f"ip:{address}", self.per_ip)
+            if wait:
+                return wait
+        if self.per_username is not None and username is not None:
+            return self.limiter.acquire(f"user:{username}",
+                                        self.per_username)
+        return 0.0
+
+
+class AdmissionControl:
+    """
+    caps the requests a server process handles at once
+
+    Requests past ``max_concurrent`` get a 503. Expensive endpoints, the
+    ones hashing passwords, are only let in while fewer than
+    ``expensive_share`` of ``max_concurrent`` requests run, so under load
+    they're turned away well before the cheap ones.
+    """
+
+    #: endpoints hashing a password
+    expensive = frozenset({"api.registration_api", "api.login_api"})
+
+    def __init__(self, max_concurrent=32, expensive_share=0.5):
+        self.max_concurrent = max_concurrent
+        self.max_expensive = max(1, int(max_concurrent * expensive_share))
+        self.in_flight = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    def admit(self, expensive):
+        with self._lock:
+            limit = self.max_expensive if expensive else self.max_concurrent
+            if self.in_flight >= limit:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _before_request(self):
+        if not self.admit(request.endpoint in self.expensive):
+            response = json_response({
+                "status": "failed",
+                "message": "Server busy, retry later"
+            }, 503)
+            response.headers["Retry-After"] = "1"
+            return response
+        g.admitted = True
+
+    def _teardown_request(self, exc):
+        if g.pop("admitted", False):
+            self.release()
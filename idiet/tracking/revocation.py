@@ -0,0 +1,104 @@
+import threading
+import time
+
+
+class RevocationList:
+    """
+    ids (``jti`` claims) of revoked tokens that have not expired yet
+
+    Every worker keeps its own copy in a dict, so checking a token is a
+    single lookup and never a database round trip. Copies are kept in
+    sync by reading the tokens revoked since the previous sync from the
+    database at most once every ``sync_interval`` seconds, the next time a
+    token is checked. A token revoked by another worker is therefore
+    accepted by this one for up to ``sync_interval`` seconds. Expired
+    tokens are dropped from the list and the database every
+    ``compact_interval`` seconds, an expired token is rejected anyway.
+
+    Parameters
+    ----------
+    load:
+        ``load(since)`` returns ``(jti, expires_at)`` pairs of the tokens
+        revoked at or after the unix time ``since``, or of every revoked
+        token when ``since`` is None. ``expires_at`` is a unix time.
+    compact:
+        ``compact(now)`` deletes the tokens that expired before ``now``
+        from the store
+    sync_interval:
+        seconds between two syncs
+    compact_interval:
+        seconds between two compactions
+    overlap:
+        seconds a sync reaches back before the previous one, so tokens
+        revoked by a transaction that committed late aren't missed
+    """
+
+    def __init__(self, load, compact=None, sync_interval=1.0,
+                 compact_interval=600.0, overlap=10.0, clock=time.time):
+        self.sync_interval = sync_interval
+        self.compact_interval = compact_interval
+        self.overlap = overlap
+        self._load = load
+        self._compact = compact
+        self._clock = clock
+        self._revoked = {}
+        self._synced_at = None
+        self._next_sync = 0.0
+        self._next_compact = clock() + compact_interval
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._revoked)
+
+    def __contains__(self, jti):
+        return jti in self._revoked
+
+    def is_revoked(self, jti):
+        self.maybe_sync()
+        return jti in self._revoked
+
+    def add(self, jti, expires_at):
+        """
+        revoke a token in this worker only, the database is the caller's
+        business
+        """
+        self._revoked[jti] = expires_at
+
+    def maybe_sync(self):
+        now = self._clock()
+        if now < self._next_sync:
+            return
+        # a single thread syncs, the others keep using the current copy
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._sync(now)
+        finally:
+            self._lock.release()
+
+    def sync(self):
+        with self._lock:
+            self._sync(self._clock())
+
+    def _sync(self, now):
+        since = None
+        if self._synced_at is not None:
+            since = self._synced_at - self.overlap
+        for jti, expires_at in self._load(since):
+            if expires_at > now:
+                self._revoked[jti] = expires_at
+        self._synced_at = now
+        self._next_sync = now + self.sync_interval
+        if now >= self._next_compact:
+            self._compact_expired(now)
+
+    def _compact_expired(self, now):
+        expired = [
+            jti for jti, expires_at in list(self._revoked.items())
+            if expires_at <= now
+        ]
+        for jti in expired:
+            self._revoked.pop(jti, None)
+        if self._compact is not None:
+            self._compact(now)
+        self._next_compact = now + self.compact_interval
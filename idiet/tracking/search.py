@@ -0,0 +1,338 @@
+import bisect
+import heapq
+import itertools
+import math
+import re
+import sys
+
+
+_NON_WORD = re.compile(r"[^0-9a-z]+")
+
+#: the characters of normalized names and of their trigrams, in sort order
+ALPHABET = " 0123456789abcdefghijklmnopqrstuvwxyz"
+_ALPHABET_CODES = {c: i for i, c in enumerate(ALPHABET)}
+
+
+def normalize(name):
+    """
+    lowercase a food name and collapse punctuation to single spaces
+    """
+    return " ".join(_NON_WORD.split((name or "").lower())).strip()
+
+
+def words(name):
+    """
+    distinct normalized words of a food name, in order of appearance
+    """
+    return tuple(dict.fromkeys(normalize(name).split()))
+
+
+def code(text):
+    """
+    the index of ``text`` among the strings of its length made of
+    ``ALPHABET``, in sort order
+
+    Trigrams and short name prefixes index arrays by their code instead of
+    being looked up by string. Raises KeyError for text with a character
+    outside ``ALPHABET``.
+    """
+    value = 0
+    for character in text:
+        value = value * len(ALPHABET) + _ALPHABET_CODES[character]
+    return value
+
+
+def trigrams(word):
+    """
+    padded trigrams of a single word
+
+    Words are padded the same way postgres' pg_trgm pads them, two spaces
+    in front and one behind, so short words still produce grams.
+    ``chicken`` gives ``"  c", " ch", "chi", ... "en "``
+    """
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a, b):
+    """
+    jaccard similarity of the trigram sets of two words
+    """
+    a, b = trigrams(a), trigrams(b)
+    return len(a & b) / len(a | b)
+
+
+class FoodIndex:
+    """
+    in memory inverted index over the food table
+
+    A search runs in two steps. Every query word is matched against the
+    vocabulary of the food table through a trigram index, so typos like
+    ``chiken`` still find ``chicken``. The foods containing one matched
+    word per query word are then read from word posting lists that are
+    sorted by the length of the food name, shortest first, then by food
+    id. The shortest names are the closest matches, so a search only walks
+    as far into a posting list as it needs to fill ``max_results``.
+
+    A food's score is the mean similarity of the query words to the words
+    they matched, query words with no match at all count as zero.
+
+    Parameters
+    ----------
+    foods:
+        iterable of ``(foodid, record)`` pairs where record is the dict
+        returned to the client, it must contain the food ``name``
+    min_similarity:
+        minimum trigram similarity for a vocabulary word to match a
+        query word
+    """
+
+    #: vocabulary matches kept per query word
+    max_variants = 3
+    #: query words used, the rest of a very long query is ignored
+    max_query_words = 8
+
+    def __init__(self, foods=(), min_similarity=0.4):
+        self.min_similarity = min_similarity
+        self.ids = []
+        self.records = []
+        self._words = []
+        self._postings = {}
+        self._similar_cache = {}
+
+        for foodid, record in foods:
+            position = len(self.ids)
+            # intern so every food shares a single str object per word
+            food_words = tuple(sys.intern(w) for w in words(record["name"]))
+            for word in food_words:
+                self._postings.setdefault(word, []).append(position)
+            self.ids.append(foodid)
+            self.records.append(record)
+            self._words.append(food_words)
+
+        # posting lists are ordered shortest name first, then by food id
+        # like the result keys, the parallel name lengths let a walk skip
+        # names too short to hold every query word
+        food_words = self._words
+        ids = self.ids
+        self._lengths = {}
+        for word, posting in self._postings.items():
+            posting.sort(key=lambda p: (len(food_words[p]), ids[p]))
+            self._lengths[word] = [len(food_words[p]) for p in posting]
+        self._index_vocabulary()
+
+    @classmethod
+    def from_catalog(cls, catalog, min_similarity=0.4):
+        """
+        an index reading its posting lists, records and vocabulary
+        trigrams from a ``Catalog`` in place
+        """
+        index = cls.__new__(cls)
+        index.min_similarity = min_similarity
+        index.ids = catalog.ids
+        index.records = catalog.records
+        index._words = catalog.food_words
+        index._postings = catalog.postings
+        index._lengths = catalog.posting_lengths
+        index._similar_cache = {}
+        index._vocab_grams = catalog.vocabulary_grams
+        return index
+
+    def _index_vocabulary(self):
+        self._vocab_grams = {}
+        for word in self._postings:
+            for gram in trigrams(word):
+                self._vocab_grams.setdefault(gram, []).append(word)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def similar_words(self, word):
+        """
+        vocabulary words similar to ``word`` as ``(similarity, word)``
+        pairs, best first
+        """
+        try:
+            return self._similar_cache[word]
+        except KeyError:
+            pass
+        if word in self._postings:
+            matches = [(1.0, word)]
+        else:
+            matches = self._fuzzy_words(word)
+        if len(self._similar_cache) > 4096:
+            self._similar_cache.clear()
+        self._similar_cache[word] = matches
+        return matches
+
+    def _fuzzy_words(self, word):
+        grams = trigrams(word)
+        vocab = {gram: self._vocab_grams.get(gram, ()) for gram in grams}
+        # a word with jaccard >= t shares at least t * len(grams) grams, so
+        # it must contain one of the rarest len(grams) - needed + 1 grams
+        needed = math.ceil(self.min_similarity * len(grams))
+        ordered = sorted(grams, key=lambda g: len(vocab[g]))
+        candidates = set()
+        for gram in ordered[:len(grams) - needed + 1]:
+            candidates.update(vocab[gram])
+
+        scored = []
+        for candidate in candidates:
+            score = similarity(word, candidate)
+            if score >= self.min_similarity:
+                scored.append((score, candidate))
+        return heapq.nlargest(self.max_variants, scored)
+
+    def search(self, name, max_results=10):
+        """
+        return up to ``max_results`` ``(score, foodid, record)`` tuples
+        ordered from best to worst match
+        """
+        return [
+            (key[0], foodid, record)
+            for key, foodid, record in self.search_page(name, max_results)
+        ]
+
+    def search_page(self, name, max_results=10, after=None):
+        """
+        return up to ``max_results`` ``(key, foodid, record)`` tuples
+        ordered from best to worst match, ``key`` is the sort key of the
+        match
+
+        Passing the key of the last match of a page as ``after`` returns
+        the next page. Keys hold the food id rather than its position, so
+        they stay valid when the index is rebuilt.
+        """
+        query = words(name)[:self.max_query_words]
+        if not query or max_results <= 0:
+            return []
+        variants = [m for m in map(self.similar_words, query) if m]
+        if not variants:
+            return []
+        after = tuple(after) if after is not None else None
+
+        combos = sorted(
+            (
+                (sum(score for score, _ in combo) / len(query),
+                 [word for _, word in combo])
+                for combo in itertools.product(*variants)
+            ),
+            key=lambda combo: -combo[0]
+        )
+
+        phrase = " ".join(query)
+        best = []
+
+        # {vocabulary word: [(query word index, similarity)]}
+        word_scores = {}
+        n_variants = len(variants)
+        for i, matches in enumerate(variants):
+            for score, word in matches:
+                word_scores.setdefault(word, []).append((i, score))
+
+        def sort_key(position):
+            # a food's score is the best of every combination it contains,
+            # whichever combination found it
+            food_words = self._words[position]
+            if len(combos) == 1:
+                score = combos[0][0]
+            else:
+                scores = [0.0] * n_variants
+                for word in food_words:
+                    for i, score in word_scores.get(word, ()):
+                        if score > scores[i]:
+                            scores[i] = score
+                # summed in query word order like the combination scores,
+                # so equal scores compare equal
+                score = sum(scores) / len(query)
+            # among equally good names prefer the query's word order
+            in_order = normalize(
+                self.records[position]["name"]).startswith(phrase)
+            return (score, -len(food_words), in_order,
+                    -self.ids[position])
+
+        keys = {}
+
+        def skip(position):
+            if position in keys:
+                return True
+            key = keys[position] = sort_key(position)
+            return after is not None and key >= after
+
+        for score, combo in combos:
+            if len(best) >= max_results and best[0][0][0] > score:
+                # every food left scores lower than the results we have
+                break
+            start = None
+            if after is not None:
+                if score > after[0]:
+                    # every food of the combination is on an earlier page
+                    continue
+                if score == after[0]:
+                    # names in the query's order come first among names of
+                    # a length, past one of them every other name is left
+                    start = (-after[1], None if after[2] else -after[3])
+            walk = self._walk(combo, max_results, start, skip)
+            for position in walk:
+                key = keys[position]
+                if len(best) < max_results:
+                    heapq.heappush(best, (key, position))
+                elif key > best[0][0]:
+                    heapq.heapreplace(best, (key, position))
+
+        return [
+            (key, self.ids[position], self.records[position])
+            for key, position in sorted(best, reverse=True)
+        ]
+
+    def _walk(self, combo, limit, start=None, skip=None):
+        """
+        yield positions of foods containing every word in ``combo``,
+        shortest names first and by food id among names of a length
+
+        The walk stops once ``limit`` positions were yielded and the names
+        of the last one's length are done, a name of that length in the
+        query's word order can rank ahead of the ones yielded before it.
+        ``start``, a ``(words, foodid)`` pair, starts the walk at the
+        names of ``words`` words with a food id above ``foodid``, or at
+        the first of them if ``foodid`` is None. Positions ``skip``
+        returns True for aren't yielded or counted
+        """
+        postings = self._postings
+        combo = set(combo)
+        rarest = min(combo, key=lambda w: len(postings[w]))
+        others = tuple(combo - {rarest})
+        posting = postings[rarest]
+        lengths = self._lengths[rarest]
+        min_words, after_id = start or (0, None)
+        first = bisect.bisect_left(lengths, max(len(combo), min_words))
+        if after_id is not None and min_words >= len(combo):
+            first = self._seek(posting, after_id, first,
+                               bisect.bisect_right(lengths, min_words, first))
+        food_words = self._words
+        found = 0
+        for i in range(first, len(posting)):
+            if found >= limit and lengths[i] != lengths[i - 1]:
+                return
+            position = posting[i]
+            name = food_words[position]
+            for word in others:
+                if word not in name:
+                    break
+            else:
+                if skip is not None and skip(position):
+                    continue
+                yield position
+                found += 1
+
+    def _seek(self, posting, foodid, lo, hi):
+        # the first index of posting[lo:hi], a run of names of one length,
+        # whose food id is above foodid
+        ids = self.ids
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if ids[posting[mid]] <= foodid:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
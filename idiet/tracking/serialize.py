@@ -0,0 +1,127 @@
+"""
+JSON encoding of api responses
+
+Uses orjson when it's installed and the standard library otherwise, both
+give compact output with the same structure, key order, strings and
+datetimes. Floats decode to the same value but may be written
+differently, e.g. ``1e16`` and ``1e+16``, and NaN or infinite ones are
+``null`` with orjson and ``NaN`` or ``Infinity`` with the standard
+library. Datetimes are ISO 8601, naive ones are UTC like everything
+``timestamp.utcnow`` returns, e.g. ``2020-05-01T12:00:00Z``, dates are
+``2020-05-01``.
+"""
+import datetime
+import json
+
+from flask import current_app
+from flask.json.provider import JSONProvider as FlaskJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+
+#: list items encoded per chunk of a streamed response
+STREAM_CHUNK_SIZE = 256
+
+
+def isoformat(value):
+    """
+    the ISO 8601 text of a date or datetime, naive datetimes are UTC
+    """
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None and not value.utcoffset():
+            value = value.replace(tzinfo=None)
+        if value.tzinfo is None:
+            return value.isoformat() + "Z"
+    return value.isoformat()
+
+
+def _default(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return isoformat(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+_encoder = json.JSONEncoder(
+    separators=(",", ":"), ensure_ascii=False, default=_default)
+
+
+def stdlib_dumps(data):
+    """
+    encode ``data`` to compact JSON bytes with the standard library
+    """
+    return _encoder.encode(data).encode("utf-8")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+
+    def orjson_dumps(data):
+        """
+        encode ``data`` to compact JSON bytes with orjson
+        """
+        return orjson.dumps(data, default=_default, option=_ORJSON_OPTIONS)
+
+    dumps = orjson_dumps
+else:
+    orjson_dumps = None
+    dumps = stdlib_dumps
+
+
+class JSONProvider(FlaskJSONProvider):
+    """
+    the app's JSON provider, so ``jsonify`` and ``request.get_json`` use
+    the same encoder as ``json_response`` and format datetimes the same
+    way
+
+    ``dumps`` and ``loads`` keyword arguments, e.g. ``indent``, fall back
+    to the standard library
+    """
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            kwargs.setdefault("default", _default)
+            return json.dumps(obj, **kwargs)
+        return dumps(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj),
+                                        mimetype="application/json")
+
+
+def iter_json(data, key, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    yield the JSON encoding of the dict ``data`` in pieces, the list
+    ``data[key]`` is encoded ``chunk_size`` items at a time and never as
+    a whole. ``key`` comes last in the encoded object
+    """
+    items = data[key]
+    head = dumps({k: v for k, v in data.items() if k != key})
+    yield head[:-1] + (b"," if len(head) > 2 else b"") + dumps(key) + b":["
+    for start in range(0, len(items), chunk_size):
+        chunk = dumps(items[start:start + chunk_size])[1:-1]
+        yield chunk if start == 0 else b"," + chunk
+    yield b"]}"
+
+
+def json_response(data, status=200, stream=None):
+    """
+    a JSON response of ``data``
+
+    Parameters
+    ----------
+    stream:
+        the key of a list in ``data`` to encode while the response is
+        sent instead of up front, see ``iter_json``
+    """
+    body = dumps(data) if stream is None else iter_json(data, stream)
+    return current_app.response_class(body, status=status,
+                                      mimetype="application/json")
@@ -0,0 +1,209 @@
+"""
+body metrics users track over time, weight, water and steps
+
+Samples are stored in one chunk per user, metric and UTC day. A chunk
+holds the sample times, seconds since midnight, and values as packed
+``array('d')`` buffers, and next to them its own count, sum, min and max
+and the same four numbers for each of its 24 hours. Hourly, daily and
+weekly series are combined from those buckets, so reading a year of
+daily values reads one row per day and never the samples themselves.
+"""
+from array import array
+import datetime
+import math
+import sys
+
+
+# metrics users can track
+METRICS = ("weight_in_kg", "water_in_ml", "steps")
+# series a range can be read as, raw samples or buckets of an hour, a
+# day or a week (starting on monday)
+RESOLUTIONS = ("raw", "hour", "day", "week")
+
+# count, sum, min and max per hour of a chunk's hourly buckets
+_BUCKET = 4
+
+
+def _pack(values):
+    # chunks are stored little endian whatever the host
+    if sys.byteorder == "big":
+        values = array("d", values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _unpack(data):
+    values = array("d")
+    if data:
+        values.frombytes(data)
+        if sys.byteorder == "big":
+            values.byteswap()
+    return values
+
+
+class MetricDay:
+    """
+    a user's samples of a metric on one UTC day and their buckets
+
+    Chunks read for a bucketed series have their ``times`` and ``values``
+    left empty, only the summary and ``hours`` are loaded.
+    """
+
+    __slots__ = ("day", "times", "values", "hours", "count", "total",
+                 "minimum", "maximum")
+
+    def __init__(self, day, times=None, values=None, hours=None, count=0,
+                 total=0.0, minimum=None, maximum=None):
+        self.day = day
+        self.times = times if times is not None else array("d")
+        self.values = values if values is not None else array("d")
+        self.hours = hours if hours is not None \
+            else array("d", [0.0] * (24 * _BUCKET))
+        self.count = count
+        self.total = total
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @classmethod
+    def from_bytes(cls, day, times=None, values=None, hours=None, count=0,
+                   total=0.0, minimum=None, maximum=None):
+        """
+        a chunk from stored columns, any of the buffers may be left out
+        """
+        return cls(day, _unpack(times), _unpack(values),
+                   _unpack(hours) if hours is not None else None,
+                   count, total, minimum, maximum)
+
+    def to_bytes(self):
+        """
+        the ``times``, ``values`` and ``hours`` buffers to store
+        """
+        return _pack(self.times), _pack(self.values), _pack(self.hours)
+
+    def merged(self, samples):
+        """
+        a new chunk of this one's samples and the ``(seconds since
+        midnight, value)`` ``samples``, chunks are never changed once
+        built so readers can keep using them
+        """
+        merged = sorted(
+            list(zip(self.times, self.values)) + list(samples),
+            key=lambda sample: sample[0])
+        chunk = MetricDay(self.day, array("d", (t for t, _ in merged)),
+                          array("d", (v for _, v in merged)))
+        chunk._summarize()
+        return chunk
+
+    def _summarize(self):
+        hours = [0.0] * (24 * _BUCKET)
+        for t, value in zip(self.times, self.values):
+            i = min(int(t // 3600), 23) * _BUCKET
+            if hours[i]:
+                hours[i + 2] = min(hours[i + 2], value)
+                hours[i + 3] = max(hours[i + 3], value)
+            else:
+                hours[i + 2] = hours[i + 3] = value
+            hours[i] += 1
+            hours[i + 1] += value
+        self.hours = array("d", hours)
+        self.count = len(self.values)
+        self.total = math.fsum(self.values)
+        self.minimum = min(self.values) if self.values else None
+        self.maximum = max(self.values) if self.values else None
+
+
+def day_samples(samples):
+    """
+    ``{(metric, day): [(seconds since midnight, value)]}`` of
+    ``(metric, naive UTC datetime, value)`` samples
+    """
+    days = {}
+    for metric, at, value in samples:
+        midnight = datetime.datetime.combine(at.date(), datetime.time())
+        days.setdefault((metric, at.date()), []).append(
+            ((at - midnight).total_seconds(), value))
+    return days
+
+
+def day_range(start, end, resolution):
+    """
+    the ``[first, end)`` days whose chunks make the series of ``start``
+    to ``end``, weekly series start on the monday of ``start``'s week
+    """
+    first = start.date()
+    if resolution == "week":
+        first -= datetime.timedelta(days=first.weekday())
+    last = end.date()
+    if end > datetime.datetime.combine(last, datetime.time()):
+        last += datetime.timedelta(days=1)
+    return first, max(first, last)
+
+
+def _bucket(start, count, total, minimum, maximum):
+    return {
+        "start": start,
+        "count": int(count),
+        "min": minimum,
+        "avg": total / count,
+        "max": maximum,
+    }
+
+
+def _merge(buckets, start, count, total, minimum, maximum):
+    if buckets and buckets[-1][0] == start:
+        _, c, t, lo, hi = buckets[-1]
+        buckets[-1] = (start, c + count, t + total, min(lo, minimum),
+                       max(hi, maximum))
+    else:
+        buckets.append((start, count, total, minimum, maximum))
+
+
+def series(chunks, start, end, resolution):
+    """
+    the samples or buckets of ``chunks``, sorted by day, between the
+    naive UTC datetimes ``start`` and ``end``
+
+    Raw samples are ``{"measured_at": datetime, "value": float}`` dicts of
+    the samples in ``[start, end)``. Buckets are ``{"start", "count",
+    "min", "avg", "max"}`` dicts of the non empty buckets starting in
+    ``[start, end)`` with ``start`` rounded down to the resolution.
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(
+            f"resolution must be one of {', '.join(RESOLUTIONS)}")
+    points = []
+    if resolution == "raw":
+        for chunk in chunks:
+            midnight = datetime.datetime.combine(chunk.day, datetime.time())
+            for t, value in zip(chunk.times, chunk.values):
+                at = midnight + datetime.timedelta(seconds=t)
+                if start <= at < end:
+                    points.append({"measured_at": at, "value": value})
+        return points
+
+    if resolution == "hour":
+        first = start.replace(minute=0, second=0, microsecond=0)
+        for chunk in chunks:
+            midnight = datetime.datetime.combine(chunk.day, datetime.time())
+            hours = chunk.hours
+            for hour in range(24):
+                count = hours[hour * _BUCKET]
+                at = midnight + datetime.timedelta(hours=hour)
+                if count and first <= at < end:
+                    points.append(_bucket(
+                        at, *hours[hour * _BUCKET:(hour + 1) * _BUCKET]))
+        return points
+
+    first, _ = day_range(start, end, resolution)
+    buckets = []
+    for chunk in chunks:
+        if not chunk.count:
+            continue
+        day = chunk.day
+        if resolution == "week":
+            day -= datetime.timedelta(days=day.weekday())
+        at = datetime.datetime.combine(day, datetime.time())
+        if first <= day and at < end:
+            _merge(buckets, at, chunk.count, chunk.total, chunk.minimum,
+                   chunk.maximum)
+    return [_bucket(*bucket) for bucket in buckets]
@@ -1,6 +1,51 @@
+import calendar
 import datetime
+import re
+
+
+_ISO_8601 = re.compile(
+    r"^(?P<date>\d{4}-\d{2}-\d{2})"
+    r"(?:[T ](?P<time>\d{2}:\d{2}(?::\d{2}(?:\.\d{1,6})?)?))?"
+    r"(?P<tz>Z|[+-]\d{2}:?\d{2})?$"
+)
 
 
 def utcnow():
     now = datetime.datetime.utcnow()
     return now
+
+
+def parse(value):
+    """
+    parse an ISO 8601 date or date time into a naive UTC datetime
+
+    Raises ValueError for anything else.
+    """
+    match = _ISO_8601.match(value.strip()) if isinstance(value, str) else None
+    if match is None:
+        raise ValueError(f"not an ISO 8601 timestamp: {value!r}")
+    date, time, tz = match.group("date", "time", "tz")
+    time = time or "00:00"
+    fmt = "%Y-%m-%d %H:%M"
+    if time.count(":") == 2:
+        fmt += ":%S.%f" if "." in time else ":%S"
+    parsed = datetime.datetime.strptime(f"{date} {time}", fmt)
+    if tz and tz != "Z":
+        sign = 1 if tz[0] == "+" else -1
+        hours, minutes = int(tz[1:3]), int(tz[-2:])
+        parsed -= sign * datetime.timedelta(hours=hours, minutes=minutes)
+    return parsed
+
+
+def to_unix(value):
+    """
+    unix time of a naive UTC datetime
+    """
+    return calendar.timegm(value.utctimetuple()) + value.microsecond / 1e6
+
+
+def from_unix(value):
+    """
+    naive UTC datetime of a unix time
+    """
+    return datetime.datetime.utcfromtimestamp(value)
@@ -1,6 +1,29 @@
 from os import environ
 
+from .config import Config
 from .core import create_app
 
 
-app = create_app(secret_key=environ.get("IDIET_SECRET_KEY", "MY_SECRET"))
+# shared by every server process, unlike an in memory database
+DEFAULT_DB_URL = "sqlite:///idiet-tracking.db"
+
+
+def app_config():
+    """
+    read the app config from the toml file named by IDIET_TRACKING_CONFIG,
+    IDIET_TRACKING_DB_URL overrides the database url and
+    IDIET_TRACKING_WARM_UP=1 turns on warming up
+    """
+    path = environ.get("IDIET_TRACKING_CONFIG")
+    config = Config.from_toml(path).to_dict() if path else {"db": {}}
+    config["db"].setdefault("url", DEFAULT_DB_URL)
+    if "IDIET_TRACKING_DB_URL" in environ:
+        config["db"]["url"] = environ["IDIET_TRACKING_DB_URL"]
+    if "IDIET_TRACKING_WARM_UP" in environ:
+        config.setdefault("startup", {})["warm-up"] = \
+            environ["IDIET_TRACKING_WARM_UP"] not in ("", "0")
+    return config
+
+
+app = create_app(config=app_config(),
+                 secret_key=environ.get("IDIET_SECRET_KEY", "MY_SECRET"))
@@ -2,9 +2,11 @@ import os
 
 from hypothesis import settings
 import pytest
+from sqlalchemy import event
 import webtest
 
 from idiet.tracking.core import create_app
+from idiet.tracking.encrypt import configure_hashing
 
 
 settings.register_profile("debug", max_examples=1, deadline=None)
@@ -13,6 +15,68 @@ settings.register_profile("slow", max_examples=100, deadline=300)
 settings.register_profile("nightly", max_examples=1000, deadline=300)
 settings.load_profile(os.getenv("HYPOTHESIS_PROFILE", "debug"))
 
+# a full strength hash takes ~100ms, far longer than anything else a test
+# does, tests checking the hashing itself configure their own
+TEST_HASH_METHOD = "pbkdf2:sha256:1000"
+
+
+@pytest.fixture(autouse=True, scope="session")
+def fast_password_hashing():
+    configure_hashing(method=TEST_HASH_METHOD)
+    yield
+    configure_hashing()
+
+
+def food(name, group="Poultry Products", fat=1.0, protein=10.0, carbs=0.0,
+         calories=100.0):
+    """
+    a ``FoodFact.to_dict`` record
+    """
+    return {
+        "name": name,
+        "group": group,
+        "fat_in_grams": fat,
+        "protein_in_grams": protein,
+        "carbohydrates_in_grams": carbs,
+        "calories": calories,
+    }
+
+
+# a small catalog as ``(foodid, record)`` pairs, with missing values, gaps
+# in the ids and a name that isn't ascii
+FOODS = [
+    (1, food("chicken breast", protein=31, calories=165)),
+    (2, food("chicken thigh, roasted", fat=11, protein=26, calories=209)),
+    (3, food("egg", group="Dairy and Egg Products", protein=13,
+             calories=155)),
+    (4, food("turkey", protein=29, calories=None)),
+    (7, food("duck", group=None, fat=28, protein=19, calories=337)),
+    (9, food("chiken nuggets", fat=None, protein=15, calories=296)),
+    (12, food("crème brûlée", group="Sweets", protein=4, calories=330)),
+]
+
+
+class Clock:
+    """
+    a clock for the ``clock`` arguments, moved by setting ``now``
+    """
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def auth_headers(app, username, password):
+    """
+    register and login a user, return the headers to make requests as them
+    """
+    post_data = {"username": username, "password": password}
+    app.post_json("/api/register", post_data)
+    token = app.post_json("/api/login", post_data).json["token"]
+    return {"Authorization": f"Bearer {token}"}
+
 
 @pytest.fixture
 def test_app():
@@ -21,3 +85,29 @@ def test_app():
     }
     client = webtest.TestApp(create_app(config=config))
     return client
+
+
+class QueryCounter:
+    """
+    records the sql statements an engine executes inside a with block
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, "before_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context,
+                executemany):
+        self.statements.append(statement)
+
+    def count(self, verb):
+        return sum(
+            1 for s in self.statements if s.lstrip().upper().startswith(verb)
+        )
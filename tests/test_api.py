@@ -1,8 +1,12 @@
+from datetime import timedelta
+import json
 from string import ascii_letters
 import random
 import re
 
 from faker import Faker
+import jwt
+import pytest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from hypothesis import strategies as st, given, settings
@@ -10,6 +14,12 @@ import webtest
 
 from idiet.tracking.core import create_app
 from idiet.tracking.backend.db import SqlAlchemyBackend, FoodFact
+from idiet.tracking.api import MAX_SEARCH_RESULTS, STREAM_SEARCH_RESULTS
+from idiet.tracking.api import parse_meal
+from idiet.tracking.autocomplete import PopularityUpdater
+from idiet.tracking.backend.memory import MemoryBackend
+from idiet.tracking.timestamp import utcnow, parse
+from tests.conftest import Clock, QueryCounter, auth_headers
 
 
 def fullname():
@@ -101,6 +111,61 @@ class TestLoginView(object):
         assert response.json["status"] == "failed"
 
 
+class TestLogout:
+
+    @given(username=st.emails(), password=st.text(alphabet=ascii_letters))
+    def test_logout_revokes_the_token(self, username, password):
+        app = webtest.TestApp(create_app(secret_key="key"))
+        headers = auth_headers(app, username, password)
+        other = auth_headers(app, username, password)
+        app.get("/api/user/profile", headers=headers)
+
+        response = app.post("/api/logout", headers=headers)
+        assert response.json["status"] == "success"
+        app.get("/api/user/profile", headers=headers, status=401)
+        app.post("/api/logout", headers=headers, status=401)
+        # the user's other sessions are still logged in
+        app.get("/api/user/profile", headers=other)
+
+    @given(username=st.emails(), password=st.text(alphabet=ascii_letters))
+    def test_logout_all(self, username, password):
+        app = webtest.TestApp(create_app(secret_key="key"))
+        sessions = [auth_headers(app, username, password) for _ in range(3)]
+        for headers in sessions:
+            app.get("/api/user/profile", headers=headers)
+
+        response = app.post("/api/logout/all", headers=sessions[0])
+        assert response.json["num_revoked"] == 3
+        for headers in sessions:
+            app.get("/api/user/profile", headers=headers, status=401)
+        headers = auth_headers(app, username, password)
+        app.get("/api/user/profile", headers=headers)
+
+    def test_revocation_reaches_other_workers(self, tmp_path):
+        config = {
+            "db": {"url": f"sqlite:///{tmp_path / 'tracking.db'}"},
+            "token-revocation": {"sync-interval": 0},
+        }
+        first = webtest.TestApp(create_app(config=config, secret_key="key"))
+        second = webtest.TestApp(create_app(config=config, secret_key="key"))
+        headers = auth_headers(first, "user@example.com", "password")
+        second.get("/api/user/profile", headers=headers)
+
+        first.post("/api/logout", headers=headers)
+        second.get("/api/user/profile", headers=headers, status=401)
+
+    def test_tokens_without_an_id_are_rejected(self):
+        app = webtest.TestApp(create_app(secret_key="key"))
+        auth_headers(app, "user@example.com", "password")
+        payload = {
+            "user": "user@example.com",
+            "exp": utcnow() + timedelta(hours=1)
+        }
+        token = jwt.encode(payload, "key", algorithm="HS256").decode("utf-8")
+        headers = {"Authorization": f"Bearer {token}"}
+        app.get("/api/user/profile", headers=headers, status=401)
+
+
 class TestUserProfileView(object):
 
     @given(username=st.emails(), password=st.text(alphabet=ascii_letters))
@@ -121,6 +186,8 @@ class TestUserProfileView(object):
         assert data["member_since"]
         assert not data["name"]
         assert not data["gender"]
+        assert parse(response.json["ts"]) <= utcnow()
+        assert parse(data["member_since"]).date() <= utcnow().date()
 
     @given(
         username=st.emails(),
@@ -151,6 +218,126 @@ class TestUserProfileView(object):
         response = app.get("/api/user/profile", headers=headers)
         assert response.json["data"] == data
 
+    @given(username=st.emails(), password=st.text(alphabet=ascii_letters))
+    def test_token_cache(self, username, password):
+        backend = SqlAlchemyBackend(create_engine("sqlite://"))
+        backend.init()
+        app = webtest.TestApp(create_app(backend=backend, secret_key="key"))
+        post_data = {"username": username, "password": password}
+        app.post_json("/api/register", post_data)
+        token = app.post_json("/api/login", post_data).json["token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        app.get("/api/user/profile", headers=headers)
+        app.get("/api/user/profile", headers=headers)
+        cache = backend.token_cache
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        app.post_json("/api/user/profile", {"name": "n", "gender": "g"},
+                      headers=headers)
+        assert token not in cache
+        response = app.get("/api/user/profile", headers=headers)
+        assert response.json["data"]["name"] == "n"
+
+        headers = {"Authorization": f"Bearer {token}x"}
+        app.get("/api/user/profile", headers=headers, status=401)
+
+
+class TestProfileUpdates:
+
+    @given(username=st.emails(), password=st.text(alphabet=ascii_letters))
+    @settings(max_examples=1)
+    def test_partial_update(self, username, password):
+        app = webtest.TestApp(create_app(secret_key="key"))
+        headers = auth_headers(app, username, password)
+        app.post_json("/api/user/profile", {"name": "n", "gender": "g"},
+                      headers=headers)
+
+        app.post_json("/api/user/profile",
+                      {"weight_in_kg": 70, "target_calories": 2000},
+                      headers=headers, status=202)
+        data = app.get("/api/user/profile", headers=headers).json["data"]
+        assert (data["name"], data["gender"]) == ("n", "g")
+        assert (data["weight_in_kg"], data["target_calories"]) == (70, 2000)
+
+        for post_data in ({}, {"height": 180}, {"weight_in_kg": "70"}, []):
+            response = app.post_json("/api/user/profile", post_data,
+                                     headers=headers, status=400)
+            assert response.json["status"] == "failed"
+
+    @given(username=st.emails(), password=st.text(alphabet=ascii_letters))
+    @settings(max_examples=1)
+    def test_version_conflict(self, username, password):
+        app = webtest.TestApp(create_app(secret_key="key"))
+        headers = auth_headers(app, username, password)
+        response = app.get("/api/user/profile", headers=headers)
+        etag = response.headers["ETag"]
+        version = int(etag.strip('"').split("-")[-1])
+
+        response = app.post_json("/api/user/profile",
+                                 {"name": "a", "version": version},
+                                 headers=headers, status=202)
+        assert response.json["version"] == version + 1
+        new_etag = response.headers["ETag"]
+        assert new_etag != etag
+
+        # a second client still holding the old version
+        app.post_json("/api/user/profile", {"name": "b", "version": version},
+                      headers=headers, status=409)
+        for invalid in (str(version + 1), [version + 1], float(version + 1),
+                        True):
+            app.post_json("/api/user/profile",
+                          {"name": "b", "version": invalid},
+                          headers=headers, status=400)
+        app.post_json("/api/user/profile", {"name": "b"}, status=412,
+                      headers=dict(headers, **{"If-Match": etag}))
+        data = app.get("/api/user/profile", headers=headers).json["data"]
+        assert data["name"] == "a"
+
+        response = app.post_json(
+            "/api/user/profile", {"name": "b"}, status=202,
+            headers=dict(headers, **{"If-Match": new_etag}))
+        etag = response.headers["ETag"]
+        app.get("/api/user/profile", status=304,
+                headers=dict(headers, **{"If-None-Match": etag}))
+
+    def test_admin_bulk_update(self):
+        config = {"admins": ["admin@example.com"]}
+        app = webtest.TestApp(create_app(config=config, secret_key="key"))
+        admin = auth_headers(app, "admin@example.com", "password")
+        users = [f"user{i}@example.com" for i in range(3)]
+        user_headers = [auth_headers(app, user, "password") for user in users]
+
+        post_data = {"profiles": [
+            {"username": user, "profile": {"target_calories": 1800 + i}}
+            for i, user in enumerate(users)
+        ]}
+        app.post_json("/api/admin/profiles", post_data,
+                      headers=user_headers[0], status=403)
+        response = app.post_json("/api/admin/profiles", post_data,
+                                 headers=admin)
+        assert response.json["versions"] == {user: 2 for user in users}
+        for i, headers in enumerate(user_headers):
+            data = app.get("/api/user/profile", headers=headers).json["data"]
+            assert data["target_calories"] == 1800 + i
+
+        post_data = {"profiles": [
+            {"username": users[0], "profile": {"name": "x"}, "version": 2},
+            {"username": users[1], "profile": {"name": "x"}, "version": 1},
+        ]}
+        response = app.post_json("/api/admin/profiles", post_data,
+                                 headers=admin, status=409)
+        assert response.json["conflicts"] == [users[1]]
+        data = app.get("/api/user/profile",
+                       headers=user_headers[0]).json["data"]
+        assert data["name"] is None
+
+        for post_data in ({}, {"profiles": []}, {"profiles": [{}]},
+                          {"profiles": [{"username": "nobody@example.com",
+                                         "profile": {"name": "x"}}]}):
+            app.post_json("/api/admin/profiles", post_data, headers=admin,
+                          status=400)
+
 
 class TestFoodSearch:
     """
@@ -189,3 +376,579 @@ class TestFoodSearch:
 
         data = response.json["data"]
         assert data[0]["name"] == chicken.foodname
+
+    @given(
+        username=st.emails(),
+        password=st.text(alphabet=ascii_letters)
+    )
+    @settings(max_examples=1)
+    def test_food_search_closest_match(self, username, password):
+
+        engine = create_engine("sqlite://")
+        db = SqlAlchemyBackend(engine)
+        db.init()
+
+        Session = sessionmaker(bind=engine, autoflush=True)
+        session = Session()
+        session.add(FoodFact(foodname="chicken, roasted", calories=190))
+        session.add(FoodFact(foodname="chicken", calories=28.5))
+        session.add(FoodFact(foodname="chickpeas", calories=164))
+        session.commit()
+
+        app = webtest.TestApp(create_app(backend=db, secret_key="key"))
+        post_data = {"username": username, "password": password}
+        app.post_json("/api/register", post_data)
+        token = app.post_json("/api/login", post_data).json["token"]
+
+        headers = {"Authorization": f"Bearer {token}"}
+        params = {"name": "chiken", "max_results": "2"}
+        response = app.get("/api/food/search", params, headers=headers)
+
+        data = response.json["data"]
+        assert response.json["num_results"] == 2
+        assert [food["name"] for food in data] == [
+            "chicken", "chicken, roasted"
+        ]
+
+        params = {"name": "chicken", "max_results": "ten"}
+        app.get("/api/food/search", params, headers=headers, status=400)
+
+        session.add(FoodFact(foodname="beef jerky", calories=410))
+        session.commit()
+        params = {"name": "jerky"}
+        response = app.get("/api/food/search", params, headers=headers)
+        assert response.json["num_results"] == 0
+
+        db.food_index_rebuild()
+        response = app.get("/api/food/search", params, headers=headers)
+        assert response.json["data"][0]["name"] == "beef jerky"
+
+    @given(
+        username=st.emails(),
+        password=st.text(alphabet=ascii_letters)
+    )
+    @settings(max_examples=1)
+    def test_food_search_by_nutrients(self, username, password):
+
+        engine = create_engine("sqlite://")
+        db = SqlAlchemyBackend(engine)
+        db.init()
+
+        Session = sessionmaker(bind=engine, autoflush=True)
+        session = Session()
+        session.add(FoodFact(foodname="chicken", foodgroup="Poultry",
+                             proteing=31, calories=165))
+        session.add(FoodFact(foodname="duck", foodgroup="Poultry",
+                             proteing=19, calories=337))
+        session.add(FoodFact(foodname="egg", foodgroup="Eggs",
+                             proteing=13, calories=155))
+        session.commit()
+
+        app = webtest.TestApp(create_app(backend=db, secret_key="key"))
+        headers = auth_headers(app, username, password)
+
+        params = {"mode": "nutrients", "group": "Poultry",
+                  "min_protein": "20", "max_calories": "300"}
+        response = app.get("/api/food/search", params, headers=headers)
+        assert [f["name"] for f in response.json["data"]] == ["chicken"]
+
+        params = {"mode": "nutrients", "sort": "protein_per_calorie",
+                  "order": "asc"}
+        response = app.get("/api/food/search", params, headers=headers)
+        assert [f["name"] for f in response.json["data"]] == [
+            "duck", "egg", "chicken"
+        ]
+
+        for params in ({"mode": "nutrients", "min_protein": "lots"},
+                       {"mode": "nutrients", "sort": "name"},
+                       {"mode": "nutrients", "order": "up"},
+                       {"mode": "colour"}):
+            app.get("/api/food/search", params, headers=headers, status=400)
+
+
+class TestFoodSearchPages:
+
+    @given(username=st.emails(), password=st.text(alphabet=ascii_letters))
+    @settings(max_examples=1)
+    def test_cursor_pages(self, username, password):
+        backend = MemoryBackend(
+            {"name": f"apple {i}", "calories": i % 7} for i in range(25))
+        app = webtest.TestApp(create_app(backend=backend, secret_key="key"))
+        headers = auth_headers(app, username, password)
+
+        for search in ({"name": "apple"},
+                       {"mode": "nutrients", "sort": "calories"},
+                       {"mode": "nutrients"}):
+            expected = app.get("/api/food/search",
+                               dict(search, max_results="100"),
+                               headers=headers).json
+            assert expected["next_cursor"] is None
+            names = []
+            params = dict(search, max_results="10")
+            while True:
+                page = app.get("/api/food/search", params,
+                               headers=headers).json
+                names.extend(food["name"] for food in page["data"])
+                if page["next_cursor"] is None:
+                    break
+                params["cursor"] = page["next_cursor"]
+            assert names == [food["name"] for food in expected["data"]]
+
+    @given(username=st.emails(), password=st.text(alphabet=ascii_letters))
+    @settings(max_examples=1)
+    def test_invalid_cursors_and_page_cap(self, username, password):
+        backend = MemoryBackend(
+            {"name": f"apple {i}"} for i in range(MAX_SEARCH_RESULTS + 5))
+        app = webtest.TestApp(create_app(backend=backend, secret_key="key"))
+        headers = auth_headers(app, username, password)
+
+        response = app.get("/api/food/search",
+                           {"mode": "nutrients", "max_results": "5000"},
+                           headers=headers)
+        assert response.json["num_results"] == MAX_SEARCH_RESULTS
+        cursor = response.json["next_cursor"]
+        assert cursor
+
+        for params in ({"mode": "nutrients", "cursor": "not a cursor"},
+                       {"mode": "nutrients", "cursor": cursor[:-4]},
+                       {"mode": "nutrients", "group": "Fruits",
+                        "cursor": cursor},
+                       {"name": "apple", "cursor": cursor}):
+            app.get("/api/food/search", params, headers=headers, status=400)
+
+
+class TestFoodAutocomplete:
+
+    @given(username=st.emails(), password=st.text(alphabet=ascii_letters))
+    @settings(max_examples=1)
+    def test_autocomplete(self, username, password):
+        backend = MemoryBackend(
+            [{"name": "chicken, roasted"}, {"name": "chicken"},
+             {"name": "beef"}])
+        config = {"autocomplete": {"popularity-interval": 0}}
+        app = webtest.TestApp(
+            create_app(config=config, backend=backend, secret_key="key"))
+        headers = auth_headers(app, username, password)
+
+        response = app.get("/api/food/autocomplete", {"prefix": "ch"},
+                           headers=headers)
+        assert [(f["food_id"], f["name"]) for f in response.json["data"]] \
+            == [(2, "chicken"), (1, "chicken, roasted")]
+
+        meal = {"food_id": 1, "logged_at": "2020-05-01T12:00:00Z"}
+        app.post_json("/api/user/meals", meal, headers=headers, status=201)
+        backend.food_popularity_refresh()
+        response = app.get("/api/food/autocomplete",
+                           {"prefix": "ch", "max_results": "1"},
+                           headers=headers)
+        assert [f["food_id"] for f in response.json["data"]] == [1]
+
+        app.get("/api/food/autocomplete", headers=headers, status=400)
+        app.get("/api/food/autocomplete", {"prefix": "ch", "max_results": "x"},
+                headers=headers, status=400)
+
+    def test_popularity_refreshes_after_the_response(self):
+        engine = create_engine("sqlite://")
+        backend = SqlAlchemyBackend(engine)
+        backend.init()
+        session = sessionmaker(bind=engine)()
+        session.add_all([FoodFact(foodname="chicken"),
+                         FoodFact(foodname="chicken, roasted")])
+        session.commit()
+        flask_app = create_app(backend=backend, secret_key="key")
+        clock = Clock()
+        flask_app.popularity_updater = PopularityUpdater(
+            backend.food_popularity_refresh, interval=60, clock=clock)
+        app = webtest.TestApp(flask_app)
+        headers = auth_headers(app, "user@example.com", "password")
+
+        def completions():
+            response = app.get("/api/food/autocomplete", {"prefix": "ch"},
+                               headers=headers)
+            return [f["name"] for f in response.json["data"]]
+
+        assert completions() == ["chicken", "chicken, roasted"]
+        meal = {"food_id": 2, "logged_at": "2020-05-01T12:00:00Z"}
+        app.post_json("/api/user/meals", meal, headers=headers, status=201)
+        clock.now += 60
+        # the request after the interval gets the old ranking, the refresh
+        # runs once it's sent and reads the same in memory database
+        assert completions() == ["chicken", "chicken, roasted"]
+        assert completions() == ["chicken, roasted", "chicken"]
+
+
+class TestConditionalRequests:
+
+    @given(username=st.emails(), password=st.text(alphabet=ascii_letters))
+    @settings(max_examples=5)
+    def test_profile_etag(self, username, password):
+        backend = SqlAlchemyBackend(create_engine("sqlite://"))
+        backend.init()
+        app = webtest.TestApp(create_app(backend=backend, secret_key="key"))
+        headers = auth_headers(app, username, password)
+
+        response = app.get("/api/user/profile", headers=headers)
+        etag = response.headers["ETag"]
+        assert response.headers["Cache-Control"] == "private, no-cache"
+        assert "Authorization" in response.headers["Vary"]
+
+        with QueryCounter(backend.engine) as counter:
+            response = app.get(
+                "/api/user/profile", status=304,
+                headers=dict(headers, **{"If-None-Match": etag}))
+        assert response.headers["ETag"] == etag
+        assert counter.count("SELECT") == 0
+
+        app.post_json("/api/user/profile", {"name": "n", "gender": "g"},
+                      headers=headers)
+        response = app.get("/api/user/profile", status=202,
+                           headers=dict(headers, **{"If-None-Match": etag}))
+        assert response.headers["ETag"] != etag
+        assert response.json["data"]["name"] == "n"
+
+    @given(username=st.emails(), password=st.text(alphabet=ascii_letters))
+    @settings(max_examples=1)
+    def test_food_search_etag_and_cache(self, username, password):
+        engine = create_engine("sqlite://")
+        db = SqlAlchemyBackend(engine)
+        db.init()
+        session = sessionmaker(bind=engine)()
+        session.add(FoodFact(foodname="chicken", calories=28.5))
+        session.commit()
+        flask_app = create_app(backend=db, secret_key="key")
+        app = webtest.TestApp(flask_app)
+        headers = auth_headers(app, username, password)
+
+        params = {"name": "chicken"}
+        first = app.get("/api/food/search", params, headers=headers)
+        etag = first.headers["ETag"]
+        second = app.get("/api/food/search", params, headers=headers)
+        assert second.body == first.body
+        assert flask_app.response_cache.hits == 1
+
+        app.get("/api/food/search", params, status=304,
+                headers=dict(headers, **{"If-None-Match": etag}))
+        # invalid searches are a 400 even with a current ETag
+        for invalid in ({"name": "chicken", "max_results": "x"},
+                        {"name": "chicken", "cursor": "nonsense"},
+                        {"mode": "nutrients", "sort": "taste"}):
+            app.get("/api/food/search", invalid, status=400,
+                    headers=dict(headers, **{"If-None-Match": etag}))
+
+        session.add(FoodFact(foodname="chicken soup", calories=40))
+        session.commit()
+        db.food_index_rebuild()
+        response = app.get("/api/food/search", params, status=202,
+                           headers=dict(headers, **{"If-None-Match": etag}))
+        assert response.headers["ETag"] != etag
+        assert response.json["num_results"] == 2
+
+
+class TestUserMealsView:
+
+    @given(username=st.emails(), password=st.text(alphabet=ascii_letters))
+    def test_log_single_meal(self, username, password):
+        app = webtest.TestApp(create_app(secret_key="key"))
+        headers = auth_headers(app, username, password)
+
+        meal = {"name": "oatmeal", "calories": 150, "servings": 2,
+                "logged_at": "2020-05-01T08:30:00"}
+        response = app.post_json("/api/user/meals", meal, headers=headers)
+        assert response.status_code == 201
+        assert response.json["num_meals"] == 1
+
+        response = app.get("/api/user/meals", headers=headers)
+        data = response.json["data"]
+        assert len(data) == 1
+        assert data[0]["name"] == "oatmeal"
+        assert data[0]["servings"] == 2
+        assert data[0]["calories"] == 150
+
+    @given(username=st.emails(), password=st.text(alphabet=ascii_letters))
+    def test_log_batch_and_read_range(self, username, password):
+        app = webtest.TestApp(create_app(secret_key="key"))
+        headers = auth_headers(app, username, password)
+        other = auth_headers(app, "other" + username, password)
+
+        meals = [
+            {"name": f"meal {i}", "logged_at": f"2020-05-01T{i:02d}:00:00"}
+            for i in range(24)
+        ]
+        response = app.post_json("/api/user/meals", {"meals": meals},
+                                 headers=headers)
+        assert response.json["num_meals"] == 24
+
+        params = {"start": "2020-05-01T06:00:00", "end": "2020-05-01T12:00"}
+        response = app.get("/api/user/meals", params, headers=headers)
+        names = [meal["name"] for meal in response.json["data"]]
+        assert names == [f"meal {i}" for i in range(6, 12)]
+
+        response = app.get("/api/user/meals", {"limit": 3}, headers=headers)
+        assert response.json["num_results"] == 3
+
+        response = app.get("/api/user/meals", headers=other)
+        assert response.json["num_results"] == 0
+
+    @given(username=st.emails(), password=st.text(alphabet=ascii_letters))
+    def test_invalid_meals(self, username, password):
+        app = webtest.TestApp(create_app(secret_key="key"))
+        headers = auth_headers(app, username, password)
+
+        for meals in ([], [{}], [{"name": "x", "calories": "many"}],
+                      [{"name": "x", "logged_at": "yesterday"}],
+                      [{"food_id": "chicken"}]):
+            app.post_json("/api/user/meals", {"meals": meals},
+                          headers=headers, status=400)
+        app.get("/api/user/meals", {"start": "soon"}, headers=headers,
+                status=400)
+        assert app.app.backend.user_meals_get(
+            app.app.backend.get_user(username)) == []
+
+    @given(username=st.emails(), password=st.text(alphabet=ascii_letters))
+    @settings(max_examples=1)
+    def test_negative_or_infinite_numbers(self, username, password):
+        app = webtest.TestApp(create_app(secret_key="key"))
+        headers = auth_headers(app, username, password)
+
+        for meal in ({"name": "x", "servings": -3, "calories": 100},
+                     {"name": "x", "calories": -100}):
+            response = app.post_json("/api/user/meals", meal,
+                                     headers=headers, status=400)
+            assert response.json["status"] == "failed"
+        # orjson already refuses to parse them, the stdlib json doesn't
+        for meal in ({"name": "x", "fat_in_grams": float("nan")},
+                     {"name": "x", "protein_in_grams": float("inf")}):
+            app.post_json("/api/user/meals", meal, headers=headers,
+                          status=400)
+            with pytest.raises(ValueError):
+                parse_meal(meal)
+        app.post_json("/api/user/meals", {"name": "x", "calories": 0},
+                      headers=headers, status=201)
+        assert len(app.app.backend.user_meals_get(
+            app.app.backend.get_user(username))) == 1
+
+
+class TestDailyNutrition:
+
+    @given(username=st.emails(), password=st.text(alphabet=ascii_letters))
+    @settings(max_examples=1)
+    def test_rollup_updates_with_every_meal(self, username, password):
+        engine = create_engine("sqlite://")
+        db = SqlAlchemyBackend(engine)
+        db.init()
+        session = sessionmaker(bind=engine)()
+        chicken = FoodFact(foodname="chicken", fatg=0.5, proteing=6,
+                           carbohydrateg=0, calories=28.5)
+        session.add(chicken)
+        session.commit()
+        chicken_id = chicken.foodid
+
+        app = webtest.TestApp(create_app(backend=db, secret_key="key"))
+        headers = auth_headers(app, username, password)
+
+        meals = [
+            {"food_id": chicken_id, "servings": 2,
+             "logged_at": "2020-05-01T12:00:00"},
+            {"name": "toast", "calories": 80, "carbs_in_grams": 15,
+             "logged_at": "2020-05-01T08:00:00"},
+            {"name": "apple", "calories": 95, "carbs_in_grams": 25,
+             "logged_at": "2020-05-03T08:00:00"},
+        ]
+        app.post_json("/api/user/meals", {"meals": meals}, headers=headers)
+        app.post_json("/api/user/meals",
+                      {"food_id": chicken_id, "protein_in_grams": 10,
+                       "logged_at": "2020-05-03T19:00:00"},
+                      headers=headers)
+
+        params = {"end": "2020-05-03", "days": 3}
+        response = app.get("/api/user/nutrition/daily", params,
+                           headers=headers)
+        first, second, third = response.json["data"]
+        assert first == {
+            "day": "2020-05-01",
+            "calories": 28.5 * 2 + 80,
+            "fat_in_grams": 1.0,
+            "protein_in_grams": 12.0,
+            "carbohydrates_in_grams": 15.0,
+            "num_meals": 2,
+        }
+        assert second["day"] == "2020-05-02"
+        assert second["num_meals"] == 0
+        assert second["calories"] == 0
+        assert third["calories"] == 95 + 28.5
+        assert third["protein_in_grams"] == 10
+        assert third["num_meals"] == 2
+
+        app.post_json("/api/user/meals", {"food_id": chicken_id + 1},
+                      headers=headers, status=400)
+        app.get("/api/user/nutrition/daily", {"days": 0}, headers=headers,
+                status=400)
+        response = app.get("/api/user/nutrition/daily", headers=headers)
+        assert response.json["num_results"] == 30
+
+
+class TestExport:
+
+    @given(username=st.emails(), password=st.text(alphabet=ascii_letters))
+    @settings(max_examples=1)
+    def test_ndjson_and_csv(self, username, password):
+        app = webtest.TestApp(create_app(secret_key="key"))
+        headers = auth_headers(app, username, password)
+        meals = [
+            {"name": f"meal {i}", "calories": i,
+             "logged_at": f"2020-05-01T{i:02}:00:00Z"}
+            for i in range(24)
+        ]
+        app.post_json("/api/user/meals", {"meals": meals}, headers=headers)
+
+        response = app.get("/api/user/export", headers=headers)
+        assert response.content_type == "application/x-ndjson"
+        assert "attachment" in response.headers["Content-Disposition"]
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [line["name"] for line in lines] \
+            == [meal["name"] for meal in meals]
+        assert lines[0]["logged_at"] == "2020-05-01T00:00:00Z"
+
+        # a broken off export continues after the last meal received
+        response = app.get("/api/user/export",
+                           {"after": lines[9]["id"]}, headers=headers)
+        assert [json.loads(line)["calories"]
+                for line in response.text.splitlines()] == list(range(10, 24))
+
+        response = app.get("/api/user/export",
+                           {"format": "csv", "end": "2020-05-01T02:00:00Z"},
+                           headers=headers)
+        assert response.content_type == "text/csv"
+        header, first, second = response.text.splitlines()
+        assert header.startswith("id,logged_at,")
+        assert second.split(",")[3] == "meal 1"
+
+    @given(username=st.emails(), password=st.text(alphabet=ascii_letters))
+    @settings(max_examples=1)
+    def test_invalid_requests(self, username, password):
+        app = webtest.TestApp(create_app(backend="memory", secret_key="key"))
+        headers = auth_headers(app, username, password)
+        app.get("/api/user/export", status=401)
+        for params in ({"format": "xml"}, {"after": "x"}, {"after": 12},
+                       {"start": "yesterday"}):
+            app.get("/api/user/export", params, headers=headers, status=400)
+        response = app.get("/api/user/export", {"format": "csv"},
+                           headers=headers)
+        assert response.text.count("\n") == 1
+
+
+class TestBodyMetrics:
+
+    @given(username=st.emails(), password=st.text(alphabet=ascii_letters))
+    @settings(max_examples=1)
+    def test_ingest_and_read_ranges(self, username, password):
+        app = webtest.TestApp(create_app(secret_key="key"))
+        headers = auth_headers(app, username, password)
+
+        samples = [
+            {"metric": "weight_in_kg", "value": 70.5,
+             "measured_at": "2020-05-01T07:00:00Z"},
+            {"metric": "weight_in_kg", "value": 71.5,
+             "measured_at": "2020-05-01T21:00:00Z"},
+            {"metric": "steps", "value": 5000,
+             "measured_at": "2020-05-01T18:00:00Z"},
+        ]
+        response = app.post_json("/api/user/metrics", {"samples": samples},
+                                 headers=headers, status=201)
+        assert response.json["num_samples"] == 3
+        app.post_json("/api/user/metrics",
+                      {"metric": "weight_in_kg", "value": 70,
+                       "measured_at": "2020-05-08T07:00:00Z"},
+                      headers=headers, status=201)
+
+        params = {"start": "2020-05-01", "end": "2020-05-09"}
+        response = app.get("/api/user/metrics/weight_in_kg", params,
+                           headers=headers)
+        assert response.json["resolution"] == "day"
+        assert response.json["data"] == [
+            {"start": "2020-05-01T00:00:00Z", "count": 2, "min": 70.5,
+             "avg": 71.0, "max": 71.5},
+            {"start": "2020-05-08T00:00:00Z", "count": 1, "min": 70.0,
+             "avg": 70.0, "max": 70.0},
+        ]
+        response = app.get("/api/user/metrics/weight_in_kg",
+                           dict(params, resolution="week"), headers=headers)
+        assert [week["count"] for week in response.json["data"]] == [2, 1]
+        response = app.get("/api/user/metrics/weight_in_kg",
+                           dict(params, resolution="raw"), headers=headers)
+        assert response.json["data"][0] == {
+            "measured_at": "2020-05-01T07:00:00Z", "value": 70.5}
+        response = app.get("/api/user/metrics/steps",
+                           dict(params, resolution="hour"), headers=headers)
+        assert response.json["data"][0]["start"] == "2020-05-01T18:00:00Z"
+
+    @given(username=st.emails(), password=st.text(alphabet=ascii_letters))
+    @settings(max_examples=1)
+    def test_invalid_requests(self, username, password):
+        app = webtest.TestApp(create_app(backend="memory", secret_key="key"))
+        headers = auth_headers(app, username, password)
+
+        for post_data in ({"samples": []},
+                          {"metric": "height", "value": 1},
+                          {"metric": "steps", "value": "many"},
+                          {"metric": "steps", "value": 1,
+                           "measured_at": "yesterday"}):
+            app.post_json("/api/user/metrics", post_data, headers=headers,
+                          status=400)
+        too_many = [{"metric": "steps", "value": 1}] * 1001
+        app.post_json("/api/user/metrics", {"samples": too_many},
+                      headers=headers, status=413)
+
+        app.get("/api/user/metrics/height", headers=headers, status=404)
+        for params in ({"resolution": "month"},
+                       {"start": "2020-05-02", "end": "2020-05-01"},
+                       {"start": "2019-01-01", "end": "2020-05-01"},
+                       {"start": "2020-01-01", "end": "2020-05-01",
+                        "resolution": "raw"}):
+            app.get("/api/user/metrics/steps", params, headers=headers,
+                    status=400)
+        app.get("/api/user/metrics/steps",
+                {"start": "2019-05-01", "end": "2020-05-01"},
+                headers=headers)
+
+
+class TestMemoryBackend:
+
+    @given(username=st.emails(), password=st.text(alphabet=ascii_letters))
+    def test_user_flow(self, username, password):
+        app = webtest.TestApp(create_app(backend="memory", secret_key="key"))
+        headers = auth_headers(app, username, password)
+
+        post_data = {"username": username, "password": password}
+        app.post_json("/api/register", post_data, status=302)
+        app.post_json("/api/user/profile", {"name": "n", "gender": "g"},
+                      headers=headers)
+        response = app.get("/api/user/profile", headers=headers)
+        assert response.json["data"]["name"] == "n"
+
+        meal = {"name": "soup", "calories": 100,
+                "logged_at": "2020-05-01T12:00:00Z"}
+        app.post_json("/api/user/meals", meal, headers=headers, status=201)
+        response = app.get("/api/user/nutrition/daily",
+                           {"end": "2020-05-01", "days": 1}, headers=headers)
+        assert response.json["data"][0]["calories"] == 100
+
+        app.post("/api/logout", headers=headers)
+        app.get("/api/user/profile", headers=headers, status=401)
+
+    @given(username=st.emails(), password=st.text(alphabet=ascii_letters))
+    @settings(max_examples=1)
+    def test_large_searches_are_streamed(self, username, password):
+        n_foods = STREAM_SEARCH_RESULTS + 10
+        backend = MemoryBackend(
+            {"name": f"apple {i}", "calories": i} for i in range(n_foods))
+        flask_app = create_app(backend=backend, secret_key="key")
+        app = webtest.TestApp(flask_app)
+        headers = auth_headers(app, username, password)
+
+        params = {"mode": "nutrients", "max_results": str(n_foods)}
+        response = app.get("/api/food/search", params, headers=headers)
+        assert response.json["num_results"] == n_foods
+        assert response.json["data"][-1]["name"] == f"apple {n_foods - 1}"
+        assert response.headers["ETag"]
+        assert len(flask_app.response_cache) == 0
@@ -0,0 +1,211 @@
+import asyncio
+import json
+
+from idiet.tracking.asgi_adapter import ASGIAdapter, build_environ
+from idiet.tracking.core import create_app
+
+
+USER = {"username": "user@example.com", "password": "password"}
+
+
+async def call(app, method, path, body=None, headers=(), query=b"",
+               chunk_size=None):
+    """
+    send one request to an ASGI app, returns status, headers and body
+    """
+    data = json.dumps(body).encode() if body is not None else b""
+    chunks = [data]
+    if chunk_size:
+        chunks = [data[i:i + chunk_size]
+                  for i in range(0, len(data), chunk_size)] or [b""]
+    messages = [
+        {"type": "http.request", "body": chunk,
+         "more_body": i < len(chunks) - 1}
+        for i, chunk in enumerate(chunks)
+    ]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query,
+        "headers": [(b"content-type", b"application/json")] + [
+            (name.encode(), value.encode()) for name, value in headers
+        ],
+    }
+    await app(scope, receive, send)
+    start, *body_messages = sent
+    assert not body_messages[-1].get("more_body")
+    return (
+        start["status"],
+        dict(start["headers"]),
+        b"".join(message["body"] for message in body_messages),
+    )
+
+
+def tracking_app(threads=4, db_url=None):
+    # requests run on several threads, which an in memory database can't
+    # be shared between
+    config = {"db": {"url": db_url}} if db_url else None
+    return ASGIAdapter(create_app(config=config, secret_key="key"),
+                       threads=threads)
+
+
+class TestASGIAdapter:
+
+    def test_hc(self):
+        status, headers, body = asyncio.run(
+            call(tracking_app(), "GET", "/api/hc"))
+        assert status == 200
+        assert headers[b"content-type"] == b"application/json"
+        assert json.loads(body) == {"status": "success"}
+
+    def test_register_login_profile(self, tmp_path):
+        app = tracking_app(db_url=f"sqlite:///{tmp_path / 'tracking.db'}")
+
+        async def flow():
+            status, _, _ = await call(app, "POST", "/api/register", USER,
+                                      chunk_size=7)
+            assert status == 201
+            status, _, body = await call(app, "POST", "/api/login", USER)
+            assert status == 202
+            token = json.loads(body)["token"]
+            return await call(
+                app, "GET", "/api/user/profile",
+                headers=[("Authorization", f"Bearer {token}")])
+
+        status, _, body = asyncio.run(flow())
+        assert status == 202
+        assert "member_since" in json.loads(body)["data"]
+
+    def test_query_string(self):
+        status, _, _ = asyncio.run(call(
+            tracking_app(), "GET", "/api/food/search",
+            query=b"name=chicken"))
+        # no token
+        assert status == 401
+
+    def test_concurrent_requests(self):
+        app = tracking_app(threads=2)
+
+        async def many():
+            return await asyncio.gather(*(
+                call(app, "GET", "/api/hc") for _ in range(50)))
+
+        assert [status for status, _, _ in asyncio.run(many())] == [200] * 50
+
+    def test_body_too_large(self):
+        app = ASGIAdapter(create_app(secret_key="key"), max_body_size=16)
+        status, _, body = asyncio.run(
+            call(app, "POST", "/api/register", USER, chunk_size=7))
+        assert status == 413
+        assert json.loads(body)["status"] == "failed"
+        status, _, _ = asyncio.run(call(
+            app, "POST", "/api/register", USER,
+            headers=[("Content-Length", "1000")]))
+        assert status == 413
+
+    def test_max_content_length(self):
+        flask_app = create_app(secret_key="key")
+        flask_app.config["MAX_CONTENT_LENGTH"] = 1024
+        assert ASGIAdapter(flask_app).max_body_size == 1024
+
+    def test_disconnect_before_body_is_read(self):
+        calls = []
+
+        def wsgi_app(environ, start_response):
+            calls.append(environ)
+            start_response("200 OK", [])
+            return [b""]
+
+        messages = [
+            {"type": "http.request", "body": b"{", "more_body": True},
+            {"type": "http.disconnect"},
+        ]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "POST", "path": "/api/register"}
+        asyncio.run(ASGIAdapter(wsgi_app)(scope, receive, send))
+        assert calls == [] and sent == []
+
+    def test_closes_after_the_response_is_sent(self):
+        sent = []
+        closed = []
+
+        class Body(list):
+            def close(self):
+                closed.append(len(sent))
+
+        def wsgi_app(environ, start_response):
+            start_response("200 OK", [])
+            return Body([b"{}"])
+
+        messages = [{"type": "http.request", "body": b""}]
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": "/api/hc"}
+        asyncio.run(ASGIAdapter(wsgi_app)(scope, receive, send))
+        assert closed == [len(sent)]
+        assert not sent[-1].get("more_body")
+
+    def test_lifespan(self):
+        app = tracking_app()
+        app.executor
+        messages = [{"type": "lifespan.startup"},
+                    {"type": "lifespan.shutdown"}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        asyncio.run(app({"type": "lifespan"}, receive, send))
+        assert sent == ["lifespan.startup.complete",
+                        "lifespan.shutdown.complete"]
+        assert app._executor is None
+
+
+def test_build_environ():
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/api/login",
+        "query_string": b"a=1",
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", b"999"),
+            (b"x-forwarded-for", b"10.0.0.1"),
+            (b"x-forwarded-for", b"10.0.0.2"),
+        ],
+        "client": ("127.0.0.1", 5000),
+        "server": ("127.0.0.1", 8000),
+    }
+    environ = build_environ(scope, b"{}")
+    assert environ["REQUEST_METHOD"] == "POST"
+    assert environ["PATH_INFO"] == "/api/login"
+    assert environ["QUERY_STRING"] == "a=1"
+    assert environ["CONTENT_TYPE"] == "application/json"
+    assert environ["CONTENT_LENGTH"] == "2"
+    assert environ["HTTP_X_FORWARDED_FOR"] == "10.0.0.1,10.0.0.2"
+    assert environ["REMOTE_ADDR"] == "127.0.0.1"
+    assert environ["wsgi.input"].read() == b"{}"
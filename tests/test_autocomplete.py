@@ -0,0 +1,94 @@
+from hypothesis import strategies as st, given
+
+from idiet.tracking.autocomplete import PopularityUpdater, PrefixIndex
+from idiet.tracking.search import normalize
+from tests.conftest import Clock
+
+
+def index(*names, popularity=None):
+    return PrefixIndex(
+        ((i, {"name": name}) for i, name in enumerate(names)), popularity)
+
+
+def names(matches):
+    return [record["name"] for _, record in matches]
+
+
+class TestPrefixIndex:
+
+    def test_shorter_names_first(self):
+        foods = index("chicken, roasted", "chickpeas", "chicken", "beef")
+        assert names(foods.complete("chi")) == [
+            "chicken", "chickpeas", "chicken, roasted"]
+        assert names(foods.complete("Chicken,")) == [
+            "chicken", "chicken, roasted"]
+        assert foods.complete("x") == []
+        assert foods.complete("") == []
+
+    def test_popularity_ranks_first(self):
+        foods = index("chicken, roasted", "chickpeas", "chicken")
+        assert names(foods.complete("ch")) == [
+            "chicken", "chickpeas", "chicken, roasted"]
+        # foods that aren't indexed anymore are ignored
+        foods.set_popularity({0: 5, 1: 2, 7: 9})
+        assert names(foods.complete("ch")) == [
+            "chicken, roasted", "chickpeas", "chicken"]
+        assert names(foods.complete("chicken")) == [
+            "chicken, roasted", "chicken"]
+        assert names(foods.complete("c", max_results=1)) == [
+            "chicken, roasted"]
+
+    @given(
+        food_names=st.lists(st.text(alphabet="abc ,", max_size=6),
+                            max_size=40),
+        picks=st.lists(st.integers(0, 3), max_size=40),
+        prefix=st.text(alphabet="abc ", min_size=1, max_size=5)
+    )
+    def test_matches_a_full_sort(self, food_names, picks, prefix):
+        popularity = dict(enumerate(picks))
+        foods = index(*food_names, popularity=popularity)
+        wanted = normalize(prefix)
+        expected = sorted(
+            (
+                (-popularity.get(i, 0), len(normalize(name)),
+                 normalize(name), i)
+                for i, name in enumerate(food_names)
+                if normalize(name) and wanted
+                and normalize(name).startswith(wanted)
+            )
+        )[:PrefixIndex.max_results]
+        assert [foodid for foodid, _ in foods.complete(prefix, 100)] == [
+            i for *_, i in expected]
+
+
+class TestPopularityUpdater:
+
+    def test_refreshes_once_per_interval(self):
+        clock = Clock()
+        calls = []
+        updater = PopularityUpdater(lambda: calls.append(clock()),
+                                    interval=60, clock=clock)
+        assert updater.due()
+        updater.maybe_refresh()
+        clock.now += 59
+        assert not updater.due()
+        updater.maybe_refresh()
+        assert calls == [1000.0]
+        clock.now += 1
+        assert updater.due()
+        updater.maybe_refresh()
+        assert calls == [1000.0, 1060.0]
+
+    def test_failed_refresh_is_retried(self):
+        clock = Clock()
+        calls = []
+
+        def refresh():
+            calls.append(clock())
+            raise RuntimeError("database is gone")
+
+        updater = PopularityUpdater(refresh, interval=60, clock=clock)
+        updater.maybe_refresh()
+        clock.now += 60
+        updater.maybe_refresh()
+        assert calls == [1000.0, 1060.0]
@@ -1,22 +1,48 @@
+from datetime import datetime, date, timedelta
 from string import ascii_letters
+import time
+import types
+import uuid
 
 from hypothesis import strategies as st, given, assume
 import pytest
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect
 
-from idiet.tracking.backend.db import SqlAlchemyBackend
+from idiet.tracking.backend.core import UserSnapshot, VersionConflict
+from idiet.tracking.backend.db import SqlAlchemyBackend, FoodFact
+from idiet.tracking.backend.memory import MemoryBackend
+from tests.conftest import QueryCounter
 
 
-def alchemy():
+def alchemy(foods=()):
     engine = create_engine("sqlite://")
     backend = SqlAlchemyBackend(engine)
     backend.init()
+    session = backend.Session()
+    session.add_all(FoodFact.from_dict(food) for food in foods)
+    session.commit()
     return backend
 
 
-@pytest.fixture(params=[alchemy], scope="session")
-def backend(request):
-    return request.param()
+def memory(foods=()):
+    return MemoryBackend(foods)
+
+
+@pytest.fixture(params=[alchemy, memory], scope="session")
+def make_backend(request):
+    """
+    creates an empty backend, or one with a food catalog
+    """
+    return request.param
+
+
+@pytest.fixture(scope="session")
+def backend(make_backend):
+    return make_backend()
+
+
+def new_user(backend):
+    return backend.add_user(f"{uuid.uuid4().hex}@example.com", "password")
 
 
 class TestBackend:
@@ -32,3 +58,371 @@ class TestBackend:
         assert user.name == username
         assert user.token != password
         assert backend.get_user(username) == user
+
+    @given(
+        username=st.emails(),
+        password=st.text(min_size=8, alphabet=ascii_letters)
+    )
+    def test_user_credentials(self, backend, username, password):
+        assume(backend.user_credentials(username) is None)
+        user = backend.add_user(username, password)
+
+        credentials = backend.user_credentials(username)
+        assert credentials.id == user.id
+        assert credentials.name == username
+        assert credentials.validate(password)
+        assert not credentials.validate(password + "x")
+        assert credentials.snapshot() == user.snapshot()
+
+    @given(
+        username=st.emails(),
+        password=st.text(min_size=8, alphabet=ascii_letters)
+    )
+    def test_add_existing_user(self, backend, username, password):
+        assume(backend.user_exists(username) is False)
+        assert backend.add_user(username, password) is not None
+        assert backend.add_user(username, password) is None
+        assert backend.user_credentials(username).validate(password)
+
+    def test_profile(self, backend):
+        user = new_user(backend)
+        profile = backend.user_profile_get(user.snapshot()).to_dict()
+        assert profile["name"] is None
+        assert profile["gender"] is None
+        assert profile["member_since"] == user.profile.member_since
+
+        backend.user_profile_update(user.snapshot(),
+                                    {"name": "n", "gender": "g"})
+        profile = backend.user_profile_get(user.snapshot()).to_dict()
+        assert (profile["name"], profile["gender"]) == ("n", "g")
+
+        backend.user_profile_update(user.snapshot(), {"weight_in_kg": 70})
+        profile = backend.user_profile_get(user.snapshot()).to_dict()
+        assert (profile["name"], profile["weight_in_kg"]) == ("n", 70.0)
+        assert profile["target_calories"] is None
+        for changes in ({}, {"height": 2}, {"weight_in_kg": "heavy"},
+                        {"target_calories": -1}, {"name": "n" * 65}):
+            with pytest.raises(ValueError):
+                backend.user_profile_update(user.snapshot(), changes)
+
+    def test_profile_version(self, backend):
+        user = new_user(backend).snapshot()
+        version = backend.user_profile_version(user)
+        assert "version" not in backend.user_profile_get(user).to_dict()
+        backend.user_profile_update(user, {"name": "n", "gender": "g"})
+        assert backend.user_profile_version(user) == version + 1
+
+    def test_profile_version_conflict(self, backend):
+        user = new_user(backend).snapshot()
+        version = backend.user_profile_version(user)
+        assert backend.user_profile_update(
+            user, {"name": "a"}, version=version) == version + 1
+        with pytest.raises(VersionConflict) as conflict:
+            backend.user_profile_update(user, {"name": "b"}, version=version)
+        assert conflict.value.usernames == [user.name]
+        assert backend.user_profile_get(user).to_dict()["name"] == "a"
+        assert backend.user_profile_version(user) == version + 1
+
+    def test_profiles_update(self, backend):
+        users = [new_user(backend).snapshot() for _ in range(3)]
+        first, second, third = users
+        versions = backend.user_profiles_update([
+            (first.name, {"name": "a"}, None),
+            (second.name, {"name": "b", "weight_in_kg": 60}, 1),
+            (third.name, {"name": "c"}, 1),
+        ])
+        assert versions == {first.name: 2, second.name: 2, third.name: 2}
+        profile = backend.user_profile_get(second).to_dict()
+        assert (profile["name"], profile["weight_in_kg"]) == ("b", 60.0)
+
+        # one stale version fails the whole batch
+        with pytest.raises(VersionConflict) as conflict:
+            backend.user_profiles_update([
+                (first.name, {"name": "x"}, 2),
+                (second.name, {"name": "x"}, 1),
+            ])
+        assert conflict.value.usernames == [second.name]
+        assert backend.user_profile_get(first).to_dict()["name"] == "a"
+        assert backend.user_profile_version(first) == 2
+
+        for updates in ([(first.name, {"name": "x"}, None)] * 2,
+                        [("nobody@example.com", {"name": "x"}, None)],
+                        [(first.name, {"height": 2}, None)]):
+            with pytest.raises(ValueError):
+                backend.user_profiles_update(updates)
+
+    def test_tokens(self, backend):
+        user = new_user(backend).snapshot()
+        first = backend.user_generate_token(user, "key").to_text()
+        second = backend.user_generate_token(user, "key").to_text()
+
+        assert backend.user_from_token(first, "other key") is None
+        assert backend.user_from_token(first, "key") == user
+        assert backend.token_revoke(first, "key")
+        assert backend.user_from_token(first, "key") is None
+        assert backend.user_from_token(second, "key") == user
+        assert not backend.token_revoke("not a token", "key")
+
+        third = backend.user_generate_token(user, "key").to_text()
+        assert backend.user_tokens_revoke(user) == 2
+        assert backend.user_from_token(second, "key") is None
+        assert backend.user_from_token(third, "key") is None
+        assert backend.user_tokens_revoke(user) == 0
+
+    def test_meals(self, make_backend):
+        backend = make_backend([{"name": "apple", "calories": 50}])
+        user = new_user(backend).snapshot()
+        meals = [
+            {"food_id": 1, "servings": 2,
+             "logged_at": datetime(2020, 5, 1, 12)},
+            {"food_id": None, "name": "soup", "calories": 100,
+             "logged_at": datetime(2020, 5, 1, 8)},
+            {"food_id": 1, "logged_at": datetime(2020, 5, 3, 8)},
+        ]
+        assert backend.user_meals_add(user, meals) == 3
+        with pytest.raises(ValueError):
+            backend.user_meals_add(
+                user, [{"food_id": 2, "logged_at": datetime(2020, 5, 1)}])
+
+        logged = backend.user_meals_get(user, start=datetime(2020, 5, 1),
+                                        end=datetime(2020, 5, 2))
+        assert [meal["name"] for meal in logged] == ["soup", None]
+        assert len(backend.user_meals_get(user, limit=1)) == 1
+
+        days = backend.user_daily_nutrition(user, date(2020, 5, 1),
+                                            date(2020, 5, 4))
+        assert [day["calories"] for day in days] == [200, 0, 50]
+        assert [day["num_meals"] for day in days] == [2, 0, 1]
+        assert days[0]["day"] == "2020-05-01"
+
+    def test_meals_export(self, backend):
+        user = new_user(backend).snapshot()
+        backend.user_meals_add(user, [
+            {"food_id": None, "name": name,
+             "logged_at": datetime(2020, 5, day)}
+            for name, day in (("c", 3), ("a", 1), ("b", 1), ("d", 4))
+        ])
+        meals = list(backend.user_meals_export(user, batch_size=2))
+        assert [meal["name"] for meal in meals] == ["a", "b", "c", "d"]
+        resumed = backend.user_meals_export(user, after=meals[0]["id"],
+                                            end=datetime(2020, 5, 4))
+        assert [meal["name"] for meal in resumed] == ["b", "c"]
+        with pytest.raises(ValueError):
+            backend.user_meals_export(user, after=-1)
+
+    def test_metrics(self, backend):
+        user = new_user(backend).snapshot()
+        samples = [
+            ("weight_in_kg", datetime(2020, 5, 1, 8), 71.0),
+            ("weight_in_kg", datetime(2020, 5, 1, 20), 72.0),
+            ("steps", datetime(2020, 5, 1, 9), 1000.0),
+            ("weight_in_kg", datetime(2020, 5, 3, 8), 70.0),
+        ]
+        assert backend.user_metrics_add(user, samples) == 4
+        # appending to a day already stored
+        backend.user_metrics_add(
+            user, [("weight_in_kg", datetime(2020, 5, 1, 7), 70.5)])
+
+        start, end = datetime(2020, 5, 1), datetime(2020, 5, 4)
+        raw = backend.user_metric_series(user, "weight_in_kg", start, end)
+        assert [point["value"] for point in raw] == [70.5, 71, 72, 70]
+        assert raw[0]["measured_at"] == datetime(2020, 5, 1, 7)
+        days = backend.user_metric_series(user, "weight_in_kg", start, end,
+                                          "day")
+        assert [(day["min"], day["max"], day["count"]) for day in days] \
+            == [(70.5, 72, 3), (70, 70, 1)]
+        hours = backend.user_metric_series(user, "weight_in_kg", start, end,
+                                           "hour")
+        assert [hour["start"].hour for hour in hours] == [7, 8, 20, 8]
+        weeks = backend.user_metric_series(user, "weight_in_kg", start, end,
+                                           "week")
+        assert [(week["start"], week["count"]) for week in weeks] \
+            == [(datetime(2020, 4, 27), 4)]
+        assert backend.user_metric_series(
+            user, "water_in_ml", start, end, "day") == []
+
+    def test_food_search(self, make_backend):
+        backend = make_backend([
+            {"name": "chicken, roasted", "group": "Poultry",
+             "protein_in_grams": 25, "calories": 190},
+            {"name": "chicken", "group": "Poultry",
+             "protein_in_grams": 6, "calories": 28.5},
+            {"name": "beef jerky", "group": "Beef",
+             "protein_in_grams": 33, "calories": 410},
+        ])
+        names = [
+            food["name"]
+            for food in backend.food_item_find_closest_match("chiken", 10)
+        ]
+        assert names == ["chicken", "chicken, roasted"]
+        foods = backend.food_items_by_nutrients(
+            group="Poultry", ranges={"protein": (10, None)})
+        assert [food["name"] for food in foods] == ["chicken, roasted"]
+
+    def test_autocomplete_popularity(self, make_backend):
+        backend = make_backend([{"name": "chicken, roasted"},
+                                {"name": "chicken"}, {"name": "chickpeas"}])
+        user = new_user(backend).snapshot()
+        assert [foodid for foodid, _ in backend.food_autocomplete("chi")] \
+            == [2, 3, 1]
+        backend.user_meals_add(user, [
+            {"food_id": 1, "logged_at": datetime(2020, 5, 1)},
+            {"food_id": 1, "logged_at": datetime(2020, 5, 2)},
+            {"food_id": None, "name": "soup",
+             "logged_at": datetime(2020, 5, 2)},
+        ])
+        assert backend.food_popularity() == {1: 2}
+        backend.food_popularity_refresh()
+        assert backend.food_autocomplete("chi", 1)[0][0] == 1
+
+    def test_food_catalog_version(self, make_backend):
+        foods = [{"name": "apple", "calories": 50}]
+        version = make_backend(foods).food_catalog_version()
+        assert make_backend(foods).food_catalog_version() == version
+        changed = [{"name": "apple", "calories": 52}]
+        assert make_backend(changed).food_catalog_version() != version
+
+
+def test_backends_implement_the_abc():
+    assert not MemoryBackend.__abstractmethods__
+    assert not SqlAlchemyBackend.__abstractmethods__
+
+
+def test_metric_year_is_one_read_without_samples():
+    backend = alchemy()
+    user = new_user(backend).snapshot()
+    start = datetime(2020, 1, 1, 12)
+    backend.user_metrics_add(user, [
+        ("steps", start + timedelta(days=day, minutes=minute), 10.0)
+        for day in range(366) for minute in range(0, 600, 60)
+    ])
+    with QueryCounter(backend.engine) as counter:
+        days = backend.user_metric_series(
+            user, "steps", datetime(2020, 1, 1), datetime(2021, 1, 1), "day")
+    assert len(days) == 366 and days[0]["count"] == 10
+    assert len(counter.statements) == 1
+    assert "sample_values" not in counter.statements[0]
+
+
+def test_metric_write_retries_a_lost_race():
+    backend = alchemy()
+    user = new_user(backend).snapshot()
+    at = datetime(2020, 5, 1, 8)
+    backend.user_metrics_add(user, [("steps", at, 1.0)])
+    updates = []
+
+    def race(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE user_metric_days") and not updates:
+            # another writer appends to the chunk after it was read
+            cursor.connection.execute(
+                "UPDATE user_metric_days SET count = count + 1")
+        if statement.startswith("UPDATE user_metric_days"):
+            updates.append(statement)
+
+    event.listen(backend.engine, "before_cursor_execute", race)
+    try:
+        backend.user_metrics_add(user, [("steps", at, 2.0)])
+    finally:
+        event.remove(backend.engine, "before_cursor_execute", race)
+    assert len(updates) == 2
+    raw = backend.user_metric_series(user, "steps", datetime(2020, 5, 1),
+                                     datetime(2020, 5, 2))
+    assert [point["value"] for point in raw] == [1, 2]
+
+
+def test_meals_export_streams_on_its_own_connection():
+    backend = alchemy()
+    user = new_user(backend).snapshot()
+    backend.user_meals_add(user, [
+        {"food_id": None, "name": str(i),
+         "logged_at": datetime(2020, 5, 1) + timedelta(minutes=i)}
+        for i in range(50)
+    ])
+    with QueryCounter(backend.engine) as counter:
+        meals = backend.user_meals_export(user, batch_size=10)
+        backend.close_session()
+        assert counter.statements == []
+        assert next(meals)["name"] == "0"
+        assert len(list(meals)) == 49
+    assert len(counter.statements) == 1
+
+
+def test_food_picks_are_counted_as_meals_are_logged():
+    backend = alchemy([{"name": "egg"}, {"name": "milk"}])
+    user = new_user(backend).snapshot()
+    at = datetime(2020, 5, 1)
+    backend.user_meals_add(user, [
+        {"food_id": 1, "logged_at": at}, {"food_id": 1, "logged_at": at},
+        {"food_id": 2, "logged_at": at},
+        {"food_id": None, "name": "soup", "logged_at": at},
+    ])
+    backend.user_meals_add(user, [{"food_id": 1, "logged_at": at}])
+    with QueryCounter(backend.engine) as counter:
+        assert backend.food_popularity() == {1: 3, 2: 1}
+    assert not any("user_meals" in s for s in counter.statements)
+
+    # a database from before food_picks counts its meals once
+    backend.engine.execute("DROP TABLE food_picks")
+    backend = SqlAlchemyBackend(backend.engine).init()
+    assert backend.food_popularity() == {1: 3, 2: 1}
+    backend.init()
+    assert backend.food_popularity() == {1: 3, 2: 1}
+
+
+def test_memory_food_add_resets_autocomplete():
+    backend = memory([{"name": "chicken"}, {"name": "chickpeas"}])
+    assert [foodid for foodid, _ in backend.food_autocomplete("chi")] \
+        == [1, 2]
+    backend.autocomplete_index.set_popularity({2: 3})
+    assert backend.food_add([{"name": "chives"}, {"name": "chili"}]) == 2
+    assert [foodid for foodid, _ in backend.food_autocomplete("chi")] \
+        == [2, 4, 3, 1]
+
+
+def test_memory_meals_export_is_lazy():
+    backend = memory()
+    user = new_user(backend).snapshot()
+    backend.user_meals_add(user, [
+        {"food_id": None, "name": str(i),
+         "logged_at": datetime(2020, 5, 1) + timedelta(minutes=50 - i)}
+        for i in range(50)
+    ])
+    meals = backend.user_meals_export(user, batch_size=10)
+    assert isinstance(meals, types.GeneratorType)
+    assert [meal["name"] for meal in meals] == [
+        str(i) for i in reversed(range(50))]
+
+
+def test_revocation_sync_leaves_the_session_alone():
+    backend = alchemy()
+    session = backend.Session()
+    session.add(FoodFact.from_dict({"name": "pending"}))
+    backend._revoked_since(None)
+    backend._tokens_compact(time.time())
+    session.rollback()
+    assert session.query(FoodFact).count() == 0
+
+
+def test_init_replaces_empty_tokens_table():
+    engine = create_engine("sqlite://")
+    engine.execute(
+        "CREATE TABLE jwt_tokens (id INTEGER PRIMARY KEY, "
+        "token VARCHAR(256) UNIQUE, expires_on DATE)")
+    SqlAlchemyBackend(engine).init()
+    columns = {c["name"] for c in inspect(engine).get_columns("jwt_tokens")}
+    assert {"jti", "user_id", "revoked_at"} <= columns
+
+
+def test_init_adds_profile_version():
+    engine = create_engine("sqlite://")
+    engine.execute(
+        "CREATE TABLE user_profiles (id INTEGER PRIMARY KEY, "
+        "name VARCHAR(64), gender VARCHAR(16), member_since DATE NOT NULL, "
+        "user_id INTEGER)")
+    engine.execute("INSERT INTO user_profiles (member_since, user_id) "
+                   "VALUES ('2020-01-01', 1)")
+    backend = SqlAlchemyBackend(engine).init()
+    user = UserSnapshot(1, "user")
+    assert backend.user_profile_version(user) == 1
+    backend.user_profile_update(user, {"weight_in_kg": 80})
+    assert backend.user_profile_get(user).to_dict()["weight_in_kg"] == 80
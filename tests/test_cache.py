@@ -0,0 +1,81 @@
+from idiet.tracking.backend.core import UserSnapshot
+from idiet.tracking.cache import LRUCache, ResponseCache, TokenCache
+from tests.conftest import Clock
+
+
+def fixed_size(key, value):
+    return 10
+
+
+class TestLRUCache:
+
+    def test_get_and_set(self):
+        cache = LRUCache(100, sizeof=fixed_size)
+        assert cache.get("a") is None
+        cache.set("a", 1)
+        assert cache.get("a") == 1
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(30, sizeof=fixed_size)
+        for key in "abc":
+            cache.set(key, key)
+        cache.get("a")
+        cache.set("d", "d")
+        assert "b" not in cache
+        assert all(key in cache for key in "acd")
+        assert cache.size == 30
+        assert cache.evictions == 1
+
+    def test_expired_entries_are_misses(self):
+        clock = Clock()
+        cache = LRUCache(100, sizeof=fixed_size, clock=clock)
+        cache.set("a", 1, expires_at=clock.now + 5)
+        assert cache.get("a") == 1
+        clock.now += 5
+        assert cache.get("a") is None
+        assert len(cache) == 0
+        assert cache.size == 0
+
+    def test_zero_size_disables_cache(self):
+        cache = LRUCache(0)
+        cache.set("a", 1)
+        assert cache.get("a") is None
+
+
+class TestTokenCache:
+
+    def test_entries_expire_with_the_token(self):
+        clock = Clock()
+        cache = TokenCache(clock=clock)
+        user = UserSnapshot(1, "user@example.com")
+        cache.set_verified("token", {"exp": clock.now + 60}, user)
+        assert cache.get_verified("token").user == user
+        clock.now += 60
+        assert cache.get_verified("token") is None
+
+    def test_invalidate_user(self):
+        cache = TokenCache()
+        alice = UserSnapshot(1, "alice")
+        bob = UserSnapshot(2, "bob")
+        cache.set_verified("a1", {}, alice)
+        cache.set_verified("a2", {}, alice)
+        cache.set_verified("b1", {}, bob)
+        cache.invalidate_user("alice")
+        assert "a1" not in cache and "a2" not in cache
+        assert cache.get_verified("b1").user == bob
+        cache.invalidate_user("nobody")
+
+
+class TestResponseCache:
+
+    def test_new_version_drops_old_entries(self):
+        cache = ResponseCache()
+        assert cache.get_response("v1", "query") is None
+        cache.set_response("v1", "query", b"old")
+        assert cache.get_response("v1", "query") == b"old"
+        assert cache.get_response("v2", "query") is None
+        assert len(cache) == 0
+        # a response rendered from v1 after the switch is never served
+        cache.set_response("v1", "query", b"old")
+        assert cache.get_response("v2", "query") is None
@@ -0,0 +1,153 @@
+import tempfile
+
+from hypothesis import given, settings, strategies as st
+import pytest
+from sqlalchemy import create_engine
+
+from idiet.tracking.autocomplete import PrefixIndex
+from idiet.tracking.backend.db import FoodFact, SqlAlchemyBackend
+from idiet.tracking.catalog import Catalog, main, write_catalog
+from idiet.tracking.core import create_app
+from idiet.tracking.nutrients import NutrientStore
+from idiet.tracking.search import FoodIndex
+from tests.conftest import FOODS, food
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    path = tmp_path / "catalog.bin"
+    write_catalog(path, FOODS)
+    return Catalog(path)
+
+
+class TestCatalog:
+
+    def test_records(self, catalog):
+        assert len(catalog) == len(FOODS)
+        assert list(catalog.ids) == [foodid for foodid, _ in FOODS]
+        assert list(catalog.records) == [record for _, record in FOODS]
+        assert catalog.digest == NutrientStore(FOODS).digest()
+
+    def test_food_index(self, catalog):
+        built = FoodIndex(FOODS)
+        mapped = FoodIndex.from_catalog(catalog)
+        for query in ("chicken", "chiken", "roasted chicken", "egg",
+                      "creme", "nothing"):
+            assert mapped.search_page(query) == built.search_page(query)
+        page = built.search_page("chicken", max_results=1)
+        after = page[-1][0]
+        assert mapped.search_page("chicken", max_results=1, after=after) \
+            == built.search_page("chicken", max_results=1, after=after)
+
+    def test_vocabulary_grams(self, catalog):
+        built = FoodIndex(FOODS)
+        mapped = FoodIndex.from_catalog(catalog)
+        # read from the file, not built again
+        assert mapped._vocab_grams is catalog.vocabulary_grams
+        assert {gram: set(words)
+                for gram, words in mapped._vocab_grams.items()} == \
+            {gram: set(words) for gram, words in built._vocab_grams.items()}
+        assert "xyz" not in mapped._vocab_grams
+        assert "é" not in mapped._vocab_grams
+
+    def test_nutrient_store(self, catalog):
+        built = NutrientStore(FOODS)
+        mapped = NutrientStore.from_catalog(catalog)
+        for query in ({},
+                      {"group": "Poultry Products", "sort": "protein"},
+                      {"ranges": {"fat": (0, 20)}, "descending": False,
+                       "sort": "protein_per_calorie"}):
+            assert mapped.query_page(max_results=10, **query) == \
+                built.query_page(max_results=10, **query)
+
+    def test_prefix_index(self, catalog):
+        popularity = {4: 3, 9: 1}
+        built = PrefixIndex(FOODS, popularity)
+        mapped = PrefixIndex.from_catalog(catalog, popularity)
+        for prefix in ("c", "ch", "chi", "chick", "cr", "t", "x"):
+            assert mapped.complete(prefix) == built.complete(prefix)
+        popularity = {1: 2, 4: 1, 99: 5}
+        built.set_popularity(popularity)
+        mapped.set_popularity(popularity)
+        for prefix in ("c", "ch", "chicken", "r"):
+            assert mapped.complete(prefix) == built.complete(prefix)
+
+    def test_arrays_are_read_only(self, catalog):
+        store = NutrientStore.from_catalog(catalog)
+        with pytest.raises(ValueError):
+            store.columns["fat"][0] = 1.0
+
+    def test_replace(self, tmp_path, catalog):
+        write_catalog(catalog.path, FOODS[:2])
+        assert catalog.replaced()
+        # the old mapping still reads the old file
+        assert len(list(catalog.records)) == len(FOODS)
+        assert len(Catalog(catalog.path)) == 2
+        assert [p.name for p in tmp_path.iterdir()] == ["catalog.bin"]
+
+    def test_not_a_catalog(self, tmp_path):
+        path = tmp_path / "foods.csv"
+        path.write_text("name,group\n")
+        with pytest.raises(ValueError):
+            Catalog(path)
+
+    @settings(max_examples=1)
+    @given(st.lists(st.tuples(
+        st.text(max_size=20), st.one_of(st.none(), st.text(max_size=10)),
+        st.one_of(st.none(), st.floats(allow_nan=False)))))
+    def test_roundtrip(self, foods):
+        foods = [
+            (foodid, food(name or None, group, fat=fat))
+            for foodid, (name, group, fat) in enumerate(foods, 1)
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/catalog.bin"
+            write_catalog(path, foods)
+            assert list(Catalog(path).records) == \
+                [record for _, record in foods]
+
+
+class TestCatalogBackend:
+
+    def backend(self, url, path=None):
+        backend = SqlAlchemyBackend(create_engine(url), catalog_path=path,
+                                    catalog_check_interval=0.0)
+        return backend.init()
+
+    def test_serves_the_catalog(self, tmp_path):
+        url = f"sqlite:///{tmp_path}/tracking.db"
+        backend = self.backend(url)
+        backend.engine.execute(FoodFact.__table__.insert(), [
+            {"foodid": 1, "foodname": "chicken breast", "calories": 165},
+            {"foodid": 2, "foodname": "chicken thigh", "calories": None},
+        ])
+        path = tmp_path / "catalog.bin"
+        assert main([str(path), "--db-url", url]) == 0
+        version = backend.food_catalog_version()
+
+        served = self.backend("sqlite://", path=path)
+        assert served.food_catalog_version() == version
+        assert served.food_page_by_name("chicken", 10) == \
+            backend.food_page_by_name("chicken", 10)
+        assert served.food_autocomplete("chi") == \
+            backend.food_autocomplete("chi")
+        assert len(served.food_autocomplete("chi")) == 2
+
+    def test_reloads_a_replaced_catalog(self, tmp_path):
+        path = tmp_path / "catalog.bin"
+        write_catalog(path, FOODS[:1])
+        backend = self.backend("sqlite://", path=path)
+        assert backend.food_autocomplete("egg") == []
+        old = backend.food_catalog_version()
+
+        write_catalog(path, FOODS)
+        assert backend.food_catalog_version() != old
+        assert backend.food_autocomplete("egg") == [FOODS[2]]
+
+    def test_config(self, tmp_path):
+        path = tmp_path / "catalog.bin"
+        write_catalog(path, FOODS)
+        app = create_app(config={"catalog": {"path": str(path)}},
+                         secret_key="key")
+        assert app.backend.food_catalog_version() == \
+            NutrientStore(FOODS).digest()
@@ -1,5 +1,12 @@
+import subprocess
+import sys
+import textwrap
+
 import pytest
+from sqlalchemy.pool import QueuePool
+import webtest
 
+from idiet.tracking.config import Config
 from idiet.tracking.core import create_app
 from idiet.tracking.backend.db import SqlAlchemyBackend
 
@@ -31,5 +38,158 @@ class TestTracking(object):
         config = {
             "secret-key": ""
         }
-       with pytest.raises(ValueError): 
-            app = create_app(config=config)
+        with pytest.raises(ValueError):
+            create_app(config=config)
+
+    def test_create_app_with_pool_config(self):
+        """
+        engine pool settings are read from the db section of the config
+        """
+
+        config = {
+            "secret-key": "my-secret-key",
+            "db": {
+                "url": "sqlite://",
+                "pool-size": 3,
+                "max-overflow": 2,
+                "pool-recycle": 600,
+                "pool-pre-ping": True,
+            }
+        }
+        app = create_app(config=config)
+        pool = app.backend.engine.pool
+        assert isinstance(pool, QueuePool)
+        assert pool.size() == 3
+        assert pool._max_overflow == 2
+        assert pool._recycle == 600
+        assert pool._pre_ping
+
+    def test_create_app_from_config_object(self):
+        config = Config("my-secret-key", {"url": "sqlite://"})
+        app = create_app(config=config)
+        assert app.app_config["secret-key"] == "my-secret-key"
+
+    def test_session_closed_on_teardown(self):
+        """
+        every request gets one session and gives its connection back
+        """
+
+        config = {"db": {"url": "sqlite://", "pool-size": 1}}
+        app = create_app(config=config, secret_key="key")
+        client = webtest.TestApp(app)
+        post_data = {"username": "user@example.com", "password": "password"}
+        client.post_json("/api/register", post_data)
+        for _ in range(5):
+            client.post_json("/api/login", post_data)
+        assert app.backend.engine.pool.checkedout() == 0
+
+    def test_file_backed_sqlite_is_shared(self, tmp_path):
+        """
+        apps sharing a sqlite file see each other's users, the way the
+        gunicorn workers do
+        """
+
+        config = {"db": {"url": f"sqlite:///{tmp_path}/tracking.db"}}
+        first = webtest.TestApp(create_app(config=config, secret_key="key"))
+        second = webtest.TestApp(create_app(config=config, secret_key="key"))
+
+        post_data = {"username": "user@example.com", "password": "password"}
+        first.post_json("/api/register", post_data)
+        response = second.post_json("/api/login", post_data)
+        assert response.status_code == 202
+
+        engine = first.app.backend.engine
+        assert engine.execute("PRAGMA journal_mode").scalar() == "wal"
+        assert engine.execute("PRAGMA busy_timeout").scalar() == 5000
+
+
+class TestStartup(object):
+
+    def test_health_check_does_not_import_numpy(self):
+        """
+        numpy only loads with the food catalog, a fresh interpreter
+        serving the health check never imports it
+        """
+
+        code = textwrap.dedent("""
+            import sys
+            from idiet.tracking.core import create_app
+            app = create_app(config={}, secret_key="key")
+            assert app.test_client().get("/api/hc").status_code == 200
+            assert "numpy" not in sys.modules
+        """)
+        subprocess.run([sys.executable, "-c", code], check=True)
+
+    def test_warm_up(self, tmp_path):
+        """
+        warming up builds the food indexes and connects the pool
+        """
+
+        config = {
+            "db": {"url": f"sqlite:///{tmp_path}/tracking.db",
+                   "pool-size": 2},
+            "startup": {"warm-up": True},
+        }
+        app = create_app(config=config, secret_key="key")
+        backend = app.backend
+        assert backend._food_index is not None
+        assert backend._nutrient_store is not None
+        assert backend._autocomplete_index is not None
+        assert backend.engine.pool.checkedin() == 2
+
+        response = app.test_client().get("/api/hc")
+        assert response.status_code == 200
+
+    def test_fork_hooks(self, tmp_path):
+        """
+        connections are closed before forking and a warmed up worker
+        connects its own afterwards
+        """
+
+        config = {
+            "db": {"url": f"sqlite:///{tmp_path}/tracking.db",
+                   "pool-size": 2},
+            "startup": {"warm-up": True},
+        }
+        app = create_app(config=config, secret_key="key")
+        pool = app.backend.engine.pool
+        app.before_fork()
+        assert app.backend.engine.pool.checkedin() == 0
+        app.after_fork()
+        assert app.backend.engine.pool is not pool
+        assert app.backend.engine.pool.checkedin() == 2
+
+        client = webtest.TestApp(app)
+        post_data = {"username": "user@example.com", "password": "password"}
+        assert client.post_json("/api/register", post_data).status_code == 201
+
+    def test_warm_up_from_environment(self, monkeypatch):
+        monkeypatch.setenv("IDIET_TRACKING_WARM_UP", "1")
+        monkeypatch.delenv("IDIET_TRACKING_CONFIG", raising=False)
+        # importing the module creates its app
+        monkeypatch.setenv("IDIET_TRACKING_DB_URL", "sqlite://")
+        from idiet.tracking.wsgi import app_config
+        assert app_config()["startup"] == {"warm-up": True}
+        monkeypatch.setenv("IDIET_TRACKING_WARM_UP", "0")
+        assert app_config()["startup"] == {"warm-up": False}
+
+
+class TestConfig(object):
+
+    def test_from_toml(self, tmp_path):
+        path = tmp_path / "config.toml"
+        path.write_text(
+            '[app]\n'
+            'secret-key = "my-secret-key"\n'
+            '[db]\n'
+            'url = "sqlite://"\n'
+            'pool-size = 2\n'
+            '[password-hashing]\n'
+            'method = "pbkdf2:sha256:1000"\n'
+        )
+        config = Config.from_toml(path).to_dict()
+        assert config == {
+            "secret-key": "my-secret-key",
+            "db": {"url": "sqlite://", "pool-size": 2},
+            "password-hashing": {"method": "pbkdf2:sha256:1000"},
+        }
@@ -0,0 +1,67 @@
+from string import ascii_letters
+
+from hypothesis import strategies as st, given
+import pytest
+import webtest
+
+from idiet.tracking import encrypt
+from idiet.tracking.core import create_app
+from idiet.tracking.encrypt import PasswordHasher, HasherBusy
+
+from tests.conftest import TEST_HASH_METHOD
+
+
+@pytest.fixture
+def pooled():
+    hasher = PasswordHasher("pbkdf2:sha256:1000", workers=1, max_pending=1)
+    yield hasher
+    hasher.shutdown()
+
+
+class TestPasswordHasher:
+
+    @given(password=st.text(alphabet=ascii_letters))
+    def test_inline(self, password):
+        hasher = PasswordHasher("pbkdf2:sha256:1000")
+        password_hash = hasher.hash(password)
+        assert password_hash.startswith("pbkdf2:sha256:1000$")
+        assert hasher.check(password_hash, password)
+        assert not hasher.check(password_hash, password + "x")
+
+    def test_process_pool(self, pooled):
+        password_hash = pooled.hash("password")
+        assert pooled.check(password_hash, "password")
+        assert not pooled.check(password_hash, "wrong password")
+
+    def test_busy_when_saturated(self, pooled):
+        pooled._slots.acquire()
+        with pytest.raises(HasherBusy):
+            pooled.hash("password")
+        pooled._slots.release()
+        assert pooled.hash("password")
+
+
+class TestHashingConfig:
+
+    def test_configured_from_app_config(self):
+        config = {
+            "password-hashing": {"method": "pbkdf2:sha256:2000"}
+        }
+        app = webtest.TestApp(create_app(config=config))
+        try:
+            post_data = {"username": "user@example.com", "password": "pw"}
+            app.post_json("/api/register", post_data)
+            user = app.app.backend.get_user("user@example.com")
+            assert user.token.startswith("pbkdf2:sha256:2000$")
+        finally:
+            encrypt.configure_hashing(method=TEST_HASH_METHOD)
+
+    def test_busy_returns_503(self, pooled, monkeypatch):
+        monkeypatch.setattr(encrypt, "_hasher", pooled)
+        pooled._slots.acquire()
+        app = webtest.TestApp(create_app())
+        post_data = {"username": "user@example.com", "password": "pw"}
+        response = app.post_json("/api/register", post_data, status=503)
+        assert response.json["status"] == "failed"
+        assert response.headers["Retry-After"] == "1"
+        pooled._slots.release()
@@ -0,0 +1,47 @@
+from datetime import datetime
+import json
+
+import pytest
+
+from idiet.tracking.export import MEAL_FIELDS, export_meals, iter_csv
+from idiet.tracking.export import iter_ndjson
+
+
+def meals(n):
+    return [
+        {"id": i, "logged_at": datetime(2020, 5, 1, 12, i % 60),
+         "food_id": None, "name": f"meal, {i}", "servings": 1,
+         "calories": 100.5, "fat_in_grams": None, "carbs_in_grams": None,
+         "protein_in_grams": None}
+        for i in range(n)
+    ]
+
+
+def test_ndjson_chunks():
+    chunks = list(iter_ndjson(iter(meals(5)), chunk_size=2))
+    assert len(chunks) == 3
+    lines = b"".join(chunks).decode().splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [0, 1, 2, 3, 4]
+    assert json.loads(lines[0])["logged_at"] == "2020-05-01T12:00:00Z"
+    assert list(iter_ndjson(iter([]))) == []
+
+
+def test_csv_chunks():
+    chunks = list(iter_csv(iter(meals(3)), MEAL_FIELDS, chunk_size=2))
+    assert len(chunks) == 2
+    lines = b"".join(chunks).decode().splitlines()
+    assert lines[0] == ",".join(MEAL_FIELDS)
+    assert lines[1] == '0,2020-05-01T12:00:00Z,,"meal, 0",1,100.5,,,'
+    assert b"".join(iter_csv(iter([]), MEAL_FIELDS)).decode() \
+        == ",".join(MEAL_FIELDS) + "\n"
+    assert list(iter_csv(iter([]), MEAL_FIELDS, header=False)) == []
+
+
+def test_export_meals():
+    body = b"".join(export_meals(meals(2), "csv", resumed=True))
+    assert body.decode().startswith("0,")
+    body = b"".join(export_meals(
+        [dict(meals(1)[0], user_id=1)], "ndjson"))
+    assert "user_id" not in json.loads(body)
+    with pytest.raises(ValueError):
+        export_meals(meals(1), "xml")
@@ -0,0 +1,95 @@
+import io
+import json
+
+from sqlalchemy import create_engine
+
+from idiet.tracking.backend.db import FoodFact, SqlAlchemyBackend
+from idiet.tracking.importer import Importer, main, read_jsonl
+
+
+def foods(engine):
+    rows = engine.execute(FoodFact.__table__.select().order_by("foodid"))
+    return [dict(row) for row in rows]
+
+
+class TestImporter:
+
+    def test_csv(self, tmp_path):
+        path = tmp_path / "foods.csv"
+        path.write_text(
+            "name,group,fat_in_grams,protein_in_grams,"
+            "carbohydrates_in_grams,calories\n"
+            "chicken,Poultry,0.5,6,0,28.5\n"
+            "steak,Beef,2,6,,\n"
+        )
+        url = f"sqlite:///{tmp_path}/tracking.db"
+        assert main([str(path), "--db-url", url, "--batch-size", "1"]) == 0
+
+        rows = foods(create_engine(url))
+        assert [row["foodname"] for row in rows] == ["chicken", "steak"]
+        assert rows[0]["calories"] == 28.5
+        assert rows[1]["carbohydrateg"] is None
+
+    def test_invalid_rows_are_skipped(self):
+        engine = create_engine("sqlite://")
+        SqlAlchemyBackend(engine).init()
+        lines = io.StringIO("\n".join([
+            json.dumps({"name": "egg", "calories": 155}),
+            json.dumps({"name": ""}),
+            json.dumps({"name": "milk", "calories": "lots"}),
+            json.dumps({"name": "milk", "fatg": -1}),
+            "not json",
+            json.dumps({"foodname": "milk", "calories": 42}),
+        ]))
+        out = io.StringIO()
+        importer = Importer(engine, out=out).run(read_jsonl(lines))
+        assert (importer.inserted, importer.invalid) == (2, 4)
+        assert "skipping record 5" in out.getvalue()
+        assert [row["foodname"] for row in foods(engine)] == ["egg", "milk"]
+
+    def test_upsert(self):
+        engine = create_engine("sqlite://")
+        SqlAlchemyBackend(engine).init()
+        out = io.StringIO()
+        Importer(engine, out=out).run([
+            {"foodid": 1, "name": "egg", "calories": 150},
+            {"foodid": 2, "name": "milk"},
+        ])
+        importer = Importer(engine, batch_size=2, upsert=True, out=out).run([
+            {"foodid": 1, "name": "egg, boiled", "calories": 155},
+            {"foodid": 3, "name": "bread"},
+            {"name": "butter"},
+        ])
+        assert (importer.inserted, importer.updated) == (2, 1)
+        rows = foods(engine)
+        assert [(row["foodid"], row["foodname"]) for row in rows] == [
+            (1, "egg, boiled"), (2, "milk"), (3, "bread"), (4, "butter")
+        ]
+        assert rows[0]["calories"] == 155
+
+    def test_repeated_ids_are_skipped(self):
+        engine = create_engine("sqlite://")
+        SqlAlchemyBackend(engine).init()
+        out = io.StringIO()
+        importer = Importer(engine, batch_size=3, out=out).run([
+            {"foodid": 1, "name": "egg"},
+            {"foodid": 2, "name": "milk"},
+            {"foodid": 1, "name": "egg, boiled"},
+            {"foodid": 2, "name": "milk, skim"},
+            {"foodid": 3, "name": "bread"},
+        ])
+        assert (importer.inserted, importer.duplicates) == (3, 2)
+        assert "skipping record 3: foodid 1 repeats" in out.getvalue()
+        assert "skipping record 4: foodid 2 already exists" in out.getvalue()
+        assert [row["foodname"] for row in foods(engine)] == [
+            "egg", "milk", "bread"]
+
+        importer = Importer(engine, upsert=True, out=out).run([
+            {"foodid": 3, "name": "bread, white"},
+            {"foodid": 3, "name": "bread, rye"},
+            {"foodid": 4, "name": "jam"},
+            {"foodid": 4, "name": "jam, apricot"},
+        ])
+        assert (importer.inserted, importer.updated) == (1, 1)
+        assert [row["foodname"] for row in foods(engine)] == [
+            "egg", "milk", "bread, rye", "jam, apricot"]
@@ -0,0 +1,124 @@
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+import webtest
+
+from idiet.tracking.core import create_app
+from idiet.tracking.metrics import Counter, Histogram, Metrics, timed
+from tests.conftest import auth_headers
+
+
+USER = {"username": "user@example.com", "password": "password"}
+
+
+def metrics_app(**metrics):
+    config = {"metrics": dict({"enabled": True}, **metrics)}
+    return webtest.TestApp(create_app(config=config, secret_key="key"))
+
+
+class TestHistogram:
+
+    def test_buckets_are_cumulative(self):
+        histogram = Histogram("latency", "help", ("endpoint",),
+                              buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value, "a")
+
+        samples = {
+            (name, tuple(labels)): value
+            for name, labels, value in histogram.samples()
+        }
+        endpoint = ("endpoint", "a")
+        assert samples[("latency_bucket", (endpoint, ("le", "0.1")))] == 2
+        assert samples[("latency_bucket", (endpoint, ("le", "1.0")))] == 3
+        assert samples[("latency_bucket", (endpoint, ("le", "+Inf")))] == 4
+        assert samples[("latency_count", (endpoint,))] == 4
+        assert samples[("latency_sum", (endpoint,))] == 2.65
+        assert histogram.count("a") == 4
+
+    def test_counter(self):
+        counter = Counter("queries", "help", ("endpoint",))
+        counter.inc(1, "a")
+        counter.inc(2, "a")
+        assert counter.value("a") == 3
+        assert counter.value("b") == 0
+
+
+class TestMetrics:
+
+    def test_disabled(self):
+        app = webtest.TestApp(create_app(secret_key="key"))
+        response = app.get("/api/hc")
+        assert "Server-Timing" not in response.headers
+        app.get("/metrics", status=404)
+
+    def test_timed_outside_a_request(self):
+        with timed("anything"):
+            pass
+
+    def test_server_timing(self):
+        app = metrics_app()
+        app.post_json("/api/register", USER)
+        response = app.post_json("/api/login", USER)
+
+        timing = response.headers["Server-Timing"]
+        sections = dict(
+            entry.split(";", 1)[0:2] for entry in timing.split(", "))
+        assert set(sections) == {"db", "password_hash", "total"}
+        assert 'desc="2 queries"' in timing
+
+    def test_jwt_decode_is_timed(self):
+        app = metrics_app()
+        headers = auth_headers(app, **USER)
+
+        response = app.get("/api/user/profile", headers=headers)
+        assert "jwt_decode;dur=" in response.headers["Server-Timing"]
+        # cached now, nothing left to decode
+        response = app.get("/api/user/profile", headers=headers)
+        assert "jwt_decode" not in response.headers["Server-Timing"]
+
+    def test_export(self):
+        app = metrics_app(path="/internal/metrics")
+        app.post_json("/api/register", USER)
+        app.post_json("/api/login", USER)
+        app.get("/api/hc")
+
+        response = app.get("/internal/metrics")
+        assert response.content_type == "text/plain"
+        text = response.text
+        assert "# TYPE idiet_request_duration_seconds histogram" in text
+        assert ('idiet_request_duration_seconds_count{endpoint="api.hc",'
+                'method="GET",status="200"} 1') in text
+        assert ('idiet_db_queries_total{endpoint="api.login_api"} 2'
+                in text)
+        assert ('idiet_section_duration_seconds_count'
+                '{section="password_hash"} 2') in text
+
+    def test_failed_queries_leave_nothing_behind(self):
+        metrics = Metrics()
+        engine = create_engine("sqlite://")
+        metrics.instrument_engine(engine)
+        with engine.connect() as connection:
+            info = dict(connection.info)
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    connection.execute("SELECT * FROM missing")
+            connection.execute("SELECT 1")
+            assert connection.info == info
+        assert metrics.queries.value("none") == 1
+        assert 0 <= metrics.query_seconds.value("none") < 1
+
+    def test_server_timing_can_be_turned_off(self):
+        app = metrics_app(**{"server-timing": False})
+        assert "Server-Timing" not in app.get("/api/hc").headers
+
+
+def test_disabled_overhead():
+    start = time.perf_counter()
+    for _ in range(10000):
+        with timed("section"):
+            pass
+    per_call = (time.perf_counter() - start) / 10000
+    assert per_call < 5e-6
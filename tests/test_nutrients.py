@@ -0,0 +1,73 @@
+from hypothesis import strategies as st, given
+
+from idiet.tracking.nutrients import NutrientStore
+from tests.conftest import FOODS, food
+
+
+def names(results):
+    return [record["name"] for _, record in results]
+
+
+class TestNutrientStore:
+
+    def test_group_and_ranges(self):
+        store = NutrientStore(FOODS)
+        results = store.query(group="Poultry Products",
+                              ranges={"protein": (20, None),
+                                      "calories": (None, 300)})
+        assert names(results) == ["chicken breast",
+                                  "chicken thigh, roasted"]
+
+    def test_missing_values_never_match(self):
+        store = NutrientStore(FOODS)
+        results = store.query(ranges={"calories": (0, None)})
+        assert "turkey" not in names(results)
+
+    def test_sort_by_ratio(self):
+        store = NutrientStore(FOODS)
+        results = store.query(sort="protein_per_calorie", max_results=3)
+        assert names(results) == [
+            "chicken breast", "chicken thigh, roasted", "egg"]
+        results = store.query(sort="protein_per_calorie", descending=False)
+        # foods without calories have no ratio and sort last either way
+        assert names(results)[0] == "crème brûlée"
+        assert names(results)[-1] == "turkey"
+
+    def test_unknown_group(self):
+        assert NutrientStore(FOODS).query(group="Beverages") == []
+        assert NutrientStore().query(sort="protein") == []
+
+    @given(
+        proteins=st.lists(st.integers(0, 5), min_size=1, max_size=50),
+        k=st.integers(0, 60)
+    )
+    def test_top_k_matches_full_sort(self, proteins, k):
+        foods = [(i, food(str(i), protein=p)) for i, p in enumerate(proteins)]
+        store = NutrientStore(foods)
+        expected = sorted(foods, key=lambda f: (-f[1]["protein_in_grams"],
+                                                f[0]))[:k]
+        results = store.query(sort="protein", max_results=k)
+        assert [foodid for foodid, _ in results] == [i for i, _ in expected]
+
+    @given(
+        proteins=st.lists(st.none() | st.integers(0, 5), max_size=40),
+        page_size=st.integers(1, 10),
+        sort=st.sampled_from([None, "protein"]),
+        descending=st.booleans()
+    )
+    def test_pages_follow_each_other(self, proteins, page_size, sort,
+                                     descending):
+        foods = [(i, food(str(i), protein=p)) for i, p in enumerate(proteins)]
+        store = NutrientStore(foods)
+        expected = store.query(sort=sort, descending=descending,
+                               max_results=len(foods))
+        results = []
+        after = None
+        while True:
+            page = store.query_page(sort=sort, descending=descending,
+                                    max_results=page_size, after=after)
+            if not page:
+                break
+            results.extend((foodid, record) for _, foodid, record in page)
+            after = page[-1][0]
+        assert results == expected
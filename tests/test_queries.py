@@ -0,0 +1,98 @@
+"""
+number of sql statements per request on the hot paths
+"""
+import webtest
+
+from idiet.tracking.core import create_app
+
+from tests.conftest import QueryCounter, auth_headers
+
+
+USER = {"username": "user@example.com", "password": "password"}
+
+
+def app_and_counter():
+    app = create_app(secret_key="MY_SECRET_KEY")
+    return webtest.TestApp(app), QueryCounter(app.backend.engine)
+
+
+class TestLoginQueries:
+
+    def test_login_is_a_select_and_an_insert(self):
+        app, counter = app_and_counter()
+        app.post_json("/api/register", USER)
+
+        with counter:
+            response = app.post_json("/api/login", USER)
+        assert response.status_code == 202
+        # the credentials, then the id of the issued token
+        assert counter.count("SELECT") == 1
+        assert counter.count("INSERT") == 1
+        assert len(counter.statements) == 2
+
+    def test_failed_login_is_a_single_select(self):
+        app, counter = app_and_counter()
+        app.post_json("/api/register", USER)
+
+        with counter:
+            response = app.post_json(
+                "/api/login", dict(USER, password="wrong"), status=401)
+        assert response.status_code == 401
+        assert len(counter.statements) == 1
+
+    def test_unknown_user_login_is_a_single_select(self):
+        app, counter = app_and_counter()
+
+        with counter:
+            app.post_json("/api/login", USER, status=403)
+        assert len(counter.statements) == 1
+
+    def test_register_does_not_reload_the_user(self):
+        app, counter = app_and_counter()
+
+        with counter:
+            response = app.post_json("/api/register", USER)
+        assert response.status_code == 201
+        # the name check, then the user and profile inserts
+        assert counter.count("SELECT") == 1
+        assert counter.count("INSERT") == 2
+
+    def test_register_existing_user_is_a_single_select(self):
+        app, counter = app_and_counter()
+        app.post_json("/api/register", USER)
+
+        with counter:
+            response = app.post_json("/api/register", USER)
+        assert response.status_code == 302
+        assert len(counter.statements) == 1
+
+
+class TestAuthQueries:
+
+    def test_cached_token_needs_no_query(self):
+        app, counter = app_and_counter()
+        headers = auth_headers(app, **USER)
+        app.get("/api/user/meals", headers=headers)
+
+        with counter:
+            app.get("/api/user/meals", headers=headers)
+        # only the meals, revocation is checked in memory
+        assert len(counter.statements) == 1
+
+
+class TestProfileQueries:
+
+    def test_update_is_a_single_update(self):
+        app, counter = app_and_counter()
+        headers = auth_headers(app, **USER)
+        app.get("/api/user/profile", headers=headers)
+
+        with counter:
+            app.post_json("/api/user/profile",
+                          {"weight_in_kg": 70, "version": 1},
+                          headers=headers)
+        # the token is verified from the cache
+        assert counter.statements[0].lstrip().startswith("UPDATE")
+        assert "weight_in_kg" in counter.statements[0]
+        assert "name" not in counter.statements[0]
+        assert len(counter.statements) == 1
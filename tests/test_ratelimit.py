@@ -0,0 +1,141 @@
+import pytest
+import webtest
+
+from idiet.tracking.core import create_app
+from idiet.tracking.ratelimit import AdmissionControl, Limit, MemoryStore
+from idiet.tracking.ratelimit import RateLimiter, SqliteStore
+from tests.conftest import Clock, QueryCounter
+
+
+class CountingStore(MemoryStore):
+
+    def __init__(self):
+        super().__init__()
+        self.takes = 0
+
+    def take(self, key, limit, now):
+        self.takes += 1
+        return super().take(key, limit, now)
+
+
+class TestLimit:
+
+    def test_parse(self):
+        limit = Limit.parse("30/minute")
+        assert (limit.rate, limit.burst) == (0.5, 30)
+        for text in ("30", "30/fortnight", "many/minute", None, "0/second"):
+            with pytest.raises(ValueError):
+                Limit.parse(text)
+
+
+class TestRateLimiter:
+
+    def test_burst_then_refill(self):
+        clock = Clock()
+        limiter = RateLimiter(clock=clock)
+        limit = Limit(rate=1.0, burst=3)
+        assert [limiter.acquire("a", limit) for _ in range(3)] == [0, 0, 0]
+        assert limiter.acquire("a", limit) == pytest.approx(1.0)
+        assert limiter.acquire("b", limit) == 0
+        clock.now += 0.5
+        assert limiter.acquire("a", limit) == pytest.approx(0.5)
+        clock.now += 0.5
+        assert limiter.acquire("a", limit) == 0
+
+    def test_refusals_skip_the_store(self):
+        clock = Clock()
+        store = CountingStore()
+        limiter = RateLimiter(store, clock=clock)
+        limit = Limit(rate=1.0, burst=2)
+        for _ in range(10):
+            limiter.acquire("a", limit)
+        assert store.takes == 2
+
+    def test_processes_share_a_sqlite_store(self, tmp_path):
+        clock = Clock()
+        path = str(tmp_path / "ratelimit.db")
+        first = RateLimiter(SqliteStore(path), clock=clock)
+        second = RateLimiter(SqliteStore(path), clock=clock)
+        limit = Limit(rate=1.0, burst=4)
+        assert first.acquire("a", limit) == 0
+        assert first.acquire("a", limit) == 0
+        assert second.acquire("a", limit) == 0
+        assert second.acquire("a", limit) == 0
+        assert first.acquire("a", limit) > 0
+        assert second.acquire("a", limit) > 0
+
+    def test_memory_store_drops_full_buckets(self):
+        store = MemoryStore(max_keys=2)
+        limit = Limit(rate=1.0, burst=1)
+        store.take("a", limit, 0.0)
+        store.take("b", limit, 0.0)
+        store.take("c", limit, 5.0)
+        assert store.take("a", limit, 5.0) == (True, 0)
+        assert store.take("c", limit, 5.0) == (False, 0)
+
+
+class TestAdmissionControl:
+
+    def test_expensive_requests_are_shed_first(self):
+        admission = AdmissionControl(max_concurrent=4, expensive_share=0.5)
+        assert admission.admit(expensive=True)
+        assert admission.admit(expensive=False)
+        assert not admission.admit(expensive=True)
+        assert admission.admit(expensive=False)
+        assert admission.admit(expensive=False)
+        assert not admission.admit(expensive=False)
+        admission.release()
+        assert admission.admit(expensive=False)
+        assert admission.rejected == 2
+
+    def test_busy_server_returns_503(self):
+        config = {"admission": {"max-concurrent": 2,
+                                "expensive-share": 0.5}}
+        flask_app = create_app(config=config, backend="memory",
+                               secret_key="key")
+        app = webtest.TestApp(flask_app)
+        credentials = {"username": "user@example.com", "password": "pw"}
+        app.post_json("/api/register", credentials, status=201)
+        # another request is running on the server meanwhile
+        assert flask_app.admission.admit(expensive=False)
+        response = app.post_json("/api/login", credentials, status=503)
+        assert response.headers["Retry-After"] == "1"
+        app.get("/api/hc", status=200)
+        flask_app.admission.release()
+        app.post_json("/api/login", credentials, status=202)
+        assert flask_app.admission.in_flight == 0
+
+
+def test_login_flood_gets_429_before_any_work():
+    config = {"rate-limit": {"per-ip": "5/minute",
+                             "per-username": "3/minute"}}
+    flask_app = create_app(config=config, secret_key="key")
+    app = webtest.TestApp(flask_app)
+    credentials = {"username": "user@example.com", "password": "pw"}
+    app.post_json("/api/register", credentials, status=201)
+    for _ in range(3):
+        app.post_json("/api/login", dict(credentials, password="wrong"),
+                      status=401)
+
+    with QueryCounter(flask_app.backend.engine) as counter:
+        response = app.post_json("/api/login", credentials, status=429)
+    assert int(response.headers["Retry-After"]) >= 1
+    assert counter.count("SELECT") == 0
+
+    # the address is out of attempts too, whatever the username
+    other = {"username": "other@example.com", "password": "pw"}
+    app.post_json("/api/login", other, status=429)
+    app.post_json("/api/register", other, status=429)
+
+
+def test_limits_are_per_client_address():
+    config = {"rate-limit": {"per-ip": "1/minute"}}
+    app = webtest.TestApp(create_app(config=config, backend="memory",
+                                     secret_key="key"))
+    credentials = {"username": "user@example.com", "password": "pw"}
+    app.post_json("/api/register", credentials, status=201,
+                  extra_environ={"REMOTE_ADDR": "10.0.0.1"})
+    app.post_json("/api/login", credentials, status=429,
+                  extra_environ={"REMOTE_ADDR": "10.0.0.1"})
+    app.post_json("/api/login", credentials, status=202,
+                  extra_environ={"REMOTE_ADDR": "10.0.0.2"})
@@ -0,0 +1,102 @@
+from idiet.tracking.revocation import RevocationList
+from tests.conftest import Clock
+
+
+class Store:
+    """
+    revoked tokens as ``{jti: (revoked_at, expires_at)}``
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.tokens = {}
+        self.loads = []
+
+    def revoke(self, jti, expires_at):
+        self.tokens[jti] = (self.clock(), expires_at)
+
+    def load(self, since):
+        self.loads.append(since)
+        return [
+            (jti, expires_at)
+            for jti, (revoked_at, expires_at) in self.tokens.items()
+            if since is None or revoked_at >= since
+        ]
+
+    def compact(self, now):
+        self.tokens = {
+            jti: token for jti, token in self.tokens.items()
+            if token[1] > now
+        }
+
+
+def revocation_list(clock, store, **kwargs):
+    return RevocationList(store.load, store.compact, clock=clock, **kwargs)
+
+
+class TestRevocationList:
+
+    def test_first_check_loads_everything(self):
+        clock = Clock()
+        store = Store(clock)
+        store.revoke("a", 2000)
+        revoked = revocation_list(clock, store)
+
+        assert revoked.is_revoked("a")
+        assert not revoked.is_revoked("b")
+        assert store.loads == [None]
+
+    def test_syncs_once_per_interval(self):
+        clock = Clock()
+        store = Store(clock)
+        revoked = revocation_list(clock, store, sync_interval=5, overlap=2)
+        assert not revoked.is_revoked("a")
+
+        store.revoke("a", 2000)
+        clock.now += 1
+        assert not revoked.is_revoked("a")
+        assert len(store.loads) == 1
+
+        clock.now += 5
+        assert revoked.is_revoked("a")
+        # the second sync reaches back before the first one
+        assert store.loads == [None, 998.0]
+
+    def test_add_is_immediate(self):
+        clock = Clock()
+        store = Store(clock)
+        revoked = revocation_list(clock, store, sync_interval=60)
+        revoked.is_revoked("a")
+
+        revoked.add("a", 2000)
+        assert revoked.is_revoked("a")
+        assert len(store.loads) == 1
+
+    def test_expired_tokens_are_not_loaded(self):
+        clock = Clock()
+        store = Store(clock)
+        store.revoke("old", 999)
+        revoked = revocation_list(clock, store)
+
+        assert not revoked.is_revoked("old")
+        assert len(revoked) == 0
+
+    def test_compaction(self):
+        clock = Clock()
+        store = Store(clock)
+        store.revoke("a", 1010)
+        store.revoke("b", 5000)
+        revoked = revocation_list(clock, store, sync_interval=1,
+                                  compact_interval=60)
+        revoked.sync()
+        assert len(revoked) == 2
+
+        clock.now += 30
+        revoked.sync()
+        assert len(revoked) == 2
+
+        clock.now += 30
+        revoked.sync()
+        assert "a" not in revoked
+        assert "b" in revoked
+        assert set(store.tokens) == {"b"}
@@ -0,0 +1,96 @@
+from hypothesis import strategies as st, given
+
+from idiet.tracking.search import FoodIndex, normalize, similarity
+
+
+def index(*names):
+    return FoodIndex((i, {"name": name}) for i, name in enumerate(names))
+
+
+class TestFoodIndex:
+
+    def test_exact_match_ranks_first(self):
+        foods = index("chicken breast, roasted", "chicken", "steak")
+        results = foods.search("chicken")
+        assert [foodid for _, foodid, _ in results] == [1, 0]
+        assert results[0][0] == 1.0
+
+    def test_typo_finds_closest_word(self):
+        foods = index("chicken", "chickpeas", "steak")
+        results = foods.search("chiken")
+        assert results[0][2]["name"] == "chicken"
+
+    def test_every_query_word_narrows_results(self):
+        foods = index("beef, roasted", "beef, raw", "pork, roasted")
+        results = foods.search("roasted beef")
+        assert results[0][2]["name"] == "beef, roasted"
+
+    def test_query_word_order_breaks_ties(self):
+        foods = FoodIndex(
+            [(i, {"name": "breast chicken"}) for i in range(1, 11)]
+            + [(11, {"name": "chicken breast"})])
+        results = foods.search("chicken breast", max_results=3)
+        assert [foodid for _, foodid, _ in results] == [11, 1, 2]
+
+    def test_max_results(self):
+        foods = index(*(f"apple {i}" for i in range(20)))
+        assert len(foods.search("apple", max_results=5)) == 5
+        assert foods.search("apple", max_results=0) == []
+
+    def test_no_match(self):
+        foods = index("chicken", "steak")
+        assert foods.search("zzzz") == []
+        assert foods.search("") == []
+        assert FoodIndex().search("chicken") == []
+
+    def test_pages_follow_each_other(self):
+        foods = index(*(
+            f"{word} {i}" if i % 3 else f"{word}, roasted {i}"
+            for i in range(30) for word in ("chicken", "chickpeas", "beef")
+        ))
+        expected = foods.search_page("chiken", max_results=100)
+        pages = []
+        after = None
+        while True:
+            page = foods.search_page("chiken", max_results=7, after=after)
+            if not page:
+                break
+            pages.extend(page)
+            after = page[-1][0]
+        assert [foodid for _, foodid, _ in pages] == [
+            foodid for _, foodid, _ in expected]
+
+    def test_pages_include_names_in_query_order(self):
+        foods = FoodIndex(
+            [(i, {"name": "breast chicken"}) for i in range(1, 11)]
+            + [(11, {"name": "chicken breast"}),
+               (12, {"name": "chicken breast, roasted"})])
+        pages = []
+        after = None
+        while True:
+            page = foods.search_page("chicken breast", max_results=3,
+                                     after=after)
+            if not page:
+                break
+            pages.append([foodid for _, foodid, _ in page])
+            after = page[-1][0]
+        assert pages == [[11, 1, 2], [3, 4, 5], [6, 7, 8], [9, 10, 12]]
+
+    def test_keys_survive_a_rebuild(self):
+        names = [f"apple {i}" for i in range(10)]
+        first = index(*names).search_page("apple", max_results=4)
+        # a food added in front shifts every position but not the ids
+        rebuilt = FoodIndex(
+            [(-1, {"name": "pear"})]
+            + [(i, {"name": name}) for i, name in enumerate(names)])
+        page = rebuilt.search_page("apple", max_results=4,
+                                   after=first[-1][0])
+        assert [foodid for _, foodid, _ in page] == [4, 5, 6, 7]
+
+    @given(name=st.text())
+    def test_normalize_is_idempotent(self, name):
+        assert normalize(normalize(name)) == normalize(name)
+
+    @given(word=st.text(min_size=1, alphabet="abcdefghijklmnopqrstuvwxyz"))
+    def test_similarity_with_itself(self, word):
+        assert similarity(word, word) == 1.0
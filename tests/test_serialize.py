@@ -0,0 +1,73 @@
+from datetime import date, datetime, timedelta, timezone
+import json
+
+import pytest
+from flask import jsonify
+
+from idiet.tracking import serialize
+from idiet.tracking.core import Tracking
+from idiet.tracking.serialize import isoformat, iter_json, stdlib_dumps
+from idiet.tracking.timestamp import parse
+
+
+ENCODERS = [stdlib_dumps]
+if serialize.orjson_dumps is not None:
+    ENCODERS.append(serialize.orjson_dumps)
+
+
+@pytest.mark.parametrize("dumps", ENCODERS)
+def test_encoders_agree(dumps):
+    data = {
+        "ts": datetime(2020, 5, 1, 12, 0, 0, 5000),
+        "day": date(2020, 5, 1),
+        "utc": datetime(2020, 5, 1, 12, tzinfo=timezone.utc),
+        "data": [{"name": "crème brûlée", "calories": 28.5, "group": None}],
+    }
+    assert dumps(data) == (
+        b'{"ts":"2020-05-01T12:00:00.005000Z","day":"2020-05-01",'
+        b'"utc":"2020-05-01T12:00:00Z","data":[{"name":"cr\xc3\xa8me '
+        b'br\xc3\xbbl\xc3\xa9e","calories":28.5,"group":null}]}'
+    )
+    with pytest.raises(TypeError):
+        dumps({"value": object()})
+
+
+@pytest.mark.skipif(serialize.orjson_dumps is None,
+                    reason="orjson isn't installed")
+@pytest.mark.parametrize("value", [0.1, 2.0, 28.5, 123456789.123, 1e16,
+                                   1e-7, 1.5e300, -2.5e-300])
+def test_encoders_agree_on_float_values(value):
+    # the text may differ, e.g. 1e+16 and 1e16, the value doesn't
+    data = {"value": value, "values": [value, None]}
+    assert json.loads(stdlib_dumps(data)) == \
+        json.loads(serialize.orjson_dumps(data)) == data
+
+
+def test_isoformat_round_trips():
+    value = datetime(2020, 5, 1, 12, 30)
+    assert parse(isoformat(value)) == value
+    offset = datetime(2020, 5, 1, 14, 30,
+                      tzinfo=timezone(timedelta(hours=2)))
+    assert isoformat(offset) == "2020-05-01T14:30:00+02:00"
+    assert parse(isoformat(offset)) == value
+
+
+@pytest.mark.parametrize("n_items", [0, 1, 5, 12])
+def test_iter_json(n_items):
+    data = {"data": [{"id": i} for i in range(n_items)], "status": "ok"}
+    chunks = list(iter_json(data, "data", chunk_size=5))
+    assert len(chunks) == 2 + -(-n_items // 5)
+    assert json.loads(b"".join(chunks)) == data
+    assert json.loads(b"".join(iter_json({"data": []}, "data"))) == {
+        "data": []}
+
+
+def test_jsonify_uses_the_app_provider():
+    app = Tracking()
+    with app.app_context():
+        response = jsonify(ts=datetime(2020, 5, 1, 12), day=date(2020, 5, 1))
+    assert response.mimetype == "application/json"
+    assert response.get_data() == (
+        b'{"ts":"2020-05-01T12:00:00Z","day":"2020-05-01"}')
+    assert app.json.loads(b'{"a": [1, 2.5, null]}') == {"a": [1, 2.5, None]}
+    assert json.loads(app.json.dumps({"a": 1}, indent=2)) == {"a": 1}
@@ -0,0 +1,104 @@
+from datetime import date, datetime
+
+import pytest
+
+from idiet.tracking.timeseries import MetricDay, day_range, day_samples
+from idiet.tracking.timeseries import series
+
+
+def chunk(day, samples):
+    return MetricDay(day).merged(samples)
+
+
+class TestMetricDay:
+
+    def test_merge_keeps_samples_sorted(self):
+        first = chunk(date(2020, 5, 1), [(7200.0, 2.0), (60.0, 1.0)])
+        second = first.merged([(3600.0, 4.0)])
+        assert list(second.times) == [60, 3600, 7200]
+        assert list(second.values) == [1, 4, 2]
+        assert (second.count, second.total) == (3, 7)
+        assert (second.minimum, second.maximum) == (1, 4)
+        # merging builds a new chunk
+        assert first.count == 2
+
+    def test_hour_buckets(self):
+        day = chunk(date(2020, 5, 1), [(60.0, 1.0), (120.0, 3.0),
+                                       (86399.0, 5.0)])
+        assert list(day.hours[:4]) == [2, 4, 1, 3]
+        assert list(day.hours[-4:]) == [1, 5, 5, 5]
+        assert sum(day.hours[4:-4]) == 0
+
+    def test_bytes_round_trip(self):
+        day = chunk(date(2020, 5, 1), [(60.0, 1.5), (120.0, -3.0)])
+        times, values, hours = day.to_bytes()
+        assert len(times) == len(values) == 16
+        loaded = MetricDay.from_bytes(
+            day.day, times, values, hours, day.count, day.total,
+            day.minimum, day.maximum)
+        assert list(loaded.values) == [1.5, -3.0]
+        assert list(loaded.hours) == list(day.hours)
+        summary = MetricDay.from_bytes(day.day, count=2, total=-1.5)
+        assert list(summary.values) == []
+
+
+def test_day_samples():
+    days = day_samples([
+        ("steps", datetime(2020, 5, 1, 0, 1), 10),
+        ("steps", datetime(2020, 5, 2, 12), 20),
+        ("weight_in_kg", datetime(2020, 5, 1, 23, 59, 59, 500000), 70),
+    ])
+    assert days == {
+        ("steps", date(2020, 5, 1)): [(60.0, 10)],
+        ("steps", date(2020, 5, 2)): [(43200.0, 20)],
+        ("weight_in_kg", date(2020, 5, 1)): [(86399.5, 70)],
+    }
+
+
+def test_day_range():
+    start, end = datetime(2020, 5, 6, 12), datetime(2020, 5, 8)
+    assert day_range(start, end, "day") == (date(2020, 5, 6),
+                                            date(2020, 5, 8))
+    assert day_range(start, datetime(2020, 5, 8, 1), "raw") \
+        == (date(2020, 5, 6), date(2020, 5, 9))
+    # the monday of the week
+    assert day_range(start, end, "week")[0] == date(2020, 5, 4)
+
+
+class TestSeries:
+
+    chunks = [
+        chunk(date(2020, 5, 1), [(3600.0, 1.0), (3700.0, 3.0),
+                                 (7200.0, 5.0)]),
+        chunk(date(2020, 5, 4), [(0.0, 10.0)]),
+    ]
+
+    def test_raw_is_clipped_to_the_range(self):
+        points = series(self.chunks, datetime(2020, 5, 1, 1, 1),
+                        datetime(2020, 5, 4), "raw")
+        assert [point["value"] for point in points] == [3, 5]
+
+    def test_hours(self):
+        points = series(self.chunks, datetime(2020, 5, 1, 1, 30),
+                        datetime(2020, 5, 5), "hour")
+        assert [(p["start"], p["avg"]) for p in points] == [
+            (datetime(2020, 5, 1, 1), 2),
+            (datetime(2020, 5, 1, 2), 5),
+            (datetime(2020, 5, 4), 10),
+        ]
+
+    def test_days_and_weeks(self):
+        start, end = datetime(2020, 5, 1), datetime(2020, 5, 5)
+        days = series(self.chunks, start, end, "day")
+        assert [(d["start"].day, d["min"], d["max"]) for d in days] \
+            == [(1, 1, 5), (4, 10, 10)]
+        weeks = series(self.chunks, start, end, "week")
+        assert [(w["start"], w["count"], w["avg"]) for w in weeks] == [
+            (datetime(2020, 4, 27), 3, 3),
+            (datetime(2020, 5, 4), 1, 10),
+        ]
+
+    def test_unknown_resolution(self):
+        with pytest.raises(ValueError):
+            series(self.chunks, datetime(2020, 5, 1), datetime(2020, 5, 2),
+                   "month")
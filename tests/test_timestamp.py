@@ -0,0 +1,41 @@
+import datetime
+
+from hypothesis import strategies as st, given
+import pytest
+
+from idiet.tracking.timestamp import parse, to_unix, from_unix
+
+
+class TestParse:
+
+    @given(ts=st.datetimes(min_value=datetime.datetime(1900, 1, 1)))
+    def test_roundtrip(self, ts):
+        assert parse(ts.isoformat()) == ts
+        assert parse(str(ts)) == ts
+
+    def test_converts_to_utc(self):
+        expected = datetime.datetime(2020, 5, 1, 8, 0)
+        assert parse("2020-05-01T10:00:00+02:00") == expected
+        assert parse("2020-05-01T08:00:00Z") == expected
+        assert parse("2020-05-01T08:00") == expected
+
+    def test_date_only(self):
+        assert parse("2020-05-01") == datetime.datetime(2020, 5, 1)
+
+    @pytest.mark.parametrize("value", ["", "yesterday", "2020-5-1", None, 1])
+    def test_invalid(self, value):
+        with pytest.raises(ValueError):
+            parse(value)
+
+
+class TestUnix:
+
+    def test_epoch(self):
+        assert to_unix(datetime.datetime(1970, 1, 1)) == 0
+        assert from_unix(0) == datetime.datetime(1970, 1, 1)
+
+    @given(ts=st.datetimes(min_value=datetime.datetime(1970, 1, 1),
+                           max_value=datetime.datetime(2100, 1, 1)))
+    def test_roundtrip(self, ts):
+        ts = ts.replace(microsecond=0)
+        assert from_unix(to_unix(ts)) == ts